@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+
+import metrics
+import supabase_db
+from repository import DEFAULT_PAGE_SIZE
+from supabase_backend import SupabaseRepository, AsyncSupabaseRepository
+
+# Async read layer for pages that need several independent queries. The
+# coroutines run on one background event loop, so Streamlit script threads and
+# main.py can call the sync helpers at the bottom (gather, load_profile, ...)
+# and wait for the slowest query rather than the sum of all of them.
+#
+# With the Supabase backend reads go through the httpx-based async client;
+# SQLite and in-memory repositories are run on worker threads.
+ASYNC_TIMEOUT_SECONDS = float(os.getenv("REEDZ_ASYNC_TIMEOUT_SECONDS", "30"))
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-db", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run(coro, timeout=ASYNC_TIMEOUT_SECONDS):
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+
+class ThreadedAsyncRepository:
+    # Awaitable view of a sync repository; each call runs on a worker thread
+    def __init__(self, repository):
+        self.repository = repository
+
+    def __getattr__(self, name):
+        method = getattr(self.repository, name)
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return call
+
+
+# One async repository per sync repository, rebuilt after set_repository()
+_async_repository = None
+_async_repository_source = None
+_async_repository_lock = None
+
+async def get_async_repository():
+    global _async_repository, _async_repository_source, _async_repository_lock
+    repository = supabase_db.get_repository()
+    if _async_repository_source is repository:
+        return _async_repository
+    if _async_repository_lock is None:
+        _async_repository_lock = asyncio.Lock()
+    async with _async_repository_lock:
+        if _async_repository_source is not repository:
+            if isinstance(repository, SupabaseRepository):
+                _async_repository = await AsyncSupabaseRepository.from_env()
+            else:
+                _async_repository = ThreadedAsyncRepository(repository)
+            _async_repository_source = repository
+    return _async_repository
+
+async def get_user_by_id(user_id):
+    # Goes through supabase_db's user cache; only a miss reaches the database
+    return await asyncio.to_thread(supabase_db.get_user_by_id, user_id)
+
+async def list_users_page(after=None, limit=DEFAULT_PAGE_SIZE):
+    return await (await get_async_repository()).list_users_page(after=after, limit=limit)
+
+async def get_leaderboard_page(after=None, limit=DEFAULT_PAGE_SIZE):
+    return await (await get_async_repository()).get_leaderboard_page(after=after, limit=limit)
+
+async def get_rank(user_id, neighbours=2):
+    return await (await get_async_repository()).get_rank(user_id, neighbours=neighbours)
+
+async def get_reedz_history(user_id, limit=50):
+    return await (await get_async_repository()).get_reedz_history(user_id, limit=limit)
+
+async def get_bets_page(state, after=None, limit=DEFAULT_PAGE_SIZE):
+    return await (await get_async_repository()).get_bets_page(state, after=after, limit=limit)
+
+async def get_bets_grouped():
+    return await (await get_async_repository()).get_bets_grouped()
+
+# Sync facade
+def gather(*coros, timeout=ASYNC_TIMEOUT_SECONDS):
+    # Runs the coroutines concurrently and returns their results in order
+    async def _gather():
+        return await asyncio.gather(*coros)
+    return run(_gather(), timeout)
+
+def load_profile(user_id, neighbours=2, history_limit=50):
+    user, standing, history = gather(
+        get_user_by_id(user_id),
+        get_rank(user_id, neighbours),
+        get_reedz_history(user_id, history_limit),
+    )
+    return {"user": user, "standing": standing, "history": history}
+
+def load_bets_by_state(states, limit=DEFAULT_PAGE_SIZE):
+    # First page of each state, one concurrent query per state
+    return dict(zip(states, gather(*(get_bets_page(state, limit=limit) for state in states))))
+
+metrics.instrument_module(globals(), exclude=("run", "gather", "get_async_repository"), prefix="async_db.")
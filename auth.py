@@ -1,18 +1,145 @@
+import dataclasses
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
+import rate_limit
 import supabase_db
 from models import User
 
+# bcrypt releases the GIL, so hashing on a thread pool runs one hash per core
+# instead of serializing on the Streamlit script thread. At most
+# BCRYPT_MAX_PENDING hashes may be queued or running; callers beyond that wait
+# up to BCRYPT_QUEUE_TIMEOUT seconds for a slot and are then turned away.
+BCRYPT_ROUNDS = int(os.getenv("REEDZ_BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("REEDZ_BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+BCRYPT_MAX_PENDING = int(os.getenv("REEDZ_BCRYPT_MAX_PENDING", str(BCRYPT_WORKERS * 8)))
+BCRYPT_QUEUE_TIMEOUT = float(os.getenv("REEDZ_BCRYPT_QUEUE_TIMEOUT", "10"))
+
+
+class AuthBusyError(Exception):
+    def __init__(self, message="The server is busy right now, please try again in a moment"):
+        super().__init__(message)
+
+
+class BcryptPool:
+    def __init__(self, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING, queue_timeout=BCRYPT_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_seconds = 0.0
+        self._work_seconds = 0.0
+
+    def run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._stats_lock:
+                self._rejected += 1
+            raise AuthBusyError()
+        with self._stats_lock:
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+        try:
+            return self._executor.submit(self._timed, time.perf_counter(), func, *args).result()
+        finally:
+            with self._stats_lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _timed(self, submitted, func, *args):
+        started = time.perf_counter()
+        with self._stats_lock:
+            self._running += 1
+            self._queue_seconds += started - submitted
+        try:
+            return func(*args)
+        finally:
+            with self._stats_lock:
+                self._running -= 1
+                self._completed += 1
+                self._work_seconds += time.perf_counter() - started
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "peak_pending": self._peak_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_queue_ms": self._queue_seconds / self._completed * 1000 if self._completed else 0.0,
+                "avg_work_ms": self._work_seconds / self._completed * 1000 if self._completed else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_bcrypt_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BcryptPool()
+    return _pool
+
+def bcrypt_stats():
+    return get_bcrypt_pool().stats()
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return get_bcrypt_pool().run(_hashpw, password, BCRYPT_ROUNDS)
 
 def check_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+    return get_bcrypt_pool().run(_checkpw, password, hashed)
+
+def hash_rounds(hashed: str) -> int:
+    # "$2b$12$<salt+digest>" -> 12
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+# Unknown usernames are checked against this hash so a failed login costs the
+# same bcrypt work whether or not the account exists. It is made on the first
+# unknown-user login rather than at import, so the CLI and scripts that never
+# log in do not pay for a full-cost hash.
+@functools.cache
+def _dummy_hash():
+    return hash_password("reedz-dummy-password")
 
-def authenticate(username: str, password: str):
+def authenticate(username: str, password: str, client=None):
+    # Raises rate_limit.RateLimitedError before any lookup or hashing once the
+    # username or client has used up its attempts
+    rate_limit.check_login(username, client)
     user = supabase_db.get_user_by_username(username)
-    if user and check_password(password, user.password):
-        return user
-    return None
+    if not user:
+        check_password(password, _dummy_hash())
+        return None
+    if not check_password(password, user.password):
+        return None
+    if hash_rounds(user.password) != BCRYPT_ROUNDS:
+        # Upgrade (or downgrade) the stored hash to the configured cost
+        user = dataclasses.replace(user, password=hash_password(password))
+        supabase_db.update_user_password(user.user_id, user.password)
+    return user
 
 def is_admin(user: User) -> bool:
     return user.role == 'Admin'
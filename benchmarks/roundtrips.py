@@ -0,0 +1,242 @@
+import argparse
+import builtins
+import contextlib
+import contextvars
+import io
+import os
+import sys
+import threading
+from collections import Counter
+
+os.environ.setdefault("REEDZ_BACKEND", "sqlite")
+os.environ.setdefault("REEDZ_SQLITE_PATH", ":memory:")
+os.environ.setdefault("REEDZ_AUTO_CLOSE", "0")
+os.environ.setdefault("REEDZ_EMAIL_WORKER", "0")
+os.environ.setdefault("REEDZ_DIGESTS", "0")
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import main as cli_app
+import scoring
+import supabase_backend
+import supabase_db
+from repository import Repository, create_repository
+from sqlite_backend import SqliteRepository
+from benchmarks.workload import WorkloadConfig, generate_workload
+
+# Usage (from the repository root):
+#   python -m benchmarks.roundtrips [--verbose] [--backend sqlite|supabase]
+# Renders every Streamlit panel (and every User Management action) with
+# AppTest, and runs the read-only CLI flows, and counts the requests the
+# backend actually sends per render: SQL statements on the SQLite connection,
+# or HTTP requests through supabase_backend.execute/execute_async. A paged
+# method that needs three requests counts three. Exits with status 1 when any
+# view goes over its budget, so an N+1 loop fails here instead of in
+# production; CI runs it on every push (.github/workflows/roundtrips.yml).
+# Every render starts cold: no st.cache_data entries and an empty user cache.
+#
+# The default backend is a fresh in-memory SQLite database. --backend supabase
+# seeds and measures the project in SUPABASE_URL, so only point it at a
+# scratch project.
+#
+# The workload is deliberately larger than one table page (TABLE_PAGE_SIZE)
+# and has many predictions per bet, so a per-row query blows the budget.
+
+# Requests allowed for one render of each sidebar page, as an admin
+PANEL_BUDGETS = {
+    "Create Bet": 1,
+    "Close Bet": 2,
+    "Resolve Bet": 2,
+    "User Management": 2,
+    "User Management / List users": 2,
+    "User Management / Promote/Demote": 2,
+    "User Management / Change Reedz": 2,
+    "User Management / Delete user": 2,
+    "Diagnostics": 1,
+    "My Profile": 3,
+    "Leaderboard": 2,
+    "All Bets": 2,
+    "Place Prediction": 2,
+    "View Predictions for a Bet": 3,
+}
+
+CLI_BUDGETS = {
+    "print_leaderboard": 1,
+    "print_bet_overview": 1,
+    "print_predictions_with_usernames": 1,
+}
+
+WORKLOAD = WorkloadConfig(users=150, bets=9, predictions_per_bet=80, seed=7)
+
+
+# The outermost repository method running in this context; asyncio tasks and
+# asyncio.to_thread copy it, so async_db requests are attributed too
+_current_method = contextvars.ContextVar("roundtrip_method", default=None)
+
+
+class RequestCounter:
+    # Counts backend requests, each under the outermost repository method that
+    # issued it (or "async_db" for the async Supabase client's own methods)
+
+    def __init__(self, repository):
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        for name in self.leaf_methods(repository):
+            setattr(repository, name, self._attribute(name, getattr(repository, name)))
+        if isinstance(repository, SqliteRepository):
+            repository.conn.set_trace_callback(lambda statement: self.record())
+        else:
+            self._hook_supabase()
+
+    @staticmethod
+    def leaf_methods(repository):
+        for name, base in vars(Repository).items():
+            if name.startswith("_") or name == "client_stats" or not callable(base):
+                continue
+            if getattr(type(repository), name) is not base:
+                yield name
+
+    def _attribute(self, name, method):
+        def attributed(*args, **kwargs):
+            if _current_method.get() is not None:
+                return method(*args, **kwargs)
+            token = _current_method.set(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                _current_method.reset(token)
+        return attributed
+
+    def _hook_supabase(self):
+        real_execute = supabase_backend.execute
+        real_execute_async = supabase_backend.execute_async
+        def execute(request, idempotent=True):
+            self.record()
+            return real_execute(request, idempotent)
+        async def execute_async(request, idempotent=True):
+            self.record()
+            return await real_execute_async(request, idempotent)
+        supabase_backend.execute = execute
+        supabase_backend.execute_async = execute_async
+
+    def record(self):
+        with self._lock:
+            self.calls[_current_method.get() or "async_db"] += 1
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+
+def seed(backend):
+    repository = create_repository(backend, **({"path": ":memory:"} if backend == "sqlite" else {}))
+    supabase_db.set_repository(repository)
+    workload = generate_workload(supabase_db, WORKLOAD)
+    # Leave three bets open, resolve three and close the rest
+    for bet_id, _, correct_answer in workload.bets[3:6]:
+        supabase_db.close_bet(bet_id)
+        supabase_db.resolve_bet(bet_id, correct_answer)
+        scoring.distribute_reedz_on_resolution(bet_id)
+    for bet_id, _, _ in workload.bets[6:]:
+        supabase_db.close_bet(bet_id)
+    return repository, workload
+
+def cold_start(repository, counter):
+    # set_repository empties the user cache and bumps the data version
+    st.cache_data.clear()
+    supabase_db.set_repository(repository)
+    counter.reset()
+
+def measure_panels(repository, workload, counter):
+    at = AppTest.from_file("streamlit_app.py", default_timeout=60)
+    at.session_state.user = supabase_db.get_user_by_id(workload.admin.user_id)
+    target = supabase_db.get_user_by_id(workload.user_ids[0]).username
+    at.run()
+    results = {}
+    for page in at.sidebar.radio[0].options:
+        at.sidebar.radio[0].set_value(page)
+        cold_start(repository, counter)
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception}")
+        results[page] = dict(counter.calls)
+        if page == "View Predictions for a Bet" and len(at.selectbox) and len(at.selectbox[0].options) > 1:
+            # Count the render with a bet selected, which adds the predictions table
+            at.selectbox[0].set_value(at.selectbox[0].options[1])
+            cold_start(repository, counter)
+            at.run()
+            results[page] = dict(counter.calls)
+        if page == "User Management":
+            # Every action, with a user picked
+            for action in at.radio[0].options:
+                at.radio[0].set_value(action)
+                at.run()
+                for text_input in at.text_input:
+                    if text_input.key and text_input.key.endswith("_username"):
+                        text_input.input(target)
+                cold_start(repository, counter)
+                at.run()
+                if at.exception:
+                    raise RuntimeError(f"{page} / {action} raised: {at.exception}")
+                results[f"{page} / {action}"] = dict(counter.calls)
+            at.radio[0].set_value(at.radio[0].options[0])
+    return results
+
+def measure_cli(repository, workload, counter):
+    bet_id, answer_type, _ = workload.bets[0]
+    flows = {
+        "print_leaderboard": cli_app.print_leaderboard,
+        "print_bet_overview": lambda: cli_app.print_bet_overview(supabase_db.get_bets_grouped()),
+        "print_predictions_with_usernames": lambda: cli_app.print_predictions_with_usernames(
+            supabase_db.get_prediction_batch(bet_id, answer_type, with_usernames=True)
+        ),
+    }
+    results = {}
+    real_input = builtins.input
+    builtins.input = lambda prompt="": "q"  # stop paged output after the first page
+    try:
+        for name, flow in flows.items():
+            cold_start(repository, counter)
+            with contextlib.redirect_stdout(io.StringIO()):
+                flow()
+            results[name] = dict(counter.calls)
+    finally:
+        builtins.input = real_input
+    return results
+
+def check(results, budgets, verbose):
+    failures = []
+    for name, calls in results.items():
+        total = sum(calls.values())
+        budget = budgets.get(name)
+        over = budget is None or total > budget
+        status = "NO BUDGET" if budget is None else ("OVER" if over else "ok")
+        print(f"{name:<40} {total:>4} / {budget if budget is not None else '-':<4} {status}")
+        if verbose or over:
+            for method, count in sorted(calls.items(), key=lambda kv: -kv[1]):
+                print(f"    {method:<36} {count}")
+        if over:
+            failures.append(name)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check data-layer round trips per Streamlit panel and CLI flow.")
+    parser.add_argument("--verbose", action="store_true", help="Show per-method counts for every view")
+    parser.add_argument("--backend", choices=["sqlite", "supabase"], default="sqlite")
+    args = parser.parse_args(argv)
+
+    repository, workload = seed(args.backend)
+    counter = RequestCounter(repository)
+    print("Streamlit panels")
+    failures = check(measure_panels(repository, workload, counter), PANEL_BUDGETS, args.verbose)
+    print("CLI flows")
+    failures += check(measure_cli(repository, workload, counter), CLI_BUDGETS, args.verbose)
+    if failures:
+        print(f"Round-trip budget exceeded: {', '.join(failures)}")
+        return 1
+    print("All views within their round-trip budgets.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import argparse
+import dataclasses
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import scoring
+import supabase_db
+from repository import create_repository
+from benchmarks.workload import WorkloadConfig, generate_workload
+
+# Usage (from the repository root):
+#   python -m benchmarks.run --backend memory --users 5000 --predictions-per-bet 2000
+# Results are written as JSON so runs on different commits can be diffed.
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def summarize(name, durations, **extra):
+    durations = sorted(durations)
+    total = sum(durations)
+    return dict(
+        name=name,
+        iterations=len(durations),
+        ops_per_sec=len(durations) / total if total else 0.0,
+        mean_ms=total / len(durations) * 1000 if durations else 0.0,
+        p50_ms=percentile(durations, 50) * 1000,
+        p99_ms=percentile(durations, 99) * 1000,
+        **extra,
+    )
+
+def measure(func, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def bench_resolution(workload):
+    # Each bet can only be resolved once, so every bet is one sample
+    durations = {"number": [], "text": []}
+    for bet_id, answer_type, correct_answer in workload.bets:
+        supabase_db.close_bet(bet_id)
+        supabase_db.resolve_bet(bet_id, correct_answer)
+        start = time.perf_counter()
+        scoring.distribute_reedz_on_resolution(bet_id)
+        durations[answer_type].append(time.perf_counter() - start)
+    return [
+        summarize(f"distribute_reedz_on_resolution[{answer_type}]", samples)
+        for answer_type, samples in durations.items() if samples
+    ]
+
+def bench_compute_payouts(workload, iterations):
+    results = []
+    seen = set()
+    for bet_id, answer_type, correct_answer in workload.bets:
+        if answer_type in seen:
+            continue
+        seen.add(answer_type)
+        bet = dataclasses.replace(supabase_db.get_bet(bet_id), correct_answer=correct_answer)
+        predictions = supabase_db.get_prediction_batch(bet_id, answer_type)
+        results.append(summarize(
+            f"compute_payouts[{answer_type}]",
+            measure(lambda: scoring.compute_payouts(bet, predictions), iterations),
+            predictions=len(predictions),
+        ))
+    return results
+
+def bench_reads(workload, iterations):
+    some_user = workload.user_ids[len(workload.user_ids) // 2]
+    return [
+        summarize("get_bets_grouped", measure(supabase_db.get_bets_grouped, iterations)),
+        summarize("get_leaderboard_page[top50]", measure(lambda: supabase_db.get_leaderboard_page(limit=50), iterations)),
+        summarize("get_top_n[100]", measure(lambda: supabase_db.get_top_n(100), iterations)),
+        summarize("get_rank", measure(lambda: supabase_db.get_rank(some_user), iterations)),
+        summarize("iter_leaderboard[full]", measure(lambda: sum(1 for _ in supabase_db.iter_leaderboard()), max(1, iterations // 10))),
+    ]
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def run(backend, config, iterations, sqlite_path=":memory:"):
+    options = {"path": sqlite_path} if backend == "sqlite" else {}
+    supabase_db.set_repository(create_repository(backend, **options))
+    start = time.perf_counter()
+    workload = generate_workload(supabase_db, config)
+    setup_seconds = time.perf_counter() - start
+    results = bench_compute_payouts(workload, iterations)
+    results += bench_reads(workload, iterations)
+    results += bench_resolution(workload)
+    return dict(
+        commit=git_commit(),
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        python=platform.python_version(),
+        backend=backend,
+        workload=config.as_dict(),
+        setup_seconds=setup_seconds,
+        results=results,
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Reedz scoring and data-layer reads offline.")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--sqlite-path", default=":memory:")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--bets", type=int, default=20)
+    parser.add_argument("--predictions-per-bet", type=int, default=500)
+    parser.add_argument("--text-bet-ratio", type=float, default=0.25)
+    parser.add_argument("--exact-hit-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    config = WorkloadConfig(
+        users=args.users,
+        bets=args.bets,
+        predictions_per_bet=args.predictions_per_bet,
+        text_bet_ratio=args.text_bet_ratio,
+        exact_hit_ratio=args.exact_hit_ratio,
+        seed=args.seed,
+    )
+    report = run(args.backend, config, args.iterations, args.sqlite_path)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for r in report["results"]:
+        print(f"{r['name']:<40} {r['ops_per_sec']:>10.1f} ops/s  p50 {r['p50_ms']:>8.3f} ms  p99 {r['p99_ms']:>8.3f} ms")
+    print(f"Wrote {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
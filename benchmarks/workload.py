@@ -0,0 +1,86 @@
+import random
+from datetime import datetime, timedelta, timezone
+from models import User, Bet, Prediction
+
+TEXT_ANSWERS = ("red", "blue", "green", "yellow", "purple", "orange")
+
+# Seeded synthetic data for benchmarks. Number bets draw predictions around the
+# correct answer from a small integer range so ties are common, and a share of
+# every bet hits the answer exactly.
+class WorkloadConfig:
+    def __init__(
+        self,
+        users=1000,
+        bets=20,
+        predictions_per_bet=500,
+        text_bet_ratio=0.25,
+        exact_hit_ratio=0.05,
+        number_spread=50,
+        seed=42,
+    ):
+        self.users = users
+        self.bets = bets
+        self.predictions_per_bet = min(predictions_per_bet, users)
+        self.text_bet_ratio = text_bet_ratio
+        self.exact_hit_ratio = exact_hit_ratio
+        self.number_spread = number_spread
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class Workload:
+    def __init__(self, config, admin, user_ids, bets):
+        self.config = config
+        self.admin = admin
+        self.user_ids = user_ids
+        # [(bet_id, answer_type, correct_answer)] for every generated bet
+        self.bets = bets
+
+
+def generate_predictions(rng, config, answer_type, correct_answer):
+    values = []
+    for _ in range(config.predictions_per_bet):
+        if rng.random() < config.exact_hit_ratio:
+            values.append(correct_answer)
+        elif answer_type == "number":
+            values.append(str(int(correct_answer) + rng.randint(-config.number_spread, config.number_spread)))
+        else:
+            values.append(rng.choice(TEXT_ANSWERS).upper() if rng.random() < 0.1 else rng.choice(TEXT_ANSWERS))
+    return values
+
+def generate_workload(db, config):
+    # db is the supabase_db facade (or anything with the same functions)
+    rng = random.Random(config.seed)
+    now = datetime.now(timezone.utc)
+    db.create_user(User(None, "bench_admin", "x", "bench_admin@example.com", 0, "Admin", now))
+    admin = db.get_user_by_username("bench_admin")
+    user_ids = []
+    for i in range(config.users):
+        row = db.create_user(User(
+            None, f"bench{i}", "x", f"bench{i}@example.com", rng.randint(0, 500), "Member", now
+        ))
+        user_ids.append(row[0]["user_id"])
+    bets = []
+    for i in range(config.bets):
+        answer_type = "text" if rng.random() < config.text_bet_ratio else "number"
+        correct_answer = rng.choice(TEXT_ANSWERS) if answer_type == "text" else str(rng.randint(0, 1000))
+        row = db.create_bet(Bet(
+            bet_id=None,
+            created_by_user_id=admin.user_id,
+            title=f"Bench bet {i}",
+            description="",
+            answer_type=answer_type,
+            is_open=True,
+            is_resolved=False,
+            created_at=now,
+            close_at=now + timedelta(days=1),
+        ))
+        bet_id = row[0]["bet_id"]
+        predictors = rng.sample(user_ids, config.predictions_per_bet)
+        values = generate_predictions(rng, config, answer_type, correct_answer)
+        for user_id, value in zip(predictors, values):
+            db.create_prediction(Prediction(None, user_id, bet_id, value, now))
+        bets.append((bet_id, answer_type, correct_answer))
+    return Workload(config, admin, user_ids, bets)
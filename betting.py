@@ -1,4 +1,6 @@
 import supabase_db
+import scheduler
+import notifications
 from models import Bet, Prediction, User
 from auth import is_admin, can_place_prediction
 from datetime import datetime
@@ -20,7 +22,10 @@ def create_bet(admin_user: User, title: str, description: str, answer_type: str,
         correct_answer=None,
         is_closed=False
     )
-    return supabase_db.create_bet(bet)
+    rows = supabase_db.create_bet(bet)
+    scheduler.schedule_bets(rows)
+    notifications.record_bets_created(rows)
+    return rows
 
 def close_bet(admin_user: User, bet_id):
     if not is_admin(admin_user):
@@ -33,12 +38,11 @@ def resolve_bet(admin_user: User, bet_id, correct_answer):
     supabase_db.resolve_bet(bet_id, correct_answer)
     from scoring import distribute_reedz_on_resolution
     distribute_reedz_on_resolution(bet_id)
+    notifications.record_bet_resolved(bet_id)
 
 def place_prediction(user: User, bet_id, prediction_value):
     if not can_place_prediction(user):
         raise PermissionError("User cannot place predictions")
-    if supabase_db.has_prediction(user.user_id, bet_id):
-        raise Exception("Only one prediction per user per bet")
     prediction = Prediction(
         prediction_id=None,
         user_id=user.user_id,
@@ -46,7 +50,12 @@ def place_prediction(user: User, bet_id, prediction_value):
         prediction=str(prediction_value),
         created_at=datetime.now()
     )
-    return supabase_db.create_prediction(prediction)
+    # One insert: the storage layer rejects closed bets and duplicate
+    # predictions (DuplicatePredictionError: "Only one prediction per user per bet")
+    return supabase_db.place_prediction(prediction)
 
 def get_bet_overview(state: str):
     return supabase_db.get_bet_overview(state)
+
+def get_bets_grouped():
+    return supabase_db.get_bets_grouped()
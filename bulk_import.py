@@ -0,0 +1,235 @@
+import argparse
+import csv
+import getpass
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import notifications
+import scheduler
+import supabase_db
+from auth import authenticate, is_admin
+from models import Bet, Prediction
+from repository import parse_timestamp
+
+# Bulk loading of bets and predictions from CSV or JSONL files.
+#
+#   bets:        title, description, answer_type (number|text), close_at (ISO 8601)
+#   predictions: bet_id, user_id or username, prediction, created_at (optional)
+#
+# Files are streamed row by row, every row is validated, and valid rows are
+# inserted in multi-row chunks. A chunk that the database rejects is retried
+# row by row so one bad row only costs that row. Problems are collected in an
+# ImportReport instead of aborting the import.
+
+IMPORT_CHUNK_SIZE = 500
+ANSWER_TYPES = ("number", "text")
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []  # [(line number, message)]
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["line", "error"])
+            writer.writerows(self.errors)
+
+
+def read_rows(path, fmt=None):
+    # Yields (line number, row dict), or (line number, error) for unparseable lines
+    fmt = fmt or ("jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson") else "csv")
+    with open(path, newline="") as f:
+        if fmt == "jsonl":
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, e
+                    continue
+                yield line_no, row if isinstance(row, dict) else ValueError("expected a JSON object")
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+def _field(row, name):
+    value = row.get(name)
+    return value.strip() if isinstance(value, str) else value
+
+def _insert_chunk(chunk, insert_many, insert_one, report):
+    # chunk is [(line number, model)]; returns the inserted rows
+    if not chunk:
+        return []
+    try:
+        rows = insert_many([model for _, model in chunk])
+        report.inserted += len(chunk)
+        return rows or []
+    except Exception:
+        pass
+    rows = []
+    for line, model in chunk:
+        try:
+            rows.extend(insert_one(model) or [])
+            report.inserted += 1
+        except Exception as e:
+            report.add_error(line, str(e))
+    return rows
+
+def validate_bet_row(row, admin_user, now):
+    title = _field(row, "title")
+    answer_type = (_field(row, "answer_type") or "").lower()
+    close_at_raw = _field(row, "close_at")
+    if not title:
+        raise ValueError("title is required")
+    if answer_type not in ANSWER_TYPES:
+        raise ValueError(f"answer_type must be one of {', '.join(ANSWER_TYPES)}, got {answer_type!r}")
+    if not close_at_raw:
+        raise ValueError("close_at is required")
+    try:
+        close_at = parse_timestamp(close_at_raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"close_at is not an ISO 8601 timestamp: {close_at_raw!r}")
+    return Bet(
+        bet_id=None,
+        created_by_user_id=admin_user.user_id,
+        title=title,
+        description=_field(row, "description") or "",
+        answer_type=answer_type,
+        is_open=True,
+        is_resolved=False,
+        created_at=now,
+        close_at=close_at,
+    )
+
+def _bets_inserted(rows):
+    scheduler.schedule_bets(rows)
+    notifications.record_bets_created(rows)
+
+def import_bets(admin_user, path, fmt=None, chunk_size=IMPORT_CHUNK_SIZE):
+    if not is_admin(admin_user):
+        raise PermissionError("Only admin can create bets")
+    report = ImportReport()
+    now = datetime.now(timezone.utc)
+    chunk = []
+    for line, row in read_rows(path, fmt):
+        if isinstance(row, Exception):
+            report.add_error(line, str(row))
+            continue
+        try:
+            chunk.append((line, validate_bet_row(row, admin_user, now)))
+        except ValueError as e:
+            report.add_error(line, str(e))
+        if len(chunk) >= chunk_size:
+            _bets_inserted(_insert_chunk(chunk, supabase_db.create_bets_many, supabase_db.create_bet, report))
+            chunk = []
+    _bets_inserted(_insert_chunk(chunk, supabase_db.create_bets_many, supabase_db.create_bet, report))
+    return report
+
+def import_predictions(admin_user, path, fmt=None, chunk_size=IMPORT_CHUNK_SIZE):
+    if not is_admin(admin_user):
+        raise PermissionError("Only admin can import predictions")
+    report = ImportReport()
+    now = datetime.now(timezone.utc)
+    # Both lookups are single paged scans instead of one query per row
+    user_ids_by_name = {u["username"]: u["user_id"] for u in supabase_db.iter_users()}
+    known_user_ids = set(user_ids_by_name.values())
+    answer_types = {b.bet_id: b.answer_type for bets in supabase_db.get_bets_grouped().values() for b in bets}
+    seen = set()
+    chunk = []
+    for line, row in read_rows(path, fmt):
+        if isinstance(row, Exception):
+            report.add_error(line, str(row))
+            continue
+        try:
+            prediction = validate_prediction_row(row, user_ids_by_name, known_user_ids, answer_types, now)
+            key = (prediction.user_id, prediction.bet_id)
+            if key in seen:
+                raise ValueError("Only one prediction per user per bet (duplicate in file)")
+            seen.add(key)
+            chunk.append((line, prediction))
+        except ValueError as e:
+            report.add_error(line, str(e))
+        if len(chunk) >= chunk_size:
+            _insert_chunk(chunk, supabase_db.create_predictions_many, supabase_db.create_prediction, report)
+            chunk = []
+    _insert_chunk(chunk, supabase_db.create_predictions_many, supabase_db.create_prediction, report)
+    return report
+
+def validate_prediction_row(row, user_ids_by_name, known_user_ids, answer_types, now):
+    try:
+        bet_id = int(_field(row, "bet_id"))
+    except (TypeError, ValueError):
+        raise ValueError(f"bet_id must be an integer, got {row.get('bet_id')!r}")
+    if bet_id not in answer_types:
+        raise ValueError(f"bet {bet_id} does not exist")
+    username = _field(row, "username")
+    if _field(row, "user_id") not in (None, ""):
+        try:
+            user_id = int(_field(row, "user_id"))
+        except (TypeError, ValueError):
+            raise ValueError(f"user_id must be an integer, got {row.get('user_id')!r}")
+        if user_id not in known_user_ids:
+            raise ValueError(f"user {user_id} does not exist")
+    elif username:
+        if username not in user_ids_by_name:
+            raise ValueError(f"user {username!r} does not exist")
+        user_id = user_ids_by_name[username]
+    else:
+        raise ValueError("user_id or username is required")
+    value = _field(row, "prediction")
+    if value in (None, ""):
+        raise ValueError("prediction is required")
+    value = str(value)
+    if answer_types[bet_id] == "number":
+        try:
+            float(value)
+        except ValueError:
+            raise ValueError(f"bet {bet_id} expects a number, got {value!r}")
+    created_at = _field(row, "created_at")
+    try:
+        created_at = parse_timestamp(created_at) if created_at else now
+    except (TypeError, ValueError):
+        raise ValueError(f"created_at is not an ISO 8601 timestamp: {created_at!r}")
+    return Prediction(prediction_id=None, user_id=user_id, bet_id=bet_id, prediction=value, created_at=created_at)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import Reedz bets or predictions from CSV/JSONL.")
+    parser.add_argument("kind", choices=["bets", "predictions"])
+    parser.add_argument("path")
+    parser.add_argument("--admin", required=True, help="Admin username to import as")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--report", help="Write per-row errors to this CSV file")
+    args = parser.parse_args(argv)
+
+    admin = authenticate(args.admin, getpass.getpass("Password: "))
+    if not admin or not is_admin(admin):
+        print("Admin login failed.")
+        return 1
+    importer = import_bets if args.kind == "bets" else import_predictions
+    report = importer(admin, args.path, fmt=args.format, chunk_size=args.chunk_size)
+    print(f"Inserted {report.inserted} {args.kind}, {len(report.errors)} rows rejected.")
+    for line, message in report.errors[:20]:
+        print(f"  line {line}: {message}")
+    if len(report.errors) > 20:
+        print(f"  ... {len(report.errors) - 20} more")
+    if args.report:
+        report.write_csv(args.report)
+        print(f"Error report written to {args.report}")
+    return 0 if report.ok else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
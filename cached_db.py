@@ -0,0 +1,69 @@
+import os
+import streamlit as st
+import supabase_db
+import async_db
+
+# Read-through cache for the Streamlit app. Every cached read is keyed on
+# supabase_db.data_version(), so a mutation made through supabase_db makes the
+# next rerun fetch fresh data; the TTL bounds staleness for changes made by
+# other processes (the CLI, other app replicas).
+CACHE_TTL_SECONDS = int(os.getenv("REEDZ_CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("REEDZ_CACHE_MAX_ENTRIES", "256"))
+
+def _cached(func):
+    return st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)(func)
+
+@_cached
+def _get_leaderboard_page(version, after, limit):
+    return supabase_db.get_leaderboard_page(after=after, limit=limit)
+
+@_cached
+def _get_rank(version, user_id, neighbours):
+    return supabase_db.get_rank(user_id, neighbours=neighbours)
+
+@_cached
+def _list_users_page(version, after, limit):
+    return supabase_db.list_users_page(after=after, limit=limit)
+
+@_cached
+def _get_bets_grouped(version):
+    return supabase_db.get_bets_grouped()
+
+@_cached
+def _get_prediction_batch(version, bet_id, answer_type):
+    return supabase_db.get_prediction_batch(bet_id, answer_type, with_usernames=True)
+
+@_cached
+def _load_profile(version, user_id, neighbours, history_limit):
+    return async_db.load_profile(user_id, neighbours=neighbours, history_limit=history_limit)
+
+@_cached
+def _get_reedz_history(version, user_id, limit):
+    return supabase_db.get_reedz_history(user_id, limit=limit)
+
+def get_leaderboard_page(after=None, limit=supabase_db.DEFAULT_PAGE_SIZE):
+    return _get_leaderboard_page(supabase_db.data_version(), after, limit)
+
+def get_rank(user_id, neighbours=2):
+    return _get_rank(supabase_db.data_version(), user_id, neighbours)
+
+def list_users_page(after=None, limit=supabase_db.DEFAULT_PAGE_SIZE):
+    return _list_users_page(supabase_db.data_version(), after, limit)
+
+def get_bets_grouped():
+    return _get_bets_grouped(supabase_db.data_version())
+
+def get_prediction_batch(bet_id, answer_type):
+    return _get_prediction_batch(supabase_db.data_version(), bet_id, answer_type)
+
+# supabase_db keeps its own LRU of users, evicted per user on every write, so
+# this does not need to key on the global data version
+def get_user_by_id(user_id):
+    return supabase_db.get_user_by_id(user_id)
+
+def get_reedz_history(user_id, limit=50):
+    return _get_reedz_history(supabase_db.data_version(), user_id, limit)
+
+# User, leaderboard standing and Reedz history fetched concurrently
+def load_profile(user_id, neighbours=2, history_limit=50):
+    return _load_profile(supabase_db.data_version(), user_id, neighbours, history_limit)
@@ -1,23 +1,292 @@
+import logging
+import os
+import random
 import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
-import os
 
-def send_password_reset_email(email, code):
-    from_addr = os.getenv("SMTP_USER")
-    password = os.getenv("SMTP_PASS")
-    smtp_host = os.getenv("SMTP_HOST")
-    smtp_port = int(os.getenv("SMTP_PORT", "465"))
-    to_addr = email  # Any valid email works
-    subject = "Your Reedz Password Reset Code"
-    message = f"Your Reedz password reset code is: {code}\n\nThis code will expire in 5 minutes."
-    msg = MIMEText(message)
+import supabase_db
+
+logger = logging.getLogger(__name__)
+
+# Outgoing mail goes through the email_outbox table. queue_email() stores the
+# message and returns straight away; a background worker claims due messages,
+# sends them over one SMTP connection that stays logged in between messages,
+# reconnects when the server drops it, and retries failures with exponential
+# backoff. Messages queued while no worker runs (the CLI, a restart) are
+# picked up on the next poll of any running worker.
+EMAIL_WORKER_ENABLED = os.getenv("REEDZ_EMAIL_WORKER", "1") not in ("0", "false", "no")
+EMAIL_POLL_SECONDS = float(os.getenv("REEDZ_EMAIL_POLL_SECONDS", "30"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("REEDZ_EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("REEDZ_EMAIL_RETRY_BASE_SECONDS", "5"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("REEDZ_EMAIL_RETRY_MAX_SECONDS", "600"))
+SMTP_TIMEOUT_SECONDS = float(os.getenv("REEDZ_SMTP_TIMEOUT_SECONDS", "10"))
+# Close the warm connection after this long without mail, before the server does
+SMTP_IDLE_SECONDS = float(os.getenv("REEDZ_SMTP_IDLE_SECONDS", "60"))
+EMAIL_BATCH_SIZE = 20
+# A message stuck in "sending" this long belongs to a worker that died mid-send
+EMAIL_LEASE_SECONDS = 300
+
+
+def smtp_settings():
+    return (
+        os.getenv("SMTP_HOST"),
+        int(os.getenv("SMTP_PORT", "465")),
+        os.getenv("SMTP_USER"),
+        os.getenv("SMTP_PASS"),
+    )
+
+def build_message(from_addr, to_addr, subject, body):
+    msg = MIMEText(body)
     msg["Subject"] = subject
     msg["From"] = from_addr
     msg["To"] = to_addr
+    return msg.as_string()
+
+def is_permanent(error):
+    # 5xx replies other than a failed login will not succeed on retry
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+def retry_delay(attempt):
+    # Equal jitter: at least half the backoff, so a failed email is never due
+    # again in the same deliver_due pass against a server that just failed
+    half = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (attempt - 1)) / 2
+    return half + random.uniform(0, half)
+
+
+class SmtpConnection:
+    # One logged-in SMTP_SSL session reused across messages
+    def __init__(self, idle_seconds=SMTP_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.connects = 0
+        self._server = None
+        self._last_used = 0.0
+
+    @property
+    def open(self):
+        return self._server is not None
+
+    def _connect(self):
+        host, port, user, password = smtp_settings()
+        if not host:
+            raise Exception("SMTP_HOST is not set")
+        server = smtplib.SMTP_SSL(host, port, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            server.login(user, password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self.connects += 1
+
+    def send(self, to_addr, subject, body):
+        from_addr = smtp_settings()[2]
+        message = build_message(from_addr, to_addr, subject, body)
+        reused = self._server is not None
+        if not reused:
+            self._connect()
+        try:
+            self._server.sendmail(from_addr, [to_addr], message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the warm connection; one fresh attempt
+            self.close()
+            if not reused:
+                raise
+            self._connect()
+            self._server.sendmail(from_addr, [to_addr], message)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The session is still usable after a rejected message
+            raise
+        except OSError:
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def seconds_until_idle(self):
+        if self._server is None:
+            return float("inf")
+        return self._last_used + self.idle_seconds - time.monotonic()
+
+    def close_if_idle(self):
+        if self.seconds_until_idle() <= 0:
+            self.close()
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
+class EmailOutbox:
+    def __init__(self, poll_seconds=EMAIL_POLL_SECONDS, connection=None):
+        self.poll_seconds = poll_seconds
+        self.connection = connection or SmtpConnection()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._wake = False
+        self._next_retry = float("inf")
+        self.sent_count = 0
+        self.retry_count = 0
+        self.failed_count = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return self
+            self._stopping = False
+            self._wake = True
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self):
+        # Called after a message is queued so it goes out without waiting for the next poll
+        with self._cond:
+            self._wake = True
+            self._cond.notify_all()
+
+    def deliver(self, row):
+        try:
+            self.connection.send(row["to_addr"], row["subject"], row["body"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if is_permanent(e) or row["attempts"] >= EMAIL_MAX_ATTEMPTS:
+                logger.warning("Giving up on email %s after %d attempts: %s", row["outbox_id"], row["attempts"], error)
+                supabase_db.update_email_status(row["outbox_id"], "failed", last_error=error)
+                self.failed_count += 1
+            else:
+                delay = retry_delay(row["attempts"])
+                retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                supabase_db.update_email_status(row["outbox_id"], "queued", last_error=error, next_attempt_at=retry_at)
+                self._next_retry = min(self._next_retry, time.monotonic() + delay)
+                self.retry_count += 1
+            return False
+        supabase_db.update_email_status(row["outbox_id"], "sent")
+        self.sent_count += 1
+        return True
+
+    def deliver_due(self):
+        # Sends every message that is due; returns how many were attempted
+        attempted = 0
+        self._next_retry = float("inf")
+        while True:
+            rows = supabase_db.claim_emails(EMAIL_BATCH_SIZE, EMAIL_LEASE_SECONDS)
+            for row in rows:
+                self.deliver(row)
+            attempted += len(rows)
+            if len(rows) < EMAIL_BATCH_SIZE:
+                return attempted
+
+    def _seconds_until_next_event(self):
+        return max(0.0, min(
+            self.poll_seconds,
+            self._next_retry - time.monotonic(),
+            self.connection.seconds_until_idle(),
+        ))
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    if not self._wake and not self._stopping:
+                        self._cond.wait(self._seconds_until_next_event())
+                    if self._stopping:
+                        return
+                    self._wake = False
+                try:
+                    self.deliver_due()
+                except Exception:
+                    logger.exception("Email outbox poll failed; retrying in %.0fs", self.poll_seconds)
+                self.connection.close_if_idle()
+        finally:
+            self.connection.close()
+
+    def stats(self):
+        return {
+            "sent": self.sent_count,
+            "retried": self.retry_count,
+            "failed": self.failed_count,
+            "smtp_connects": self.connection.connects,
+            "smtp_open": int(self.connection.open),
+        }
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    return _outbox
+
+def start_outbox(poll_seconds=EMAIL_POLL_SECONDS):
+    # One worker per process; safe to call on every Streamlit rerun
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = EmailOutbox(poll_seconds)
+        return _outbox.start()
+
+def stop_outbox(timeout=None):
+    global _outbox
+    with _outbox_lock:
+        outbox, _outbox = _outbox, None
+    if outbox is not None:
+        outbox.stop(timeout)
+
+def outbox_stats():
+    return _outbox.stats() if _outbox is not None else {}
+
+def queue_email(to_addr, subject, body):
+    # Returns the outbox row at once; see get_delivery_status
+    row = supabase_db.enqueue_email(to_addr, subject, body)
+    if _outbox is not None:
+        _outbox.notify()
+    return row
+
+def queue_emails(messages):
+    # [(to_addr, subject, body)] queued in one insert
+    rows = supabase_db.enqueue_emails_many(messages)
+    if rows and _outbox is not None:
+        _outbox.notify()
+    return rows
+
+def get_delivery_status(outbox_id):
+    # {"status": "queued" | "sending" | "sent" | "failed", "attempts", "last_error", "sent_at"} or None
+    row = supabase_db.get_email(outbox_id)
+    if row is None:
+        return None
+    return {key: row[key] for key in ("status", "attempts", "last_error", "sent_at")}
+
+def deliver_queued_emails():
+    # One-shot pass for cron jobs or scripts that do not run the worker
+    outbox = EmailOutbox()
     try:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(from_addr, password)
-            server.sendmail(from_addr, [to_addr], msg.as_string())
-        return True, None
-    except Exception as e:
-        return False, str(e)
+        return outbox.deliver_due()
+    finally:
+        outbox.connection.close()
+
+def queue_password_reset_email(email, code):
+    subject = "Your Reedz Password Reset Code"
+    message = f"Your Reedz password reset code is: {code}\n\nThis code will expire in 5 minutes."
+    return queue_email(email, subject, message)
@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+
+RANK_METHODS = ("competition", "dense")
+
+# Adds "rank" to rows already ordered by reedz_balance desc. Competition
+# ranking gives tied users the same rank and skips the following ones
+# (1, 2, 2, 4); dense ranking does not skip (1, 2, 2, 3). first_rank and
+# first_index describe the first row when ranking a later page.
+def rank_rows(rows, method="competition", first_rank=1, first_index=0):
+    return list(iter_rank_rows(rows, method, first_rank, first_index))
+
+# Lazy rank_rows, for streaming the leaderboard a page at a time
+def iter_rank_rows(rows, method="competition", first_rank=1, first_index=0):
+    if method not in RANK_METHODS:
+        raise ValueError(f"Unknown ranking method {method!r}")
+    rank = first_rank
+    previous = None
+    for idx, row in enumerate(rows):
+        if previous is not None and row["reedz_balance"] != previous:
+            rank = rank + 1 if method == "dense" else first_index + idx + 1
+        previous = row["reedz_balance"]
+        yield dict(row, rank=rank)
+
+# Builds the get_rank() result from the user's row and its neighbours, each of
+# which already carries "rank" and "dense_rank"
+def rank_entry(user_id, window):
+    for idx, row in enumerate(window):
+        if row["user_id"] == user_id:
+            return dict(row, above=window[:idx], below=window[idx + 1:])
+    return None
+
+
+class RankIndex:
+    # In-process sorted index over (reedz_balance desc, user_id). Ranks and
+    # neighbours are found by binary search; a balance change is one
+    # remove/insert pair.
+
+    def __init__(self):
+        self._keys = []
+        self._balances = {}
+        self._balance_counts = Counter()
+        self._distinct = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, user_id, balance):
+        if user_id in self._balances:
+            self.remove(user_id)
+        self._balances[user_id] = balance
+        insort(self._keys, (-balance, user_id))
+        if self._balance_counts[balance] == 0:
+            insort(self._distinct, -balance)
+        self._balance_counts[balance] += 1
+
+    def remove(self, user_id):
+        balance = self._balances.pop(user_id, None)
+        if balance is None:
+            return
+        del self._keys[bisect_left(self._keys, (-balance, user_id))]
+        self._balance_counts[balance] -= 1
+        if self._balance_counts[balance] == 0:
+            del self._balance_counts[balance]
+            del self._distinct[bisect_left(self._distinct, -balance)]
+
+    def rank(self, balance):
+        return bisect_left(self._keys, (-balance,)) + 1
+
+    def dense_rank(self, balance):
+        return bisect_left(self._distinct, -balance) + 1
+
+    def page(self, after=None, limit=None):
+        # Keys after the (reedz_balance, user_id) cursor, as (user_id, balance)
+        start = 0 if after is None else bisect_right(self._keys, (-after[0], after[1]))
+        end = None if limit is None else start + limit
+        return [(uid, -neg) for neg, uid in self._keys[start:end]]
+
+    def window(self, user_id, neighbours):
+        # The user plus up to `neighbours` users on either side, as (user_id, balance)
+        balance = self._balances.get(user_id)
+        if balance is None:
+            return []
+        pos = bisect_left(self._keys, (-balance, user_id))
+        return [(uid, -neg) for neg, uid in self._keys[max(0, pos - neighbours):pos + neighbours + 1]]
@@ -3,9 +3,12 @@ import os
 import getpass
 from dotenv import load_dotenv
 from models import User
-from auth import hash_password, authenticate, is_admin
-from betting import create_bet, close_bet, resolve_bet, place_prediction, get_bet_overview
+from auth import hash_password, authenticate, is_admin, AuthBusyError
+from rate_limit import RateLimitedError
+from betting import create_bet, close_bet, resolve_bet, place_prediction, get_bets_grouped
 import supabase_db
+from leaderboard import iter_rank_rows
+import scheduler
 from datetime import datetime, timedelta
 
 load_dotenv()
@@ -58,20 +61,73 @@ def user_management_menu():
 
 def print_bets(bets):
     for bet in bets:
-        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}")
+        print(f"Bet ID: {bet.bet_id}, Title: {bet.title}")
+
+# Streams rows CLI_PAGE_SIZE at a time; the iterators in supabase_db only
+# fetch the next page once the user asks for it
+CLI_PAGE_SIZE = 20
+
+def print_paged(rows, print_row, page_size=CLI_PAGE_SIZE):
+    count = 0
+    for row in rows:
+        print_row(count, row)
+        count += 1
+        # Ask before pulling the next row so the next page is not fetched early
+        if count % page_size == 0 and input("-- Enter for more, q to stop -- ").strip().lower() == "q":
+            break
+    return count
+
+def print_bets_paged(state):
+    # Bets in `state` ("" for all), one page at a time; returns {bet_id: bet}
+    # for the bets that were shown
+    shown = {}
+    def print_row(idx, bet):
+        shown[bet.bet_id] = bet
+        print(f"Bet ID: {bet.bet_id}, Title: {bet.title}")
+    print_paged(supabase_db.iter_bets(state, page_size=CLI_PAGE_SIZE), print_row)
+    return shown
+
+def print_leaderboard():
+    print("\n==== REEDZ LEADERBOARD ====")
+    print(f"{'Rank':<6}{'Username':<20}{'Reedz':<8}")
+    shown = print_paged(
+        iter_rank_rows(supabase_db.iter_leaderboard(page_size=CLI_PAGE_SIZE)),
+        lambda idx, entry: print(f"{entry['rank']:<6}{entry['username']:<20}{entry['reedz_balance']:<8}")
+    )
+    if not shown:
+        print("No users found.")
+
+def print_bet_overview(grouped):
+    print("\n--- Open Bets ---")
+    if grouped["open"]:
+        print_bets(grouped["open"])
+    else:
+        print("No open bets.")
+    print("\n--- Closed Bets ---")
+    if grouped["closed"]:
+        print_bets(grouped["closed"])
+    else:
+        print("No closed bets.")
+    print("\n--- Resolved Bets ---")
+    if grouped["resolved"]:
+        for bet in grouped["resolved"]:
+            ans_str = f", Answer: {bet.correct_answer}" if bet.correct_answer else ""
+            print(f"Bet ID: {bet.bet_id}, Title: {bet.title}{ans_str}")
+    else:
+        print("No resolved bets.")
 
 def print_predictions_with_usernames(predictions):
+    # predictions is a PredictionBatch loaded with usernames
     if not predictions:
         print("No predictions found for this bet.")
         return
     print("\nPredictions:")
-    for pred in predictions:
-        # Fetch username using user_id (optimize as needed)
-        pred_user = supabase_db.get_user_by_username(pred.user_id)
-        username = pred_user.username if pred_user else f"UserID {pred.user_id}"
-        print(f"User: {username}, Prediction: {pred.prediction}")
+    for username, user_id, label in zip(predictions.usernames, predictions.user_ids, predictions.prediction_labels()):
+        print(f"User: {username or f'UserID {user_id}'}, Prediction: {label}")
 
 def cli():
+    if scheduler.AUTO_CLOSE_ENABLED:
+        scheduler.start_scheduler()
     user = None
     while not user:
         choice = auth_menu()
@@ -96,7 +152,11 @@ def cli():
         elif choice == "2":
             username = input("Username: ")
             password = getpass.getpass("Password: ")
-            user = authenticate(username, password)
+            try:
+                user = authenticate(username, password)
+            except (RateLimitedError, AuthBusyError) as e:
+                print(f"{e}.")
+                user = None
             if user:
                 print(f"Logged in as {user.username}, role {user.role}")
             else:
@@ -131,12 +191,11 @@ def cli():
                 create_bet(user, title, description, answer_type, close_at)
                 print("Bet created.")
             elif choice == "2":
-                open_bets = get_bet_overview("open")
+                print("\nOpen Bets:")
+                open_bets = print_bets_paged("open")
                 if not open_bets:
                     print("No open bets available for predictions.")
                     continue
-                print("\nOpen Bets:")
-                print_bets(open_bets)
                 try:
                     bet_id = int(input("Enter Bet ID you want to predict on: "))
                 except ValueError:
@@ -149,12 +208,11 @@ def cli():
                 except Exception as e:
                     print(f"Error: {e}")
             elif choice == "3":
-                open_bets = get_bet_overview("open")
+                print("\nOpen Bets:")
+                open_bets = print_bets_paged("open")
                 if not open_bets:
                     print("No open bets to close.")
                     continue
-                print("\nOpen Bets:")
-                print_bets(open_bets)
                 try:
                     bet_id = int(input("Enter Bet ID to close: "))
                 except ValueError:
@@ -163,12 +221,11 @@ def cli():
                 close_bet(user, bet_id)
                 print("Bet closed.")
             elif choice == "4":
-                closed_bets = get_bet_overview("closed")
+                print("\nClosed Bets (available to resolve):")
+                closed_bets = print_bets_paged("closed")
                 if not closed_bets:
                     print("No bets available to resolve.")
                     continue
-                print("\nClosed Bets (available to resolve):")
-                print_bets(closed_bets)
                 try:
                     bet_id = int(input("Enter Bet ID to resolve: "))
                 except ValueError:
@@ -178,45 +235,18 @@ def cli():
                 resolve_bet(user, bet_id, answer)
                 print("Bet resolved and Reedz distributed.")
             elif choice == "5":
-                open_bets = get_bet_overview("open")
-                closed_bets = get_bet_overview("closed")
-                resolved_bets = get_bet_overview("resolved")
-                print("\n--- Open Bets ---")
-                if open_bets:
-                    for bet in open_bets:
-                        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}")
-                else:
-                    print("No open bets.")
-                print("\n--- Closed Bets ---")
-                if closed_bets:
-                    for bet in closed_bets:
-                        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}")
-                else:
-                    print("No closed bets.")
-                print("\n--- Resolved Bets ---")
-                if resolved_bets:
-                    for bet in resolved_bets:
-                        ans_str = f", Answer: {bet['correct_answer']}" if bet.get('correct_answer') else ""
-                        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}{ans_str}")
-                else:
-                    print("No resolved bets.")
+                print_bet_overview(get_bets_grouped())
             elif choice == "6":
-                leaderboard = supabase_db.get_leaderboard()
-                if not leaderboard:
-                    print("No users found.")
-                else:
-                    print("\n==== REEDZ LEADERBOARD ====")
-                    print(f"{'Rank':<6}{'Username':<20}{'Reedz':<8}")
-                    for idx, entry in enumerate(leaderboard, 1):
-                        print(f"{idx:<6}{entry['username']:<20}{entry['reedz_balance']:<8}")
+                print_leaderboard()
             elif choice == "7":
                 while True:
                     sub_choice = user_management_menu()
                     if sub_choice == "1":
-                        users = supabase_db.list_all_users()
                         print(f"{'UserID':<8}{'Username':<20}{'Role':<10}{'Reedz':<8}")
-                        for u in users:
-                            print(f"{u['user_id']:<8}{u['username']:<20}{u['role']:<10}{u['reedz_balance']:<8}")
+                        print_paged(
+                            supabase_db.iter_users(page_size=CLI_PAGE_SIZE),
+                            lambda idx, u: print(f"{u['user_id']:<8}{u['username']:<20}{u['role']:<10}{u['reedz_balance']:<8}")
+                        )
                     elif sub_choice == "2":
                         try:
                             uid = int(input("Enter User ID to promote/demote: "))
@@ -237,13 +267,9 @@ def cli():
                         try:
                             uid = int(input("Enter User ID to change Reedz: "))
                             reedz = int(input("New Reedz balance: "))
-                            all_users = supabase_db.list_all_users()
-                            user_obj = next((u for u in all_users if u['user_id'] == uid), None)
-                            if not user_obj:
+                            if supabase_db.set_reedz_balance(uid, reedz) is None:
                                 print("User not found.")
                                 continue
-                            delta = reedz - user_obj['reedz_balance']
-                            supabase_db.add_reedz(uid, delta)
                             print("Reedz updated.")
                         except Exception as e:
                             print(f"Error: {e}")
@@ -284,7 +310,11 @@ def cli():
                     elif choice == "2":
                         username = input("Username: ")
                         password = getpass.getpass("Password: ")
-                        user = authenticate(username, password)
+                        try:
+                            user = authenticate(username, password)
+                        except (RateLimitedError, AuthBusyError) as e:
+                            print(f"{e}.")
+                            user = None
                         if user:
                             print(f"Logged in as {user.username}, role {user.role}")
                         else:
@@ -312,29 +342,31 @@ def cli():
                 print("Goodbye!")
                 sys.exit()
             elif choice == "10":
-                all_bets = get_bet_overview("")
+                print("\nAll Bets:")
+                all_bets = print_bets_paged("")
                 if not all_bets:
                     print("No bets found.")
                     continue
-                print("\nAll Bets:")
-                print_bets(all_bets)
                 try:
                     bet_id = int(input("Enter Bet ID to view predictions for: "))
                 except ValueError:
                     print("Invalid Bet ID.")
                     continue
-                predictions = supabase_db.get_predictions_for_bet(bet_id)
+                bet = all_bets.get(bet_id) or supabase_db.get_bet(bet_id)
+                if bet is None:
+                    print("No bet with that ID.")
+                    continue
+                predictions = supabase_db.get_prediction_batch(bet_id, bet.answer_type, with_usernames=True)
                 print_predictions_with_usernames(predictions)
             else:
                 print("Invalid choice.")
         else:
             if choice == "1":
-                open_bets = get_bet_overview("open")
+                print("\nOpen Bets:")
+                open_bets = print_bets_paged("open")
                 if not open_bets:
                     print("No open bets available for predictions.")
                     continue
-                print("\nOpen Bets:")
-                print_bets(open_bets)
                 try:
                     bet_id = int(input("Enter Bet ID you want to predict on: "))
                 except ValueError:
@@ -347,37 +379,9 @@ def cli():
                 except Exception as e:
                     print(f"Error: {e}")
             elif choice == "2":
-                open_bets = get_bet_overview("open")
-                closed_bets = get_bet_overview("closed")
-                resolved_bets = get_bet_overview("resolved")
-                print("\n--- Open Bets ---")
-                if open_bets:
-                    for bet in open_bets:
-                        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}")
-                else:
-                    print("No open bets.")
-                print("\n--- Closed Bets ---")
-                if closed_bets:
-                    for bet in closed_bets:
-                        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}")
-                else:
-                    print("No closed bets.")
-                print("\n--- Resolved Bets ---")
-                if resolved_bets:
-                    for bet in resolved_bets:
-                        ans_str = f", Answer: {bet['correct_answer']}" if bet.get('correct_answer') else ""
-                        print(f"Bet ID: {bet['bet_id']}, Title: {bet['title']}{ans_str}")
-                else:
-                    print("No resolved bets.")
+                print_bet_overview(get_bets_grouped())
             elif choice == "3":
-                leaderboard = supabase_db.get_leaderboard()
-                if not leaderboard:
-                    print("No users found.")
-                else:
-                    print("\n==== REEDZ LEADERBOARD ====")
-                    print(f"{'Rank':<6}{'Username':<20}{'Reedz':<8}")
-                    for idx, entry in enumerate(leaderboard, 1):
-                        print(f"{idx:<6}{entry['username']:<20}{entry['reedz_balance']:<8}")
+                print_leaderboard()
             elif choice == "4":
                 print("Logging out...")
                 user = None
@@ -404,7 +408,11 @@ def cli():
                     elif choice == "2":
                         username = input("Username: ")
                         password = getpass.getpass("Password: ")
-                        user = authenticate(username, password)
+                        try:
+                            user = authenticate(username, password)
+                        except (RateLimitedError, AuthBusyError) as e:
+                            print(f"{e}.")
+                            user = None
                         if user:
                             print(f"Logged in as {user.username}, role {user.role}")
                         else:
@@ -432,18 +440,21 @@ def cli():
                 print("Goodbye!")
                 sys.exit()
             elif choice == "6":
-                all_bets = get_bet_overview("")
+                print("\nAll Bets:")
+                all_bets = print_bets_paged("")
                 if not all_bets:
                     print("No bets found.")
                     continue
-                print("\nAll Bets:")
-                print_bets(all_bets)
                 try:
                     bet_id = int(input("Enter Bet ID to view predictions for: "))
                 except ValueError:
                     print("Invalid Bet ID.")
                     continue
-                predictions = supabase_db.get_predictions_for_bet(bet_id)
+                bet = all_bets.get(bet_id) or supabase_db.get_bet(bet_id)
+                if bet is None:
+                    print("No bet with that ID.")
+                    continue
+                predictions = supabase_db.get_prediction_batch(bet_id, bet.answer_type, with_usernames=True)
                 print_predictions_with_usernames(predictions)
             else:
                 print("Invalid choice.")
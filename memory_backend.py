@@ -0,0 +1,441 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from models import User, Bet, Prediction, bet_state, parse_timestamp, user_from_row, bet_from_row, bet_summary_from_row, prediction_from_row, prediction_batch_from_rows, reedz_txn_from_row
+from leaderboard import RankIndex, rank_entry
+from repository import (
+    Repository, BetClosedError, DuplicatePredictionError, bet_accepts_predictions, DEFAULT_PAGE_SIZE, group_bets,
+    user_row, bet_row, prediction_row, to_db_value,
+)
+
+USER_LIST_COLUMNS = ("user_id", "username", "email", "role", "reedz_balance")
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class MemoryRepository(Repository):
+    # Dict-backed store for tests, benchmarks and offline runs. Rows are kept in
+    # the same shape Supabase returns them and secondary indexes are maintained
+    # by hand so lookups stay O(1).
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+        self._bets = {}
+        self._predictions = {}
+        self._transactions = []
+        self._idempotency_keys = set()
+        self._emails = {}
+        self._events = {}
+        self._user_ids_by_username = {}
+        self._user_ids_by_email = {}
+        self._prediction_ids_by_bet = {}
+        self._prediction_ids_by_user = {}
+        self._prediction_id_by_user_bet = {}
+        self._rank_index = RankIndex()
+        self._next_ids = {"users": 1, "bets": 1, "predictions": 1, "reedz_transactions": 1, "email_outbox": 1, "notification_events": 1}
+
+    def _next_id(self, table):
+        value = self._next_ids[table]
+        self._next_ids[table] = value + 1
+        return value
+
+    # USER FUNCTIONS
+    def create_user(self, user: User):
+        with self._lock:
+            row = user_row(user)
+            if row["username"] in self._user_ids_by_username:
+                raise IntegrityError("duplicate key value violates unique constraint \"users_username_key\"")
+            if row["email"] in self._user_ids_by_email:
+                raise IntegrityError("duplicate key value violates unique constraint \"users_email_key\"")
+            row["user_id"] = self._next_id("users")
+            row["reset_code"] = None
+            row["reset_code_expiry"] = None
+            self._users[row["user_id"]] = row
+            self._user_ids_by_username[row["username"]] = row["user_id"]
+            self._user_ids_by_email[row["email"]] = row["user_id"]
+            self._rank_index.add(row["user_id"], row["reedz_balance"])
+            return [dict(row)]
+
+    def list_users_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        with self._lock:
+            rows = (r for r in self._users.values() if after is None or r["user_id"] > after)
+            return [{c: r[c] for c in USER_LIST_COLUMNS} for r in islice(rows, limit)]
+
+    def get_user_by_username(self, username):
+        with self._lock:
+            row = self._users.get(self._user_ids_by_username.get(username))
+            return user_from_row(row) if row else None
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            row = self._users.get(self._user_ids_by_email.get(email))
+            return user_from_row(row) if row else None
+
+    def get_user_by_id(self, user_id):
+        with self._lock:
+            row = self._users.get(user_id)
+            return user_from_row(row) if row else None
+
+    def _update_user(self, row, changes):
+        if "email" in changes and changes["email"] != row["email"]:
+            if changes["email"] in self._user_ids_by_email:
+                raise IntegrityError("duplicate key value violates unique constraint \"users_email_key\"")
+            del self._user_ids_by_email[row["email"]]
+            self._user_ids_by_email[changes["email"]] = row["user_id"]
+        row.update(changes)
+        return [dict(row)]
+
+    def _update_user_by_email(self, email, changes):
+        row = self._users.get(self._user_ids_by_email.get(email))
+        return self._update_user(row, changes) if row else []
+
+    def update_user_password(self, user_id, hashed_password):
+        with self._lock:
+            row = self._users.get(user_id)
+            return self._update_user(row, {"password": hashed_password}) if row else []
+
+    def update_user_password_by_email(self, email, hashed_password):
+        with self._lock:
+            return self._update_user_by_email(email, {"password": hashed_password})
+
+    def update_user_email(self, user_id, new_email):
+        with self._lock:
+            row = self._users.get(user_id)
+            return self._update_user(row, {"email": new_email}) if row else []
+
+    def set_user_reset_code(self, email, code, expiry):
+        with self._lock:
+            return self._update_user_by_email(email, {
+                "reset_code": code,
+                "reset_code_expiry": to_db_value(expiry),
+            })
+
+    def get_reset_code(self, email):
+        with self._lock:
+            row = self._users.get(self._user_ids_by_email.get(email))
+            if not row:
+                return None
+            return {"reset_code": row["reset_code"], "reset_code_expiry": row["reset_code_expiry"]}
+
+    def clear_reset_code(self, email):
+        with self._lock:
+            return self._update_user_by_email(email, {"reset_code": None, "reset_code_expiry": None})
+
+    def _record_reedz(self, row, delta, reason, bet_id):
+        row["reedz_balance"] += delta
+        self._rank_index.add(row["user_id"], row["reedz_balance"])
+        self._transactions.append({
+            "txn_id": self._next_id("reedz_transactions"),
+            "user_id": row["user_id"],
+            "delta": delta,
+            "reason": reason,
+            "bet_id": bet_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        return row["reedz_balance"]
+
+    def add_reedz(self, user_id, delta, reason="adjustment", bet_id=None):
+        with self._lock:
+            row = self._users.get(user_id)
+            if not row:
+                return None
+            return self._record_reedz(row, delta, reason, bet_id)
+
+    def set_reedz_balance(self, user_id, new_balance, reason="admin_adjustment"):
+        with self._lock:
+            row = self._users.get(user_id)
+            if not row:
+                return None
+            if new_balance != row["reedz_balance"]:
+                self._record_reedz(row, new_balance - row["reedz_balance"], reason, None)
+            return row["reedz_balance"]
+
+    def add_reedz_many(self, deltas, reason="bet_payout", bet_id=None, idempotency_key=None):
+        with self._lock:
+            if idempotency_key is not None:
+                if idempotency_key in self._idempotency_keys:
+                    return []
+                self._idempotency_keys.add(idempotency_key)
+            results = []
+            for user_id, delta in deltas.items():
+                row = self._users.get(user_id)
+                if not delta or not row:
+                    continue
+                self._record_reedz(row, delta, reason, bet_id)
+                results.append(dict(row))
+            return results
+
+    def get_reedz_history(self, user_id, limit=50):
+        with self._lock:
+            history = [
+                reedz_txn_from_row({k: t[k] for k in ("txn_id", "delta", "reason", "bet_id", "created_at")})
+                for t in reversed(self._transactions) if t["user_id"] == user_id
+            ]
+            return history[:limit]
+
+    def delete_user(self, user_id):
+        with self._lock:
+            row = self._users.pop(user_id, None)
+            if not row:
+                return []
+            del self._user_ids_by_username[row["username"]]
+            del self._user_ids_by_email[row["email"]]
+            self._rank_index.remove(user_id)
+            for prediction_id in self._prediction_ids_by_user.pop(user_id, []):
+                pred = self._predictions.pop(prediction_id)
+                self._prediction_ids_by_bet[pred["bet_id"]].remove(prediction_id)
+                del self._prediction_id_by_user_bet[(user_id, pred["bet_id"])]
+            self._transactions = [t for t in self._transactions if t["user_id"] != user_id]
+            return [dict(row)]
+
+    def change_role(self, user_id, new_role):
+        with self._lock:
+            row = self._users.get(user_id)
+            return self._update_user(row, {"role": new_role}) if row else []
+
+    def get_leaderboard_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        with self._lock:
+            return [
+                {"user_id": uid, "username": self._users[uid]["username"], "reedz_balance": balance}
+                for uid, balance in self._rank_index.page(after, limit)
+            ]
+
+    def get_rank(self, user_id, neighbours=2):
+        with self._lock:
+            window = [
+                {
+                    "user_id": uid,
+                    "username": self._users[uid]["username"],
+                    "reedz_balance": balance,
+                    "rank": self._rank_index.rank(balance),
+                    "dense_rank": self._rank_index.dense_rank(balance),
+                }
+                for uid, balance in self._rank_index.window(user_id, neighbours)
+            ]
+            return rank_entry(user_id, window)
+
+    # BET FUNCTIONS
+    def create_bet(self, bet: Bet):
+        with self._lock:
+            row = bet_row(bet)
+            row["bet_id"] = self._next_id("bets")
+            self._bets[row["bet_id"]] = row
+            self._prediction_ids_by_bet[row["bet_id"]] = []
+            return [dict(row)]
+
+    def create_bets_many(self, bets):
+        with self._lock:
+            return [row for b in bets for row in self.create_bet(b)]
+
+    def get_bet(self, bet_id):
+        with self._lock:
+            row = self._bets.get(bet_id)
+            return bet_from_row(row) if row else None
+
+    def get_bets_by_ids(self, bet_ids):
+        with self._lock:
+            return [bet_from_row(self._bets[b]) for b in set(bet_ids) if b in self._bets]
+
+    def get_bets_page(self, state, after=None, limit=DEFAULT_PAGE_SIZE):
+        with self._lock:
+            bets = (bet_from_row(b) for b in self._bets.values() if after is None or b["bet_id"] > after)
+            return list(islice((b for b in bets if not state or bet_state(b) == state), limit))
+
+    def get_bets_grouped(self):
+        with self._lock:
+            return group_bets(bet_summary_from_row(b) for _, b in sorted(self._bets.items()))
+
+    def close_bet(self, bet_id):
+        with self._lock:
+            row = self._bets.get(bet_id)
+            if not row:
+                return []
+            row.update({"is_open": False, "is_closed": True})
+            return [dict(row)]
+
+    def close_bets_many(self, bet_ids):
+        with self._lock:
+            closed = []
+            for bet_id in bet_ids:
+                row = self._bets.get(bet_id)
+                if row and not row["is_closed"] and not row["is_resolved"]:
+                    row.update({"is_open": False, "is_closed": True})
+                    closed.append(dict(row))
+            return closed
+
+    def get_pending_close_times(self):
+        with self._lock:
+            return [
+                {"bet_id": b["bet_id"], "close_at": b["close_at"]}
+                for _, b in sorted(self._bets.items())
+                if not b["is_closed"] and not b["is_resolved"] and b["close_at"] is not None
+            ]
+
+    def resolve_bet(self, bet_id, correct_answer):
+        with self._lock:
+            row = self._bets.get(bet_id)
+            if not row:
+                return []
+            row.update({"is_resolved": True, "correct_answer": correct_answer})
+            return [dict(row)]
+
+    # PREDICTION FUNCTIONS
+    def create_prediction(self, prediction: Prediction):
+        with self._lock:
+            row = prediction_row(prediction)
+            if row["bet_id"] not in self._bets:
+                raise IntegrityError("insert or update on table \"predictions\" violates foreign key constraint")
+            key = (row["user_id"], row["bet_id"])
+            if key in self._prediction_id_by_user_bet:
+                raise IntegrityError("duplicate key value violates unique constraint \"predictions_user_id_bet_id_key\"")
+            row["prediction_id"] = self._next_id("predictions")
+            self._predictions[row["prediction_id"]] = row
+            self._prediction_ids_by_bet[row["bet_id"]].append(row["prediction_id"])
+            self._prediction_ids_by_user.setdefault(row["user_id"], []).append(row["prediction_id"])
+            self._prediction_id_by_user_bet[key] = row["prediction_id"]
+            return [dict(row)]
+
+    def create_predictions_many(self, predictions):
+        with self._lock:
+            keys = set()
+            for p in predictions:
+                key = (p.user_id, p.bet_id)
+                if p.bet_id not in self._bets:
+                    raise IntegrityError("insert or update on table \"predictions\" violates foreign key constraint")
+                if key in keys or key in self._prediction_id_by_user_bet:
+                    raise IntegrityError("duplicate key value violates unique constraint \"predictions_user_id_bet_id_key\"")
+                keys.add(key)
+            return [row for p in predictions for row in self.create_prediction(p)]
+
+    def place_prediction(self, prediction: Prediction):
+        with self._lock:
+            bet = self._bets.get(prediction.bet_id)
+            if not bet or not bet_accepts_predictions(bet):
+                raise BetClosedError()
+            if (prediction.user_id, prediction.bet_id) in self._prediction_id_by_user_bet:
+                raise DuplicatePredictionError()
+            return self.create_prediction(prediction)
+
+    def get_predictions_for_bet(self, bet_id):
+        with self._lock:
+            return [
+                prediction_from_row(self._predictions[pid])
+                for pid in self._prediction_ids_by_bet.get(bet_id, [])
+            ]
+
+    def get_prediction_batch(self, bet_id, answer_type, with_usernames=False):
+        with self._lock:
+            rows = sorted(
+                (self._predictions[pid] for pid in self._prediction_ids_by_bet.get(bet_id, [])),
+                key=lambda p: (str(p["created_at"]), p["prediction_id"]),
+            )
+            if with_usernames:
+                rows = ({**p, "username": self._users.get(p["user_id"], {}).get("username")} for p in rows)
+            return prediction_batch_from_rows(bet_id, answer_type, rows, with_usernames)
+
+    def get_user_predictions(self, user_id):
+        with self._lock:
+            return [prediction_from_row(self._predictions[pid]) for pid in self._prediction_ids_by_user.get(user_id, [])]
+
+    def has_prediction(self, user_id, bet_id):
+        with self._lock:
+            return (user_id, bet_id) in self._prediction_id_by_user_bet
+
+    # EMAIL OUTBOX
+    def enqueue_email(self, to_addr, subject, body):
+        return self.enqueue_emails_many([(to_addr, subject, body)])[0]
+
+    def enqueue_emails_many(self, messages):
+        with self._lock:
+            return [self._enqueue_email(*message) for message in messages]
+
+    def _enqueue_email(self, to_addr, subject, body):
+        now = to_db_value(datetime.now(timezone.utc))
+        row = {
+            "outbox_id": self._next_id("email_outbox"),
+            "to_addr": to_addr,
+            "subject": subject,
+            "body": body,
+            "status": "queued",
+            "attempts": 0,
+            "last_error": None,
+            "next_attempt_at": now,
+            "claimed_at": None,
+            "created_at": now,
+            "sent_at": None,
+        }
+        self._emails[row["outbox_id"]] = row
+        return dict(row)
+
+    def claim_emails(self, limit, lease_seconds):
+        with self._lock:
+            now = datetime.now(timezone.utc)
+            lease_expired = now - timedelta(seconds=lease_seconds)
+            due = sorted(
+                (
+                    row for row in self._emails.values()
+                    if (row["status"] == "queued" and parse_timestamp(row["next_attempt_at"]) <= now)
+                    or (row["status"] == "sending" and parse_timestamp(row["claimed_at"]) <= lease_expired)
+                ),
+                key=lambda row: (parse_timestamp(row["next_attempt_at"]), row["outbox_id"]),
+            )[:limit]
+            for row in due:
+                row.update({"status": "sending", "claimed_at": to_db_value(now), "attempts": row["attempts"] + 1})
+            return [dict(row) for row in due]
+
+    def update_email_status(self, outbox_id, status, last_error=None, next_attempt_at=None):
+        with self._lock:
+            row = self._emails.get(outbox_id)
+            if not row:
+                return None
+            row.update({
+                "status": status,
+                "last_error": last_error,
+                "sent_at": to_db_value(datetime.now(timezone.utc)) if status == "sent" else None,
+            })
+            if next_attempt_at is not None:
+                row["next_attempt_at"] = to_db_value(next_attempt_at)
+            return dict(row)
+
+    def get_email(self, outbox_id):
+        with self._lock:
+            row = self._emails.get(outbox_id)
+            return dict(row) if row else None
+
+    # NOTIFICATION EVENTS
+    def record_notification_events(self, events):
+        with self._lock:
+            now = to_db_value(datetime.now(timezone.utc))
+            rows = []
+            for kind, bet_id in events:
+                row = {
+                    "event_id": self._next_id("notification_events"),
+                    "kind": kind,
+                    "bet_id": bet_id,
+                    "created_at": now,
+                    "digested_at": None,
+                }
+                self._events[row["event_id"]] = row
+                rows.append(dict(row))
+            return rows
+
+    def claim_notification_events(self, limit):
+        with self._lock:
+            now = to_db_value(datetime.now(timezone.utc))
+            claimed = [row for _, row in sorted(self._events.items()) if row["digested_at"] is None][:limit]
+            for row in claimed:
+                row["digested_at"] = now
+            return [dict(row) for row in claimed]
+
+    def release_notification_events(self, event_ids):
+        with self._lock:
+            released = []
+            for event_id in event_ids:
+                row = self._events.get(event_id)
+                if row:
+                    row["digested_at"] = None
+                    released.append(dict(row))
+            return released
@@ -0,0 +1,220 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models import PredictionBatch
+
+# Per-function call, error, row and latency metrics for the data layer, kept in
+# process and exported in the Prometheus text format (render_prometheus,
+# write_prometheus, or the /metrics endpoint from start_http_server). An N+1
+# loop shows up as reedz_db_calls_total for one function growing with the
+# size of a page instead of staying flat.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PORT = os.getenv("REEDZ_METRICS_PORT")
+# The endpoint has no authentication, so it only listens on loopback unless
+# REEDZ_METRICS_HOST says otherwise (e.g. 0.0.0.0 behind a firewall)
+METRICS_HOST = os.getenv("REEDZ_METRICS_HOST", "127.0.0.1")
+
+
+class FunctionMetrics:
+    def __init__(self, name, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency_sum = 0.0
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last one is +Inf
+
+    def observe(self, seconds, rows, failed):
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows
+        self.latency_sum += seconds
+        self.bucket_counts[bisect_left(self.buckets, seconds)] += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.calls:
+            return 0.0
+        target = q * self.calls
+        seen = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "function": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "avg_ms": self.latency_sum / self.calls * 1000 if self.calls else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+        }
+
+
+_lock = threading.Lock()
+_functions = {}
+
+def _metrics_for(name):
+    metrics = _functions.get(name)
+    if metrics is None:
+        metrics = _functions.setdefault(name, FunctionMetrics(name))
+    return metrics
+
+def count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        # {state: [rows]} from get_bets_grouped counts its rows; any other dict is one row
+        if result and all(isinstance(v, list) for v in result.values()):
+            return sum(len(v) for v in result.values())
+        return 1
+    if isinstance(result, (bool, int, float, str)):
+        return 0
+    if isinstance(result, PredictionBatch):
+        return len(result)
+    return 1
+
+def record(name, seconds, rows=0, failed=False):
+    with _lock:
+        _metrics_for(name).observe(seconds, rows, failed)
+
+def instrument(func, name=None):
+    name = name or func.__name__
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                record(name, time.perf_counter() - start, failed=True)
+                raise
+            record(name, time.perf_counter() - start, count_rows(result))
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            record(name, time.perf_counter() - start, failed=True)
+            raise
+        record(name, time.perf_counter() - start, count_rows(result))
+        return result
+    return wrapper
+
+def instrument_module(namespace, exclude=(), prefix=""):
+    # Wraps every public function defined in the module whose globals() is
+    # `namespace`; calls between those functions go through the wrappers too
+    module = namespace["__name__"]
+    for attr, value in list(namespace.items()):
+        if attr.startswith("_") or attr in exclude:
+            continue
+        if inspect.isfunction(value) and value.__module__ == module:
+            namespace[attr] = instrument(value, prefix + attr)
+
+def snapshot():
+    with _lock:
+        return sorted((m.snapshot() for m in _functions.values()), key=lambda m: m["function"])
+
+def reset():
+    with _lock:
+        _functions.clear()
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _gauges():
+    # Counters kept by other modules, exported alongside the function metrics
+    import auth
+    import email_sender
+    import rate_limit
+    import supabase_db
+    return {
+        "reedz_http": supabase_db.client_stats(),
+        "reedz_user_cache": supabase_db.user_cache_stats(),
+        "reedz_bcrypt": auth.bcrypt_stats(),
+        "reedz_email": email_sender.outbox_stats(),
+        "reedz_rate_limit": rate_limit.rate_limit_stats(),
+    }
+
+def render_prometheus():
+    with _lock:
+        functions = sorted(_functions.values(), key=lambda m: m.name)
+        lines = [
+            "# HELP reedz_db_calls_total Data-layer function calls.",
+            "# TYPE reedz_db_calls_total counter",
+        ]
+        lines += [f'reedz_db_calls_total{{function="{_label(m.name)}"}} {m.calls}' for m in functions]
+        lines += [
+            "# HELP reedz_db_errors_total Data-layer calls that raised.",
+            "# TYPE reedz_db_errors_total counter",
+        ]
+        lines += [f'reedz_db_errors_total{{function="{_label(m.name)}"}} {m.errors}' for m in functions]
+        lines += [
+            "# HELP reedz_db_rows_total Rows returned by data-layer calls.",
+            "# TYPE reedz_db_rows_total counter",
+        ]
+        lines += [f'reedz_db_rows_total{{function="{_label(m.name)}"}} {m.rows}' for m in functions]
+        lines += [
+            "# HELP reedz_db_latency_seconds Data-layer call latency.",
+            "# TYPE reedz_db_latency_seconds histogram",
+        ]
+        for m in functions:
+            label = _label(m.name)
+            cumulative = 0
+            for bound, count in zip(m.buckets + (float("inf"),), m.bucket_counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'reedz_db_latency_seconds_bucket{{function="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'reedz_db_latency_seconds_sum{{function="{label}"}} {m.latency_sum}')
+            lines.append(f'reedz_db_latency_seconds_count{{function="{label}"}} {m.calls}')
+    for prefix, values in _gauges().items():
+        for key, value in values.items():
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    # Atomic replace, for node_exporter's textfile collector
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host=METRICS_HOST):
+    server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
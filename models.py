@@ -1,46 +1,203 @@
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+# Immutable, slotted row types. Use dataclasses.replace() to change a field.
+# Every query maps its rows through the *_from_row functions below, which parse
+# timestamps once into aware datetimes.
+
+@dataclass(frozen=True, slots=True)
 class User:
-    def __init__(self, user_id, username, password, email, reedz_balance, role, created_at):
-        self.user_id = user_id
-        self.username = username
-        self.password = password
-        self.email = email
-        self.reedz_balance = reedz_balance
-        self.role = role
-        self.created_at = created_at
+    user_id: int
+    username: str
+    password: str
+    email: str
+    reedz_balance: int
+    role: str
+    created_at: datetime
 
+@dataclass(frozen=True, slots=True)
 class Prediction:
-    def __init__(self, prediction_id, user_id, bet_id, prediction, created_at):
-        self.prediction_id = prediction_id
-        self.user_id = user_id
-        self.bet_id = bet_id
-        self.prediction = prediction
-        self.created_at = created_at
+    prediction_id: int
+    user_id: int
+    bet_id: int
+    prediction: str
+    created_at: datetime
 
+@dataclass(frozen=True, slots=True)
 class Bet:
-    def __init__(
-        self,
-        bet_id,
-        created_by_user_id,
-        title,
-        description,
-        answer_type,
-        is_open,
-        is_resolved,
-        created_at,
-        close_at,
-        resolved_at=None,
-        correct_answer=None,
-        is_closed=False,
-    ):
+    bet_id: int
+    created_by_user_id: int
+    title: str
+    description: str
+    answer_type: str
+    is_open: bool
+    is_resolved: bool
+    created_at: datetime
+    close_at: datetime
+    resolved_at: datetime = None
+    correct_answer: str = None
+    is_closed: bool = False
+
+# The columns the overview screens render (repository.BET_SUMMARY_COLUMNS)
+@dataclass(frozen=True, slots=True)
+class BetSummary:
+    bet_id: int
+    title: str
+    answer_type: str
+    correct_answer: str
+    is_open: bool
+    is_closed: bool
+    is_resolved: bool
+    close_at: datetime
+
+# Every prediction on one bet, stored column-wise for bets with tens of
+# thousands of entries. Number predictions are parsed once into a float64
+# buffer (NaN when unparseable); text predictions are stored as codes into
+# `keys`, the distinct normalized answers. The arrays support the buffer
+# protocol, so scoring reads them with np.frombuffer without copying.
+class PredictionBatch:
+    __slots__ = ("bet_id", "answer_type", "prediction_ids", "user_ids", "values", "codes", "keys", "created_at", "usernames")
+
+    def __init__(self, bet_id, answer_type, with_usernames=False):
         self.bet_id = bet_id
-        self.created_by_user_id = created_by_user_id
-        self.title = title
-        self.description = description
         self.answer_type = answer_type
-        self.is_open = is_open
-        self.is_resolved = is_resolved
-        self.created_at = created_at
-        self.close_at = close_at
-        self.resolved_at = resolved_at
-        self.correct_answer = correct_answer
-        self.is_closed = is_closed
+        self.prediction_ids = array("q")
+        self.user_ids = array("q")
+        self.values = array("d")      # number bets
+        self.codes = array("q")       # text bets, index into keys
+        self.keys = []
+        self.created_at = array("q")  # microseconds since the Unix epoch, MISSING_MICROS if unknown
+        self.usernames = [] if with_usernames else None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def extend(self, rows):
+        # rows are prediction dicts (with "username" when the batch keeps them)
+        codes = {key: code for code, key in enumerate(self.keys)}
+        for row in rows:
+            self.prediction_ids.append(row["prediction_id"])
+            self.user_ids.append(row["user_id"])
+            if self.answer_type == "number":
+                self.values.append(parse_number(row["prediction"]))
+            else:
+                key = normalize_answer(row["prediction"])
+                code = codes.get(key)
+                if code is None:
+                    code = codes[key] = len(self.keys)
+                    self.keys.append(key)
+                self.codes.append(code)
+            self.created_at.append(epoch_micros(parse_timestamp(row["created_at"])))
+            if self.usernames is not None:
+                self.usernames.append(row["username"])
+        return self
+
+    def key_code(self, answer):
+        # Code of a text answer in this batch, or -1 if nobody predicted it
+        try:
+            return self.keys.index(normalize_answer(answer))
+        except ValueError:
+            return -1
+
+    def prediction_labels(self):
+        if self.answer_type == "number":
+            return [format_number(v) for v in self.values]
+        return [self.keys[c] for c in self.codes]
+
+    def created_at_datetimes(self):
+        return [EPOCH + timedelta(microseconds=us) if us != MISSING_MICROS else None for us in self.created_at]
+
+BET_STATES = ("open", "closed", "resolved")
+
+# The single place that decides which bucket a bet falls into
+def bet_state(bet):
+    if bet.is_resolved:
+        return "resolved"
+    if bet.is_closed:
+        return "closed"
+    return "open"
+
+# Timestamps without an offset are stored as UTC (see timestamper.format_et)
+def parse_timestamp(value):
+    if value is None:
+        return None
+    dt = datetime.fromisoformat(value) if isinstance(value, str) else value
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Stands in for a missing timestamp in microsecond columns (the value pandas
+# uses for NaT), so it is never mistaken for the epoch itself
+MISSING_MICROS = -2**63
+
+def epoch_micros(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1) if dt is not None else MISSING_MICROS
+
+def normalize_answer(value):
+    return str(value).strip().lower()
+
+def parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+def format_number(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def user_from_row(row):
+    return User(
+        user_id=row["user_id"],
+        username=row["username"],
+        password=row["password"],
+        email=row["email"],
+        reedz_balance=row["reedz_balance"],
+        role=row["role"],
+        created_at=parse_timestamp(row["created_at"]),
+    )
+
+def bet_from_row(row):
+    return Bet(
+        bet_id=row["bet_id"],
+        created_by_user_id=row["created_by_user_id"],
+        title=row["title"],
+        description=row["description"],
+        answer_type=row["answer_type"],
+        is_open=bool(row["is_open"]),
+        is_resolved=bool(row["is_resolved"]),
+        is_closed=bool(row.get("is_closed", False)),
+        created_at=parse_timestamp(row["created_at"]),
+        close_at=parse_timestamp(row["close_at"]),
+        resolved_at=parse_timestamp(row["resolved_at"]),
+        correct_answer=row["correct_answer"],
+    )
+
+def bet_summary_from_row(row):
+    return BetSummary(
+        bet_id=row["bet_id"],
+        title=row["title"],
+        answer_type=row["answer_type"],
+        correct_answer=row["correct_answer"],
+        is_open=bool(row["is_open"]),
+        is_closed=bool(row["is_closed"]),
+        is_resolved=bool(row["is_resolved"]),
+        close_at=parse_timestamp(row["close_at"]),
+    )
+
+def prediction_from_row(row):
+    return Prediction(
+        prediction_id=row["prediction_id"],
+        user_id=row["user_id"],
+        bet_id=row["bet_id"],
+        prediction=row["prediction"],
+        created_at=parse_timestamp(row["created_at"]),
+    )
+
+# Reedz history rows stay dicts; only the timestamp is parsed
+def reedz_txn_from_row(row):
+    return {**row, "created_at": parse_timestamp(row["created_at"])}
+
+def prediction_batch_from_rows(bet_id, answer_type, rows, with_usernames=False):
+    return PredictionBatch(bet_id, answer_type, with_usernames).extend(rows)
@@ -0,0 +1,177 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+
+import email_sender
+import scoring
+import supabase_db
+import timestamper
+from models import bet_state
+
+logger = logging.getLogger(__name__)
+
+# Bet notifications, sent as one digest email per user. create_bet and
+# resolve_bet only record one event row per bet. send_digests() claims the
+# pending events, works out who each one concerns (every user for a new bet,
+# the predictors for a resolved one) and queues a single message per
+# recipient through the email outbox, whose worker sends them over its warm
+# SMTP connection. Mail volume grows with users, not users x events.
+#
+# Usage for cron instead of the in-app worker:
+#   python notifications.py
+DIGESTS_ENABLED = os.getenv("REEDZ_DIGESTS", "1") not in ("0", "false", "no")
+DIGEST_INTERVAL_SECONDS = float(os.getenv("REEDZ_DIGEST_INTERVAL_SECONDS", "3600"))
+DIGEST_EVENT_LIMIT = 1000
+DIGEST_MAX_NEW_BETS = 20
+
+BET_CREATED = "bet_created"
+BET_RESOLVED = "bet_resolved"
+
+
+def record_bets_created(rows):
+    # Called with the rows returned by create_bet/create_bets_many
+    events = [(BET_CREATED, row["bet_id"]) for row in rows or [] if row.get("bet_id") is not None]
+    return supabase_db.record_notification_events(events) if events else []
+
+def record_bet_resolved(bet_id):
+    return supabase_db.record_notification_events([(BET_RESOLVED, bet_id)])
+
+def collect_digests(events):
+    # Returns (new_bets, {user_id: [(bet, prediction, reedz)]}); one read for
+    # all the events' bets and one prediction batch per resolved bet
+    bets = {bet.bet_id: bet for bet in supabase_db.get_bets_by_ids({event["bet_id"] for event in events})}
+    new_bets = []
+    resolved = {}
+    seen = set()
+    for event in events:
+        key = (event["kind"], event["bet_id"])
+        if key in seen:
+            continue
+        seen.add(key)
+        bet = bets.get(event["bet_id"])
+        if bet is None:
+            continue
+        if event["kind"] == BET_CREATED and bet_state(bet) == "open":
+            new_bets.append(bet)
+        elif event["kind"] == BET_RESOLVED and bet.is_resolved:
+            predictions = supabase_db.get_prediction_batch(bet.bet_id, bet.answer_type)
+            payouts = scoring.compute_payouts(bet, predictions)
+            for user_id, label in zip(predictions.user_ids, predictions.prediction_labels()):
+                resolved.setdefault(user_id, []).append((bet, label, payouts.get(user_id, 0)))
+    return new_bets, resolved
+
+def format_digest(username, resolved, new_bets):
+    counts = []
+    sections = []
+    if resolved:
+        counts.append(f"{len(resolved)} resolved")
+        sections.append("Resolved bets:\n" + "\n".join(
+            f"- {bet.title}: the answer was {bet.correct_answer}. You predicted {prediction} and earned {reedz} Reedz."
+            for bet, prediction, reedz in resolved
+        ))
+    if new_bets:
+        counts.append(f"{len(new_bets)} new")
+        lines = [
+            f"- {bet.title}" + (f" (closes {timestamper.format_et(bet.close_at)})" if bet.close_at else "")
+            for bet in new_bets[:DIGEST_MAX_NEW_BETS]
+        ]
+        if len(new_bets) > DIGEST_MAX_NEW_BETS:
+            lines.append(f"...and {len(new_bets) - DIGEST_MAX_NEW_BETS} more")
+        sections.append("New bets open for predictions:\n" + "\n".join(lines))
+    subject = f"Your Reedz digest: {', '.join(counts)} bets"
+    body = f"Hi {username},\n\n" + "\n\n".join(sections) + "\n"
+    return subject, body
+
+def build_digest_messages(events):
+    # [(to_addr, subject, body)], at most one per user
+    new_bets, resolved = collect_digests(events)
+    if not new_bets and not resolved:
+        return []
+    messages = []
+    for user in supabase_db.iter_users():
+        user_resolved = resolved.get(user["user_id"], [])
+        if user["email"] and (user_resolved or new_bets):
+            messages.append((user["email"], *format_digest(user["username"], user_resolved, new_bets)))
+    return messages
+
+def send_digests(event_limit=DIGEST_EVENT_LIMIT):
+    # One digest run over the pending events; returns the number of digests queued
+    events = supabase_db.claim_notification_events(event_limit)
+    if not events:
+        return 0
+    try:
+        messages = build_digest_messages(events)
+        # One insert, so either every digest is queued or none is and the
+        # events can be handed back without anyone getting a digest twice
+        email_sender.queue_emails(messages)
+    except Exception:
+        # Hand the events to the next run
+        supabase_db.release_notification_events([event["event_id"] for event in events])
+        raise
+    return len(messages)
+
+
+class DigestWorker:
+    def __init__(self, interval_seconds=DIGEST_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.digests_queued = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="notification-digests", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.digests_queued += send_digests()
+            except Exception:
+                logger.exception("Sending notification digests failed; retrying in %.0fs", self.interval_seconds)
+            self._stopping.wait(self.interval_seconds)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_digest_worker(interval_seconds=DIGEST_INTERVAL_SECONDS):
+    # One worker per process; safe to call on every Streamlit rerun
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = DigestWorker(interval_seconds)
+        return _worker.start()
+
+def stop_digest_worker(timeout=None):
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop(timeout)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue Reedz notification digests and send the email outbox.")
+    parser.add_argument("--no-send", action="store_true", help="Only queue the digests; leave sending to the app's outbox worker")
+    args = parser.parse_args(argv)
+    queued = send_digests()
+    print(f"Queued {queued} digests.")
+    if not args.no_send:
+        print(f"Attempted {email_sender.deliver_queued_emails()} queued emails.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
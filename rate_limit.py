@@ -0,0 +1,125 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# In-process token buckets that turn away login and password-reset requests
+# before they reach the database, bcrypt or SMTP. A bucket holds up to `burst`
+# tokens and refills at burst/period tokens per second; each request takes one.
+# Every limiter keeps its buckets in an LRU map of at most RATE_LIMIT_MAX_KEYS
+# entries, so a script cycling through usernames or addresses cannot grow
+# memory: the least recently seen bucket is dropped first. Limits are per
+# server process.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("REEDZ_RATE_LIMIT_MAX_KEYS", "10000"))
+
+def parse_rate(value):
+    # "5/60" -> 5 requests per 60 seconds
+    burst, period = value.split("/")
+    return int(burst), float(period)
+
+LOGIN_RATE_PER_USERNAME = parse_rate(os.getenv("REEDZ_LOGIN_RATE_PER_USERNAME", "5/60"))
+LOGIN_RATE_PER_CLIENT = parse_rate(os.getenv("REEDZ_LOGIN_RATE_PER_CLIENT", "20/60"))
+RESET_RATE_PER_EMAIL = parse_rate(os.getenv("REEDZ_RESET_RATE_PER_EMAIL", "3/900"))
+RESET_RATE_PER_CLIENT = parse_rate(os.getenv("REEDZ_RESET_RATE_PER_CLIENT", "10/900"))
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# Anyone can send that header, so it is ignored unless this is set; then the
+# entry added by the outermost trusted proxy is the client.
+TRUSTED_PROXIES = int(os.getenv("REEDZ_TRUSTED_PROXIES", "0"))
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Too many attempts, please try again in {math.ceil(retry_after)} seconds")
+
+
+class TokenBucketLimiter:
+    def __init__(self, name, burst, period, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.name = name
+        self.burst = burst
+        self.rate = burst / period
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def acquire(self, key):
+        # 0.0 when the request may go ahead, otherwise the seconds until it could
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        return wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "keys": len(self._buckets),
+                "evicted": self.evicted,
+            }
+
+
+login_by_username = TokenBucketLimiter("login_username", *LOGIN_RATE_PER_USERNAME)
+login_by_client = TokenBucketLimiter("login_client", *LOGIN_RATE_PER_CLIENT)
+reset_by_email = TokenBucketLimiter("reset_email", *RESET_RATE_PER_EMAIL)
+reset_by_client = TokenBucketLimiter("reset_client", *RESET_RATE_PER_CLIENT)
+LIMITERS = (login_by_username, login_by_client, reset_by_email, reset_by_client)
+
+def client_address(peer, forwarded_for=None, trusted_proxies=TRUSTED_PROXIES):
+    # The per-client key: the socket peer, or with trusted proxies the address
+    # they recorded. Behind an untrusted or unconfigured proxy the peer is the
+    # proxy, so every client shares one bucket.
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return peer
+
+def normalize_key(value):
+    return str(value).strip().lower()
+
+def check(*limits):
+    # limits are (limiter, key) pairs, taken in order; a None key is skipped.
+    # The client goes first so one client's flood does not drain the buckets
+    # of the accounts it targets.
+    for limiter, key in limits:
+        if key is None:
+            continue
+        wait = limiter.acquire(normalize_key(key))
+        if wait:
+            raise RateLimitedError(wait)
+
+def check_login(username, client=None):
+    check((login_by_client, client), (login_by_username, username))
+
+def check_reset(email, client=None):
+    check((reset_by_client, client), (reset_by_email, email))
+
+def rate_limit_stats():
+    # Flat {"<limiter>_<counter>": value} for metrics and the diagnostics panel
+    return {f"{limiter.name}_{key}": value for limiter in LIMITERS for key, value in limiter.stats().items()}
+
+def reset():
+    for limiter in LIMITERS:
+        limiter.reset()
@@ -0,0 +1,360 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from models import User, Bet, Prediction, BET_STATES, bet_state, parse_timestamp
+
+BACKENDS = ("supabase", "sqlite", "memory")
+
+# Kept below PostgREST's default max-rows (1000) so a short page always means
+# the end of the result set
+DEFAULT_PAGE_SIZE = 500
+
+# Columns the overview screens actually render
+BET_SUMMARY_COLUMNS = (
+    "bet_id", "title", "answer_type", "correct_answer",
+    "is_open", "is_closed", "is_resolved", "close_at",
+)
+
+class DuplicatePredictionError(Exception):
+    def __init__(self, message="Only one prediction per user per bet"):
+        super().__init__(message)
+
+class BetClosedError(Exception):
+    def __init__(self, message="This bet is no longer open for predictions"):
+        super().__init__(message)
+
+def to_db_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def bet_accepts_predictions(row, now=None):
+    if row["is_closed"] or row["is_resolved"]:
+        return False
+    close_at = parse_timestamp(row["close_at"])
+    return close_at is None or close_at > (now or datetime.now(timezone.utc))
+
+def user_cursor(row):
+    return row["user_id"]
+
+def leaderboard_cursor(row):
+    return (row["reedz_balance"], row["user_id"])
+
+def bet_cursor(bet):
+    return bet.bet_id
+
+def iter_pages(fetch_page, cursor_of, page_size=DEFAULT_PAGE_SIZE):
+    after = None
+    while True:
+        rows = fetch_page(after, page_size)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = cursor_of(rows[-1])
+
+def group_bets(bets):
+    grouped = {state: [] for state in BET_STATES}
+    for bet in bets:
+        grouped[bet_state(bet)].append(bet)
+    return grouped
+
+def user_row(user: User):
+    return {
+        "username": user.username,
+        "password": user.password,
+        "email": user.email,
+        "reedz_balance": user.reedz_balance,
+        "role": user.role,
+        "created_at": to_db_value(user.created_at),
+    }
+
+def bet_row(bet: Bet):
+    return {
+        "created_by_user_id": bet.created_by_user_id,
+        "title": bet.title,
+        "description": bet.description,
+        "answer_type": bet.answer_type,
+        "is_open": bet.is_open,
+        "is_resolved": bet.is_resolved,
+        "is_closed": bet.is_closed,
+        "created_at": to_db_value(bet.created_at),
+        "close_at": to_db_value(bet.close_at),
+        "resolved_at": to_db_value(bet.resolved_at),
+        "correct_answer": bet.correct_answer,
+    }
+
+def prediction_row(prediction: Prediction):
+    return {
+        "user_id": prediction.user_id,
+        "bet_id": prediction.bet_id,
+        "prediction": prediction.prediction,
+        "created_at": to_db_value(prediction.created_at),
+    }
+
+
+class Repository(ABC):
+    # Storage interface used by supabase_db. A backend that leaves an abstract
+    # method out fails when it is instantiated, not on first use. Write methods
+    # return the affected rows as dicts. Lookups of whole rows return model objects built by the
+    # models.*_from_row mappers; projections that join or trim columns (user
+    # lists, leaderboard, predictions with usernames) return plain dicts.
+
+    def client_stats(self):
+        # Request/retry/latency counters for backends that talk to a server
+        return {}
+
+    # USER FUNCTIONS
+    @abstractmethod
+    def create_user(self, user: User):
+        ...
+
+    def list_all_users(self):
+        return list(iter_pages(self.list_users_page, user_cursor))
+
+    @abstractmethod
+    def get_user_by_username(self, username):
+        ...
+
+    @abstractmethod
+    def get_user_by_email(self, email):
+        ...
+
+    @abstractmethod
+    def get_user_by_id(self, user_id):
+        ...
+
+    @abstractmethod
+    def update_user_password(self, user_id, hashed_password):
+        ...
+
+    @abstractmethod
+    def update_user_password_by_email(self, email, hashed_password):
+        ...
+
+    @abstractmethod
+    def update_user_email(self, user_id, new_email):
+        ...
+
+    @abstractmethod
+    def set_user_reset_code(self, email, code, expiry):
+        ...
+
+    @abstractmethod
+    def get_reset_code(self, email):
+        # Returns {"reset_code": ..., "reset_code_expiry": ...} or None
+        ...
+
+    @abstractmethod
+    def clear_reset_code(self, email):
+        ...
+
+    def check_reset_code(self, email, code):
+        user = self.get_reset_code(email)
+        if not user:
+            return False
+        stored_code = user.get("reset_code")
+        expiry = user.get("reset_code_expiry")
+        if not stored_code or not expiry or stored_code != code:
+            return False
+        try:
+            expiry_dt = datetime.fromisoformat(expiry) if isinstance(expiry, str) else expiry
+            if expiry_dt.tzinfo is None:
+                expiry_dt = expiry_dt.replace(tzinfo=timezone.utc)
+        except Exception:
+            self.clear_reset_code(email)
+            return False
+
+        now_utc = datetime.now(timezone.utc)
+        if expiry_dt < now_utc - timedelta(minutes=5):
+            self.clear_reset_code(email)
+            return False
+        return True
+
+    @abstractmethod
+    def add_reedz(self, user_id, delta, reason="adjustment", bet_id=None):
+        ...
+
+    @abstractmethod
+    def set_reedz_balance(self, user_id, new_balance, reason="admin_adjustment"):
+        ...
+
+    @abstractmethod
+    def add_reedz_many(self, deltas, reason="bet_payout", bet_id=None, idempotency_key=None):
+        # A call whose idempotency_key was already applied changes nothing
+        # and returns []
+        ...
+
+    @abstractmethod
+    def get_reedz_history(self, user_id, limit=50):
+        ...
+
+    @abstractmethod
+    def delete_user(self, user_id):
+        ...
+
+    @abstractmethod
+    def change_role(self, user_id, new_role):
+        ...
+
+    def get_leaderboard(self):
+        return list(iter_pages(self.get_leaderboard_page, leaderboard_cursor))
+
+    # Keyset-paginated readers. Each returns at most `limit` rows that sort
+    # strictly after `after`, which is the cursor of the last row of the
+    # previous page (None for the first page).
+    @abstractmethod
+    def list_users_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        # Ordered by user_id; cursor is user_id
+        ...
+
+    @abstractmethod
+    def get_leaderboard_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        # Ordered by reedz_balance desc, user_id; cursor is (reedz_balance, user_id)
+        ...
+
+    @abstractmethod
+    def get_bets_page(self, state, after=None, limit=DEFAULT_PAGE_SIZE):
+        # Bet objects ordered by bet_id; cursor is bet_id
+        ...
+
+    @abstractmethod
+    def get_rank(self, user_id, neighbours=2):
+        # The user's leaderboard row with "rank" (competition) and "dense_rank",
+        # plus "above"/"below" lists of up to `neighbours` ranked rows each.
+        # None if the user does not exist.
+        ...
+
+    # BET FUNCTIONS
+    @abstractmethod
+    def create_bet(self, bet: Bet):
+        ...
+
+    @abstractmethod
+    def create_bets_many(self, bets):
+        # Multi-row insert; all-or-nothing per call
+        ...
+
+    @abstractmethod
+    def get_bet(self, bet_id):
+        ...
+
+    @abstractmethod
+    def get_bets_by_ids(self, bet_ids):
+        # Bet objects for the ids that exist, in one round trip; missing ids are skipped
+        ...
+
+    def get_bets_by_state(self, state):
+        return list(iter_pages(lambda after, limit: self.get_bets_page(state, after, limit), bet_cursor))
+
+    @abstractmethod
+    def get_bets_grouped(self):
+        # One fetch of BET_SUMMARY_COLUMNS, returned as {state: [BetSummary]}
+        ...
+
+    @abstractmethod
+    def close_bet(self, bet_id):
+        ...
+
+    @abstractmethod
+    def close_bets_many(self, bet_ids):
+        # One update for all ids; bets already closed or resolved are skipped.
+        # Returns the rows that were closed.
+        ...
+
+    @abstractmethod
+    def get_pending_close_times(self):
+        # [{"bet_id", "close_at"}] for every open bet that has a deadline
+        ...
+
+    @abstractmethod
+    def resolve_bet(self, bet_id, correct_answer):
+        ...
+
+    # PREDICTION FUNCTIONS
+    @abstractmethod
+    def create_prediction(self, prediction: Prediction):
+        ...
+
+    @abstractmethod
+    def create_predictions_many(self, predictions):
+        # Multi-row insert; all-or-nothing per call
+        ...
+
+    @abstractmethod
+    def place_prediction(self, prediction: Prediction):
+        # Single atomic insert that only succeeds while the bet accepts
+        # predictions. Raises BetClosedError or DuplicatePredictionError.
+        ...
+
+    @abstractmethod
+    def get_predictions_for_bet(self, bet_id):
+        ...
+
+    @abstractmethod
+    def get_prediction_batch(self, bet_id, answer_type, with_usernames=False):
+        # Every prediction on the bet as one models.PredictionBatch, ordered
+        # by created_at, prediction_id; no per-row objects are kept
+        ...
+
+    @abstractmethod
+    def get_user_predictions(self, user_id):
+        ...
+
+    @abstractmethod
+    def has_prediction(self, user_id, bet_id):
+        ...
+
+
+    # EMAIL OUTBOX (see email_sender.py)
+    @abstractmethod
+    def enqueue_email(self, to_addr, subject, body):
+        # Returns the new outbox row, status "queued" and due immediately
+        ...
+
+    @abstractmethod
+    def claim_emails(self, limit, lease_seconds):
+        # Marks up to `limit` due messages "sending", increments their
+        # attempts and returns them. Due means "queued" with next_attempt_at
+        # in the past, or "sending" with a claim older than lease_seconds.
+        ...
+
+    @abstractmethod
+    def update_email_status(self, outbox_id, status, last_error=None, next_attempt_at=None):
+        # "queued" (retry at next_attempt_at), "sent" or "failed"
+        ...
+
+    @abstractmethod
+    def enqueue_emails_many(self, messages):
+        # [(to_addr, subject, body)] in one insert; returns the outbox rows
+        ...
+
+    @abstractmethod
+    def get_email(self, outbox_id):
+        ...
+
+    # NOTIFICATION EVENTS (see notifications.py)
+    @abstractmethod
+    def record_notification_events(self, events):
+        # [(kind, bet_id)] in one insert; returns the event rows
+        ...
+
+    @abstractmethod
+    def claim_notification_events(self, limit):
+        # Stamps digested_at on up to `limit` undigested events, oldest first,
+        # and returns them; each event is handed to exactly one digest run
+        ...
+
+    @abstractmethod
+    def release_notification_events(self, event_ids):
+        # Undoes a claim after a digest run failed
+        ...
+
+
+def create_repository(name, **options):
+    if name == "supabase":
+        from supabase_backend import SupabaseRepository
+        return SupabaseRepository.from_env(**options)
+    if name == "sqlite":
+        from sqlite_backend import SqliteRepository
+        return SqliteRepository(**options)
+    if name == "memory":
+        from memory_backend import MemoryRepository
+        return MemoryRepository(**options)
+    raise ValueError(f"Unknown storage backend {name!r}, expected one of {', '.join(BACKENDS)}")
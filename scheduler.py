@@ -0,0 +1,161 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import supabase_db
+from repository import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Closes bets when their close_at passes. Deadlines are kept in a min-heap and
+# the worker thread sleeps on a condition variable until the earliest one, so
+# the bets table is read once at start-up and then only every RESYNC_SECONDS
+# to pick up bets created by other processes (bulk imports, other app
+# instances). Bets created here are pushed onto the heap directly.
+AUTO_CLOSE_ENABLED = os.getenv("REEDZ_AUTO_CLOSE", "1") not in ("0", "false", "no")
+RESYNC_SECONDS = float(os.getenv("REEDZ_SCHEDULER_RESYNC_SECONDS", "300"))
+RETRY_SECONDS = 5.0
+
+
+class BetCloseScheduler:
+    def __init__(self, resync_seconds=RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        self._heap = []  # (close_at, bet_id)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._next_resync = 0.0
+        self.closed_count = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return self
+            self._stopping = False
+            self._next_resync = 0.0
+            self._thread = threading.Thread(target=self._run, name="bet-close-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def reload(self):
+        # Rebuilds the heap from the database, so deadlines survive restarts
+        entries = [
+            (parse_timestamp(row["close_at"]), row["bet_id"])
+            for row in supabase_db.get_pending_close_times()
+        ]
+        heapq.heapify(entries)
+        with self._cond:
+            self._heap = entries
+            self._next_resync = time.monotonic() + self.resync_seconds
+            self._cond.notify_all()
+        return len(entries)
+
+    def schedule(self, bet_id, close_at):
+        if bet_id is None or close_at is None:
+            return
+        entry = (parse_timestamp(close_at), bet_id)
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify_all()
+
+    def schedule_rows(self, rows):
+        for row in rows or []:
+            self.schedule(row.get("bet_id"), row.get("close_at"))
+
+    def close_due(self, now=None):
+        # Pops every deadline that has passed and closes those bets in one update
+        now = now or datetime.now(timezone.utc)
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+        if not due:
+            return []
+        try:
+            closed = supabase_db.close_bets_many(sorted(set(due)))
+        except Exception:
+            retry_at = datetime.fromtimestamp(now.timestamp() + RETRY_SECONDS, timezone.utc)
+            with self._cond:
+                for bet_id in due:
+                    heapq.heappush(self._heap, (retry_at, bet_id))
+            raise
+        self.closed_count += len(closed)
+        return [row["bet_id"] for row in closed]
+
+    def _seconds_until_next_event(self):
+        waits = [self._next_resync - time.monotonic()]
+        if self._heap:
+            waits.append((self._heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+        return min(waits)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    delay = self._seconds_until_next_event()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopping:
+                    return
+            try:
+                if time.monotonic() >= self._next_resync:
+                    self.reload()
+                self.close_due()
+            except Exception:
+                logger.exception("Auto-closing bets failed; retrying in %.0fs", RETRY_SECONDS)
+                with self._cond:
+                    self._next_resync = max(self._next_resync, time.monotonic() + RETRY_SECONDS)
+                    self._cond.wait(RETRY_SECONDS)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    return _scheduler
+
+def start_scheduler(resync_seconds=RESYNC_SECONDS):
+    # One scheduler per process; safe to call on every Streamlit rerun
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BetCloseScheduler(resync_seconds)
+        return _scheduler.start()
+
+def stop_scheduler(timeout=None):
+    global _scheduler
+    with _scheduler_lock:
+        scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        scheduler.stop(timeout)
+
+def schedule_bets(rows):
+    # Called with the rows returned by create_bet/create_bets_many
+    if _scheduler is not None:
+        _scheduler.schedule_rows(rows)
+
+def close_due_bets(now=None):
+    # One-shot pass for cron jobs or scripts that do not run the thread
+    scheduler = BetCloseScheduler()
+    scheduler.reload()
+    return scheduler.close_due(now)
@@ -1,45 +1,47 @@
+import numpy as np
 import supabase_db
-from collections import defaultdict
 
-def distribute_reedz_on_resolution(bet_id):
-    bet = supabase_db.get_bet(bet_id)
-    predictions = supabase_db.get_predictions_for_bet(bet_id)
+EXACT_MATCH_BONUS = 5
+
+# Rank points for number bets: the closest predictions get num_predictions
+# points, and each following group of equal error gets num_predictions minus
+# the number of predictions ranked ahead of it. Exact hits earn a bonus on top.
+# One sort via np.unique, so O(n log n) with no per-prediction Python work.
+def number_rank_points(values, correct):
+    errors = np.abs(values - correct)
+    _, group_of, group_sizes = np.unique(errors, return_inverse=True, return_counts=True)
+    ranked_ahead = np.cumsum(group_sizes) - group_sizes
+    points = len(values) - ranked_ahead[group_of.ravel()]
+    return points + np.where(values == correct, EXACT_MATCH_BONUS, 0)
+
+def compute_payouts(bet, predictions):
+    # Returns {user_id: reedz} for every prediction in the bet's PredictionBatch.
+    # Reads the batch's arrays in place; no per-prediction objects are built.
     num_predictions = len(predictions)
+    payouts = {}
     if num_predictions == 0:
-        return
+        return payouts
     if bet.answer_type == 'number':
-        correct = float(bet.correct_answer)
-        sorted_preds = sorted(
-            [(abs(float(pred.prediction) - correct), pred) for pred in predictions],
-            key=lambda x: x[0]
-        )
-        error_groups = defaultdict(list)
-        for dist, pred in sorted_preds:
-            error_groups[dist].append(pred)
-        scores = {}
-        given = 0
-        positions = sorted(error_groups.keys())
-        for error in positions:
-            users_in_group = error_groups[error]
-            rank_points = num_predictions - given
-            for pred in users_in_group:
-                scores[pred.user_id] = rank_points
-                if float(pred.prediction) == correct:
-                    scores[pred.user_id] += 5
-            given += len(users_in_group)
-        for pred in predictions:
-            supabase_db.add_reedz(pred.user_id, scores[pred.user_id])
+        values = np.frombuffer(predictions.values, dtype=np.float64)
+        points = number_rank_points(values, float(bet.correct_answer))
     elif bet.answer_type == 'text':
-        correct_answer = bet.correct_answer.strip().lower()
-        matches = []
-        nonmatches = []
-        for pred in predictions:
-            if pred.prediction.strip().lower() == correct_answer:
-                matches.append(pred)
-            else:
-                nonmatches.append(pred)
-        num = len(matches) + len(nonmatches)
-        for pred in matches:
-            supabase_db.add_reedz(pred.user_id, num + 5)
-        for pred in nonmatches:
-            supabase_db.add_reedz(pred.user_id, 0)
+        codes = np.frombuffer(predictions.codes, dtype=np.int64)
+        hits = codes == predictions.key_code(bet.correct_answer)
+        points = np.where(hits, num_predictions + EXACT_MATCH_BONUS, 0)
+    else:
+        return payouts
+    user_ids = np.frombuffer(predictions.user_ids, dtype=np.int64)
+    for user_id, pts in zip(user_ids.tolist(), points.tolist()):
+        payouts[user_id] = payouts.get(user_id, 0) + pts
+    return payouts
+
+def distribute_reedz_on_resolution(bet_id):
+    bet = supabase_db.get_bet(bet_id)
+    if bet is None:
+        return {}
+    predictions = supabase_db.get_prediction_batch(bet_id, bet.answer_type)
+    payouts = compute_payouts(bet, predictions)
+    if payouts:
+        # Keyed per bet, so a retried or repeated resolution never pays twice
+        supabase_db.add_reedz_many(payouts, reason="bet_payout", bet_id=bet_id, idempotency_key=f"bet_payout:{bet_id}")
+    return payouts
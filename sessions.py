@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+import supabase_db
+from models import User
+
+logger = logging.getLogger(__name__)
+
+# Signed, expiring session tokens so a browser refresh can restore the login
+# without another password check. A token is
+#   base64url({"uid": user_id, "exp": unix_time, "pwd": fingerprint}) "." base64url(hmac_sha256)
+# The fingerprint is derived from the stored password hash, so changing the
+# password invalidates every token issued before it.
+#
+# REEDZ_SESSION_SECRET signs the tokens and must be the same on every replica
+# and across restarts. It is required with the Supabase backend; for local
+# SQLite/in-memory runs a per-process secret is generated, with a warning.
+SESSION_SECRET = os.getenv("REEDZ_SESSION_SECRET", "").encode()
+if not SESSION_SECRET:
+    if supabase_db.REEDZ_BACKEND == "supabase":
+        raise Exception("REEDZ_SESSION_SECRET is not set; generate one with: python -c \"import secrets; print(secrets.token_hex(32))\"")
+    logger.warning(
+        "REEDZ_SESSION_SECRET is not set; using a random per-process secret, so "
+        "logins will not survive a restart or work across replicas"
+    )
+    SESSION_SECRET = secrets.token_hex(32).encode()
+SESSION_TTL_SECONDS = int(os.getenv("REEDZ_SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest())
+
+def _password_fingerprint(user: User) -> str:
+    digest = hmac.new(SESSION_SECRET, (user.password or "").encode(), hashlib.sha256).digest()
+    return _b64encode(digest[:12])
+
+def issue_token(user: User, ttl=None, now=None) -> str:
+    expires = int((now or time.time()) + (ttl or SESSION_TTL_SECONDS))
+    payload = _b64encode(json.dumps(
+        {"uid": user.user_id, "exp": expires, "pwd": _password_fingerprint(user)},
+        separators=(",", ":"),
+    ).encode())
+    return f"{payload}.{_sign(payload)}"
+
+def read_token(token: str, now=None):
+    # The token's claims if the signature is valid and it has not expired
+    try:
+        payload, signature = token.split(".", 1)
+    except (AttributeError, ValueError):
+        return None
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) < (now or time.time()):
+        return None
+    return claims
+
+def restore_user(token: str, now=None):
+    claims = read_token(token, now)
+    if claims is None:
+        return None
+    user = supabase_db.get_user_by_id(claims.get("uid"))
+    if user is None or not hmac.compare_digest(claims.get("pwd", ""), _password_fingerprint(user)):
+        return None
+    return user
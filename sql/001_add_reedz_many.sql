@@ -0,0 +1,16 @@
+-- Credits many users in a single round trip.
+-- deltas: [{"user_id": 1, "delta": 10}, ...]
+create or replace function add_reedz_many(deltas jsonb)
+returns setof users
+language sql
+as $$
+    update users u
+    set reedz_balance = u.reedz_balance + d.delta
+    from (
+        select user_id, sum(delta) as delta
+        from jsonb_to_recordset(deltas) as x(user_id bigint, delta integer)
+        group by user_id
+    ) d
+    where u.user_id = d.user_id
+    returning u.*;
+$$;
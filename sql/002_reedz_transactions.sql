@@ -0,0 +1,100 @@
+-- Append-only ledger of every Reedz credit/debit. users.reedz_balance stays
+-- the materialized sum and is only ever changed by the functions below.
+create table if not exists reedz_transactions (
+    txn_id bigserial primary key,
+    user_id bigint not null references users(user_id) on delete cascade,
+    delta integer not null,
+    reason text not null,
+    bet_id bigint references bets(bet_id) on delete set null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists reedz_transactions_user_idx
+    on reedz_transactions (user_id, created_at desc);
+
+-- Single credit: one ledger row plus an atomic in-place increment.
+create or replace function record_reedz(
+    p_user_id bigint,
+    p_delta integer,
+    p_reason text,
+    p_bet_id bigint default null
+)
+returns integer
+language plpgsql
+as $$
+declare
+    new_balance integer;
+begin
+    update users
+    set reedz_balance = reedz_balance + p_delta
+    where user_id = p_user_id
+    returning reedz_balance into new_balance;
+    if not found then
+        return null;
+    end if;
+    insert into reedz_transactions (user_id, delta, reason, bet_id)
+    values (p_user_id, p_delta, p_reason, p_bet_id);
+    return new_balance;
+end;
+$$;
+
+-- Admin override: the delta is computed under a row lock so concurrent
+-- credits are never lost.
+create or replace function set_reedz(
+    p_user_id bigint,
+    p_balance integer,
+    p_reason text
+)
+returns integer
+language plpgsql
+as $$
+declare
+    current_balance integer;
+begin
+    select reedz_balance into current_balance
+    from users
+    where user_id = p_user_id
+    for update;
+    if not found then
+        return null;
+    end if;
+    if p_balance <> current_balance then
+        update users set reedz_balance = p_balance where user_id = p_user_id;
+        insert into reedz_transactions (user_id, delta, reason)
+        values (p_user_id, p_balance - current_balance, p_reason);
+    end if;
+    return p_balance;
+end;
+$$;
+
+-- Batched credits now go through the ledger as well.
+drop function if exists add_reedz_many(jsonb);
+
+create or replace function add_reedz_many(
+    deltas jsonb,
+    p_reason text,
+    p_bet_id bigint default null
+)
+returns setof users
+language sql
+as $$
+    with d as (
+        select user_id, sum(delta)::integer as delta
+        from jsonb_to_recordset(deltas) as x(user_id bigint, delta integer)
+        group by user_id
+    ),
+    updated as (
+        update users u
+        set reedz_balance = u.reedz_balance + d.delta
+        from d
+        where u.user_id = d.user_id
+        returning u.*
+    ),
+    logged as (
+        insert into reedz_transactions (user_id, delta, reason, bet_id)
+        select d.user_id, d.delta, p_reason, p_bet_id
+        from d
+        join updated on updated.user_id = d.user_id
+    )
+    select * from updated;
+$$;
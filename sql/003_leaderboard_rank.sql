@@ -0,0 +1,77 @@
+-- Leaderboard order is reedz_balance desc, user_id asc; this index serves the
+-- keyset pages, the neighbour lookups and the rank count below.
+create index if not exists users_reedz_balance_idx on users (reedz_balance desc, user_id);
+
+-- A user's competition and dense rank plus up to p_neighbours users on either
+-- side, in one round trip. A btree has no order statistics, so ranks come
+-- from one index-only range count of the users at or above the window's top
+-- balance; rank() and dense_rank() over the window rows place the rest. Every
+-- balance between two window rows belongs to a window row, so
+--   rank       = 1 + above_top                         for rows at the top balance
+--              = (at_or_above_top - top_in_window) + window rank   below it
+--   dense_rank = distinct_above_top + window dense rank
+create or replace function get_leaderboard_rank(p_user_id bigint, p_neighbours integer default 2)
+returns table (
+    user_id bigint,
+    username text,
+    reedz_balance integer,
+    rank bigint,
+    dense_rank bigint
+)
+language sql
+stable
+as $$
+    with me as (
+        select u.user_id, u.reedz_balance from users u where u.user_id = p_user_id
+    ),
+    above as (
+        select u.user_id, u.username, u.reedz_balance
+        from users u, me
+        where u.reedz_balance > me.reedz_balance
+           or (u.reedz_balance = me.reedz_balance and u.user_id < me.user_id)
+        order by u.reedz_balance asc, u.user_id desc
+        limit p_neighbours
+    ),
+    rest as (
+        select u.user_id, u.username, u.reedz_balance
+        from users u, me
+        where u.reedz_balance < me.reedz_balance
+           or (u.reedz_balance = me.reedz_balance and u.user_id >= me.user_id)
+        order by u.reedz_balance desc, u.user_id asc
+        limit p_neighbours + 1
+    ),
+    window_rows as (
+        select * from above
+        union all
+        select * from rest
+    ),
+    top_balance as (
+        select t.balance, (select count(*) from window_rows w where w.reedz_balance = t.balance) as in_window
+        from (select max(reedz_balance) as balance from window_rows) t
+    ),
+    counts as (
+        select
+            count(*) filter (where u.reedz_balance > top.balance) as above_top,
+            count(*) as at_or_above_top,
+            count(distinct u.reedz_balance) filter (where u.reedz_balance > top.balance) as distinct_above_top
+        from users u, top_balance top
+        where u.reedz_balance >= top.balance
+    ),
+    ranked as (
+        select
+            w.*,
+            rank() over (order by w.reedz_balance desc) as window_rank,
+            dense_rank() over (order by w.reedz_balance desc) as window_dense_rank
+        from window_rows w
+    )
+    select
+        r.user_id,
+        r.username,
+        r.reedz_balance,
+        case when r.reedz_balance = top.balance then c.above_top + 1
+             else c.at_or_above_top - top.in_window + r.window_rank
+        end,
+        c.distinct_above_top + r.window_dense_rank
+    from ranked r, top_balance top, counts c
+    order by r.reedz_balance desc, r.user_id asc;
+$$;
@@ -0,0 +1,49 @@
+-- One prediction per user per bet, enforced by the database instead of a
+-- separate has_prediction() check. The old check-then-insert could race, so
+-- first keep only the earliest prediction of each (user_id, bet_id) pair.
+-- Safe to re-run.
+delete from predictions p
+using predictions earlier
+where earlier.user_id = p.user_id
+  and earlier.bet_id = p.bet_id
+  and earlier.prediction_id < p.prediction_id;
+
+create unique index if not exists predictions_user_id_bet_id_key
+    on predictions (user_id, bet_id);
+
+do $$
+begin
+    alter table predictions
+        add constraint predictions_user_id_bet_id_key unique using index predictions_user_id_bet_id_key;
+exception
+    when duplicate_object or duplicate_table then null;
+end;
+$$;
+
+-- Places a prediction in one round trip. The insert only happens while the
+-- bet is open and before close_at; a second prediction from the same user
+-- fails on the unique constraint (SQLSTATE 23505).
+create or replace function place_prediction(
+    p_user_id bigint,
+    p_bet_id bigint,
+    p_prediction text
+)
+returns setof predictions
+language plpgsql
+as $$
+begin
+    return query
+    insert into predictions (user_id, bet_id, prediction, created_at)
+    select p_user_id, b.bet_id, p_prediction, now()
+    from bets b
+    where b.bet_id = p_bet_id
+      and not b.is_closed
+      and not b.is_resolved
+      and (b.close_at is null or b.close_at > now())
+    returning *;
+    if not found then
+        raise exception 'bet % is not open for predictions', p_bet_id
+            using errcode = 'RZ001';
+    end if;
+end;
+$$;
@@ -0,0 +1,7 @@
+-- Pending deadlines for the auto-close scheduler (scheduler.py). Only open
+-- bets with a close_at are indexed, so the startup reload stays cheap as
+-- resolved bets pile up.
+create index if not exists bets_pending_close_idx
+    on bets (bet_id)
+    include (close_at)
+    where is_closed = false and is_resolved = false and close_at is not null;
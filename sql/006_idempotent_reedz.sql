@@ -0,0 +1,49 @@
+-- Idempotency keys for batched Reedz credits. add_reedz_many records its key
+-- in the same transaction as the credits, so a call that is retried after a
+-- lost response (or a resolution that is run twice) is a no-op.
+create table if not exists reedz_idempotency_keys (
+    key text primary key,
+    created_at timestamptz not null default now()
+);
+
+drop function if exists add_reedz_many(jsonb, text, bigint);
+
+create or replace function add_reedz_many(
+    deltas jsonb,
+    p_reason text,
+    p_bet_id bigint default null,
+    p_idempotency_key text default null
+)
+returns setof users
+language plpgsql
+as $$
+begin
+    if p_idempotency_key is not null then
+        insert into reedz_idempotency_keys (key) values (p_idempotency_key)
+        on conflict do nothing;
+        if not found then
+            return;
+        end if;
+    end if;
+    return query
+    with d as (
+        select user_id, sum(delta)::integer as delta
+        from jsonb_to_recordset(deltas) as x(user_id bigint, delta integer)
+        group by user_id
+    ),
+    updated as (
+        update users u
+        set reedz_balance = u.reedz_balance + d.delta
+        from d
+        where u.user_id = d.user_id
+        returning u.*
+    ),
+    logged as (
+        insert into reedz_transactions (user_id, delta, reason, bet_id)
+        select d.user_id, d.delta, p_reason, p_bet_id
+        from d
+        join updated on updated.user_id = d.user_id
+    )
+    select * from updated;
+end;
+$$;
@@ -0,0 +1,42 @@
+-- Persistent outbox for email_sender.py. The app inserts a row and returns;
+-- the background worker claims due rows, sends them and records the outcome.
+create table if not exists email_outbox (
+    outbox_id bigserial primary key,
+    to_addr text not null,
+    subject text not null,
+    body text not null,
+    status text not null default 'queued'
+        check (status in ('queued', 'sending', 'sent', 'failed')),
+    attempts integer not null default 0,
+    last_error text,
+    next_attempt_at timestamptz not null default now(),
+    claimed_at timestamptz,
+    created_at timestamptz not null default now(),
+    sent_at timestamptz
+);
+
+create index if not exists email_outbox_due_idx
+    on email_outbox (next_attempt_at)
+    where status in ('queued', 'sending');
+
+-- Marks up to p_limit due messages as sending and returns them. A message
+-- left in 'sending' longer than p_lease_seconds belongs to a worker that
+-- died mid-send and is claimed again. skip locked lets several app
+-- instances run workers without sending a message twice.
+create or replace function claim_email_outbox(p_limit integer, p_lease_seconds integer)
+returns setof email_outbox
+language sql
+as $$
+    update email_outbox o
+    set status = 'sending', claimed_at = now(), attempts = o.attempts + 1
+    where o.outbox_id in (
+        select outbox_id
+        from email_outbox
+        where (status = 'queued' and next_attempt_at <= now())
+           or (status = 'sending' and claimed_at <= now() - make_interval(secs => p_lease_seconds))
+        order by next_attempt_at, outbox_id
+        limit p_limit
+        for update skip locked
+    )
+    returning o.*;
+$$;
@@ -0,0 +1,33 @@
+-- Bet lifecycle events for the notification digests (notifications.py).
+-- One row per event, not per recipient; recipients are worked out when the
+-- digest is built.
+create table if not exists notification_events (
+    event_id bigserial primary key,
+    kind text not null check (kind in ('bet_created', 'bet_resolved')),
+    bet_id bigint references bets(bet_id) on delete cascade,
+    created_at timestamptz not null default now(),
+    digested_at timestamptz
+);
+
+create index if not exists notification_events_pending_idx
+    on notification_events (event_id)
+    where digested_at is null;
+
+-- Stamps and returns up to p_limit undigested events, oldest first. skip
+-- locked keeps two digest runs from picking up the same events.
+create or replace function claim_notification_events(p_limit integer)
+returns setof notification_events
+language sql
+as $$
+    update notification_events e
+    set digested_at = now()
+    where e.event_id in (
+        select event_id
+        from notification_events
+        where digested_at is null
+        order by event_id
+        limit p_limit
+        for update skip locked
+    )
+    returning e.*;
+$$;
@@ -0,0 +1,549 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from models import User, Bet, Prediction, user_from_row, bet_from_row, bet_summary_from_row, prediction_from_row, prediction_batch_from_rows, reedz_txn_from_row
+from leaderboard import rank_entry
+from repository import (
+    Repository, BetClosedError, DuplicatePredictionError, bet_accepts_predictions, BET_SUMMARY_COLUMNS, DEFAULT_PAGE_SIZE, group_bets,
+    user_row, bet_row, prediction_row, to_db_value,
+)
+
+SCHEMA = """
+create table if not exists users (
+    user_id integer primary key autoincrement,
+    username text not null unique,
+    password text not null,
+    email text not null unique,
+    reedz_balance integer not null default 0,
+    role text not null,
+    created_at text,
+    reset_code text,
+    reset_code_expiry text
+);
+create index if not exists users_reedz_balance_idx on users (reedz_balance desc, user_id);
+
+create table if not exists bets (
+    bet_id integer primary key autoincrement,
+    created_by_user_id integer references users(user_id) on delete set null,
+    title text not null,
+    description text,
+    answer_type text not null,
+    is_open integer not null default 1,
+    is_resolved integer not null default 0,
+    is_closed integer not null default 0,
+    created_at text,
+    close_at text,
+    resolved_at text,
+    correct_answer text
+);
+create index if not exists bets_state_idx on bets (is_resolved, is_closed, bet_id);
+create index if not exists bets_pending_close_idx on bets (bet_id) where is_closed = 0 and is_resolved = 0 and close_at is not null;
+
+create table if not exists predictions (
+    prediction_id integer primary key autoincrement,
+    user_id integer not null references users(user_id) on delete cascade,
+    bet_id integer not null references bets(bet_id) on delete cascade,
+    prediction text not null,
+    created_at text,
+    unique (user_id, bet_id)
+);
+create index if not exists predictions_bet_idx on predictions (bet_id);
+
+create table if not exists reedz_transactions (
+    txn_id integer primary key autoincrement,
+    user_id integer not null references users(user_id) on delete cascade,
+    delta integer not null,
+    reason text not null,
+    bet_id integer references bets(bet_id) on delete set null,
+    created_at text not null
+);
+create index if not exists reedz_transactions_user_idx on reedz_transactions (user_id, created_at desc);
+
+create table if not exists reedz_idempotency_keys (
+    key text primary key,
+    created_at text not null
+);
+
+create table if not exists email_outbox (
+    outbox_id integer primary key autoincrement,
+    to_addr text not null,
+    subject text not null,
+    body text not null,
+    status text not null default 'queued',
+    attempts integer not null default 0,
+    last_error text,
+    next_attempt_at text not null,
+    claimed_at text,
+    created_at text not null,
+    sent_at text
+);
+create index if not exists email_outbox_due_idx on email_outbox (next_attempt_at) where status in ('queued', 'sending');
+
+create table if not exists notification_events (
+    event_id integer primary key autoincrement,
+    kind text not null,
+    bet_id integer references bets(bet_id) on delete cascade,
+    created_at text not null,
+    digested_at text
+);
+create index if not exists notification_events_pending_idx on notification_events (event_id) where digested_at is null;
+"""
+
+BET_COLUMNS = (
+    "bet_id, created_by_user_id, title, description, answer_type, correct_answer, "
+    "is_open, is_resolved, is_closed, created_at, close_at, resolved_at"
+)
+BET_BOOL_COLUMNS = ("is_open", "is_resolved", "is_closed")
+# The get_leaderboard_rank function of sql/003_leaderboard_rank.sql as one
+# statement: the user's neighbours by keyset on users_reedz_balance_idx, one
+# range count at the window's top balance, and rank()/dense_rank() over the
+# window for the rest
+RANK_QUERY = """
+with me as (
+    select user_id, reedz_balance from users where user_id = :user_id
+),
+above as (
+    select u.user_id, u.username, u.reedz_balance
+    from users u, me
+    where u.reedz_balance > me.reedz_balance
+       or (u.reedz_balance = me.reedz_balance and u.user_id < me.user_id)
+    order by u.reedz_balance asc, u.user_id desc
+    limit :neighbours
+),
+rest as (
+    select u.user_id, u.username, u.reedz_balance
+    from users u, me
+    where u.reedz_balance < me.reedz_balance
+       or (u.reedz_balance = me.reedz_balance and u.user_id >= me.user_id)
+    order by u.reedz_balance desc, u.user_id asc
+    limit :neighbours + 1
+),
+window_rows as (
+    select * from above
+    union all
+    select * from rest
+),
+top_balance as (
+    select t.balance, (select count(*) from window_rows w where w.reedz_balance = t.balance) as in_window
+    from (select max(reedz_balance) as balance from window_rows) t
+),
+counts as (
+    select
+        count(*) filter (where u.reedz_balance > top.balance) as above_top,
+        count(*) as at_or_above_top,
+        count(distinct u.reedz_balance) filter (where u.reedz_balance > top.balance) as distinct_above_top
+    from users u, top_balance top
+    where u.reedz_balance >= top.balance
+),
+ranked as (
+    select
+        w.*,
+        rank() over (order by w.reedz_balance desc) as window_rank,
+        dense_rank() over (order by w.reedz_balance desc) as window_dense_rank
+    from window_rows w
+)
+select
+    r.user_id,
+    r.username,
+    r.reedz_balance,
+    case when r.reedz_balance = top.balance then c.above_top + 1
+         else c.at_or_above_top - top.in_window + r.window_rank
+    end as rank,
+    c.distinct_above_top + r.window_dense_rank as dense_rank
+from ranked r, top_balance top, counts c
+order by r.reedz_balance desc, r.user_id asc
+"""
+# Bound parameters per statement; 999 is the lowest SQLITE_MAX_VARIABLE_NUMBER
+# any SQLite build ships with
+SQLITE_MAX_VARIABLES = 999
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SqliteRepository(Repository):
+    # Single-file (or ":memory:") SQLite store with the same schema and indexes
+    # as the Supabase tables. One connection is shared behind a lock so the
+    # repository can be used from Streamlit's script threads.
+
+    def __init__(self, path="reedz.db"):
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("pragma foreign_keys = on")
+        if path != ":memory:":
+            self.conn.execute("pragma journal_mode = wal")
+        self.conn.executescript(SCHEMA)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("begin immediate")
+            try:
+                yield
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+            self.conn.execute("commit")
+
+    def _insert(self, table, row):
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        return self._query(
+            f"insert into {table} ({columns}) values ({placeholders}) returning *",
+            tuple(row.values()),
+        )
+
+    def _insert_many(self, table, rows, key):
+        # Multi-row inserts, as many rows per statement as the parameter limit
+        # allows. RETURNING order is unspecified, so rows come back sorted by
+        # their new primary key, which follows insert order.
+        if not rows:
+            return []
+        columns = list(rows[0])
+        row_placeholders = "(" + ", ".join("?" for _ in columns) + ")"
+        chunk_size = max(1, SQLITE_MAX_VARIABLES // len(columns))
+        inserted = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            inserted += self._query(
+                f"insert into {table} ({', '.join(columns)}) values "
+                + ", ".join(row_placeholders for _ in chunk) + " returning *",
+                tuple(row[column] for row in chunk for column in columns),
+            )
+        return sorted(inserted, key=lambda row: row[key])
+
+    def _query_in(self, sql, values, params=()):
+        # Runs sql, whose "{values}" stands for an IN list, once per chunk of
+        # values that fits in the parameter limit next to params, and
+        # concatenates the rows. Callers that write wrap it in a transaction.
+        values = list(values)
+        chunk_size = SQLITE_MAX_VARIABLES - len(params)
+        rows = []
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            rows += self._query(sql.format(values=", ".join("?" for _ in chunk)), tuple(params) + tuple(chunk))
+        return rows
+
+    @staticmethod
+    def _bet(row):
+        for column in BET_BOOL_COLUMNS:
+            if column in row:
+                row[column] = bool(row[column])
+        return row
+
+    # USER FUNCTIONS
+    def create_user(self, user: User):
+        return self._insert("users", user_row(user))
+
+    def list_users_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        return self._query(
+            "select user_id, username, email, role, reedz_balance from users "
+            "where user_id > ? order by user_id limit ?",
+            (after if after is not None else 0, limit),
+        )
+
+    def _get_user_by(self, column, value):
+        rows = self._query(f"select * from users where {column} = ? limit 1", (value,))
+        return user_from_row(rows[0]) if rows else None
+
+    def get_user_by_username(self, username):
+        return self._get_user_by("username", username)
+
+    def get_user_by_email(self, email):
+        return self._get_user_by("email", email)
+
+    def get_user_by_id(self, user_id):
+        return self._get_user_by("user_id", user_id)
+
+    def update_user_password(self, user_id, hashed_password):
+        return self._query("update users set password = ? where user_id = ? returning *", (hashed_password, user_id))
+
+    def update_user_password_by_email(self, email, hashed_password):
+        return self._query("update users set password = ? where email = ? returning *", (hashed_password, email))
+
+    def update_user_email(self, user_id, new_email):
+        return self._query("update users set email = ? where user_id = ? returning *", (new_email, user_id))
+
+    def set_user_reset_code(self, email, code, expiry):
+        return self._query(
+            "update users set reset_code = ?, reset_code_expiry = ? where email = ? returning *",
+            (code, to_db_value(expiry), email),
+        )
+
+    def get_reset_code(self, email):
+        rows = self._query("select reset_code, reset_code_expiry from users where email = ?", (email,))
+        return rows[0] if rows else None
+
+    def clear_reset_code(self, email):
+        return self._query(
+            "update users set reset_code = null, reset_code_expiry = null where email = ? returning *",
+            (email,),
+        )
+
+    def add_reedz(self, user_id, delta, reason="adjustment", bet_id=None):
+        with self._transaction():
+            rows = self._query(
+                "update users set reedz_balance = reedz_balance + ? where user_id = ? returning reedz_balance",
+                (delta, user_id),
+            )
+            if rows:
+                self.conn.execute(
+                    "insert into reedz_transactions (user_id, delta, reason, bet_id, created_at) values (?, ?, ?, ?, ?)",
+                    (user_id, delta, reason, bet_id, _now()),
+                )
+        return rows[0]["reedz_balance"] if rows else None
+
+    def set_reedz_balance(self, user_id, new_balance, reason="admin_adjustment"):
+        with self._transaction():
+            rows = self._query("select reedz_balance from users where user_id = ?", (user_id,))
+            if rows and rows[0]["reedz_balance"] != new_balance:
+                self.conn.execute("update users set reedz_balance = ? where user_id = ?", (new_balance, user_id))
+                self.conn.execute(
+                    "insert into reedz_transactions (user_id, delta, reason, bet_id, created_at) values (?, ?, ?, null, ?)",
+                    (user_id, new_balance - rows[0]["reedz_balance"], reason, _now()),
+                )
+        return new_balance if rows else None
+
+    def add_reedz_many(self, deltas, reason="bet_payout", bet_id=None, idempotency_key=None):
+        items = [(delta, uid) for uid, delta in deltas.items() if delta]
+        if not items:
+            return []
+        now = _now()
+        with self._transaction():
+            if idempotency_key is not None:
+                inserted = self.conn.execute(
+                    "insert or ignore into reedz_idempotency_keys (key, created_at) values (?, ?)",
+                    (idempotency_key, now),
+                ).rowcount
+                if not inserted:
+                    return []
+            self.conn.executemany(
+                "update users set reedz_balance = reedz_balance + ? where user_id = ?", items
+            )
+            self.conn.executemany(
+                "insert into reedz_transactions (user_id, delta, reason, bet_id, created_at) "
+                "select user_id, ?, ?, ?, ? from users where user_id = ?",
+                [(delta, reason, bet_id, now, uid) for delta, uid in items],
+            )
+        return self._query_in("select * from users where user_id in ({values})", (uid for _, uid in items))
+
+    def get_reedz_history(self, user_id, limit=50):
+        rows = self._query(
+            "select txn_id, delta, reason, bet_id, created_at from reedz_transactions "
+            "where user_id = ? order by created_at desc, txn_id desc limit ?",
+            (user_id, limit),
+        )
+        return [reedz_txn_from_row(row) for row in rows]
+
+    def delete_user(self, user_id):
+        return self._query("delete from users where user_id = ? returning *", (user_id,))
+
+    def change_role(self, user_id, new_role):
+        return self._query("update users set role = ? where user_id = ? returning *", (new_role, user_id))
+
+    def get_leaderboard_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        if after is None:
+            return self._query(
+                "select user_id, username, reedz_balance from users "
+                "order by reedz_balance desc, user_id limit ?",
+                (limit,),
+            )
+        balance, user_id = after
+        return self._query(
+            "select user_id, username, reedz_balance from users "
+            "where reedz_balance < ? or (reedz_balance = ? and user_id > ?) "
+            "order by reedz_balance desc, user_id limit ?",
+            (balance, balance, user_id, limit),
+        )
+
+    def get_rank(self, user_id, neighbours=2):
+        window = self._query(RANK_QUERY, {"user_id": user_id, "neighbours": neighbours})
+        return rank_entry(user_id, window)
+
+    # BET FUNCTIONS
+    def create_bet(self, bet: Bet):
+        return [self._bet(r) for r in self._insert("bets", bet_row(bet))]
+
+    def create_bets_many(self, bets):
+        with self._transaction():
+            return [self._bet(r) for r in self._insert_many("bets", [bet_row(b) for b in bets], "bet_id")]
+
+    def get_bet(self, bet_id):
+        rows = self._query("select * from bets where bet_id = ?", (bet_id,))
+        return bet_from_row(rows[0]) if rows else None
+
+    def get_bets_by_ids(self, bet_ids):
+        return [bet_from_row(r) for r in self._query_in("select * from bets where bet_id in ({values})", set(bet_ids))]
+
+    def get_bets_page(self, state, after=None, limit=DEFAULT_PAGE_SIZE):
+        sql = f"select {BET_COLUMNS} from bets where bet_id > ?"
+        if state == "open":
+            sql += " and is_closed = 0 and is_resolved = 0"
+        elif state == "closed":
+            sql += " and is_closed = 1 and is_resolved = 0"
+        elif state == "resolved":
+            sql += " and is_resolved = 1"
+        rows = self._query(sql + " order by bet_id limit ?", (after if after is not None else 0, limit))
+        return [bet_from_row(r) for r in rows]
+
+    def get_bets_grouped(self):
+        rows = self._query(f"select {', '.join(BET_SUMMARY_COLUMNS)} from bets order by bet_id")
+        return group_bets(bet_summary_from_row(r) for r in rows)
+
+    def close_bet(self, bet_id):
+        return [self._bet(r) for r in self._query(
+            "update bets set is_open = 0, is_closed = 1 where bet_id = ? returning *", (bet_id,)
+        )]
+
+    def close_bets_many(self, bet_ids):
+        bet_ids = list(bet_ids)
+        if not bet_ids:
+            return []
+        with self._transaction():
+            return [self._bet(r) for r in self._query_in(
+                "update bets set is_open = 0, is_closed = 1 where bet_id in ({values}) "
+                "and is_closed = 0 and is_resolved = 0 returning *",
+                bet_ids,
+            )]
+
+    def get_pending_close_times(self):
+        return self._query(
+            "select bet_id, close_at from bets "
+            "where is_closed = 0 and is_resolved = 0 and close_at is not null order by bet_id"
+        )
+
+    def resolve_bet(self, bet_id, correct_answer):
+        return [self._bet(r) for r in self._query(
+            "update bets set is_resolved = 1, correct_answer = ? where bet_id = ? returning *",
+            (correct_answer, bet_id),
+        )]
+
+    # PREDICTION FUNCTIONS
+    def create_prediction(self, prediction: Prediction):
+        return self._insert("predictions", prediction_row(prediction))
+
+    def create_predictions_many(self, predictions):
+        with self._transaction():
+            return self._insert_many("predictions", [prediction_row(p) for p in predictions], "prediction_id")
+
+    def place_prediction(self, prediction: Prediction):
+        with self._transaction():
+            bet = self._query(
+                "select is_closed, is_resolved, close_at from bets where bet_id = ?", (prediction.bet_id,)
+            )
+            if not bet or not bet_accepts_predictions(bet[0]):
+                raise BetClosedError()
+            try:
+                return self._insert("predictions", prediction_row(prediction))
+            except sqlite3.IntegrityError as e:
+                # Only UNIQUE(user_id, bet_id); a foreign-key failure is not a duplicate
+                if "UNIQUE constraint failed" in str(e):
+                    raise DuplicatePredictionError() from e
+                raise
+
+    def get_predictions_for_bet(self, bet_id):
+        rows = self._query("select * from predictions where bet_id = ?", (bet_id,))
+        return [prediction_from_row(p) for p in rows]
+
+    def get_prediction_batch(self, bet_id, answer_type, with_usernames=False):
+        if with_usernames:
+            sql = (
+                "select p.prediction_id, p.user_id, p.prediction, p.created_at, u.username "
+                "from predictions p left join users u on u.user_id = p.user_id "
+                "where p.bet_id = ? order by p.created_at, p.prediction_id"
+            )
+        else:
+            sql = (
+                "select prediction_id, user_id, prediction, created_at from predictions "
+                "where bet_id = ? order by created_at, prediction_id"
+            )
+        with self._lock:
+            rows = self.conn.execute(sql, (bet_id,))
+            return prediction_batch_from_rows(bet_id, answer_type, rows, with_usernames)
+
+    def get_user_predictions(self, user_id):
+        rows = self._query("select * from predictions where user_id = ?", (user_id,))
+        return [prediction_from_row(p) for p in rows]
+
+    def has_prediction(self, user_id, bet_id):
+        rows = self._query(
+            "select prediction_id from predictions where user_id = ? and bet_id = ? limit 1", (user_id, bet_id)
+        )
+        return bool(rows)
+
+    # EMAIL OUTBOX
+    def enqueue_email(self, to_addr, subject, body):
+        return self.enqueue_emails_many([(to_addr, subject, body)])[0]
+
+    def enqueue_emails_many(self, messages):
+        now = _now()
+        with self._transaction():
+            return [
+                row
+                for to_addr, subject, body in messages
+                for row in self._insert("email_outbox", {
+                    "to_addr": to_addr,
+                    "subject": subject,
+                    "body": body,
+                    "next_attempt_at": now,
+                    "created_at": now,
+                })
+            ]
+
+    def claim_emails(self, limit, lease_seconds):
+        now = datetime.now(timezone.utc)
+        lease_expired = (now - timedelta(seconds=lease_seconds)).isoformat()
+        return self._query(
+            "update email_outbox set status = 'sending', claimed_at = ?, attempts = attempts + 1 "
+            "where outbox_id in (select outbox_id from email_outbox "
+            "where (status = 'queued' and next_attempt_at <= ?) or (status = 'sending' and claimed_at <= ?) "
+            "order by next_attempt_at, outbox_id limit ?) returning *",
+            (now.isoformat(), now.isoformat(), lease_expired, limit),
+        )
+
+    def update_email_status(self, outbox_id, status, last_error=None, next_attempt_at=None):
+        rows = self._query(
+            "update email_outbox set status = ?, last_error = ?, "
+            "next_attempt_at = coalesce(?, next_attempt_at), sent_at = ? where outbox_id = ? returning *",
+            (status, last_error, to_db_value(next_attempt_at), _now() if status == "sent" else None, outbox_id),
+        )
+        return rows[0] if rows else None
+
+    def get_email(self, outbox_id):
+        rows = self._query("select * from email_outbox where outbox_id = ?", (outbox_id,))
+        return rows[0] if rows else None
+
+    # NOTIFICATION EVENTS
+    def record_notification_events(self, events):
+        now = _now()
+        with self._transaction():
+            return [
+                row
+                for kind, bet_id in events
+                for row in self._insert("notification_events", {"kind": kind, "bet_id": bet_id, "created_at": now})
+            ]
+
+    def claim_notification_events(self, limit):
+        return self._query(
+            "update notification_events set digested_at = ? where event_id in "
+            "(select event_id from notification_events where digested_at is null order by event_id limit ?) "
+            "returning *",
+            (_now(), limit),
+        )
+
+    def release_notification_events(self, event_ids):
+        event_ids = list(event_ids)
+        if not event_ids:
+            return []
+        with self._transaction():
+            return self._query_in(
+                "update notification_events set digested_at = null where event_id in ({values}) returning *",
+                event_ids,
+            )
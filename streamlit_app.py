@@ -1,28 +1,107 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import json
 import re
-from models import User
-from auth import hash_password, authenticate, is_admin
+from models import User, BET_STATES
+from auth import hash_password, authenticate, is_admin, bcrypt_stats, AuthBusyError
 import supabase_db
-from betting import create_bet, close_bet, resolve_bet, place_prediction, get_bet_overview
+from betting import create_bet, close_bet, resolve_bet, place_prediction
+import cached_db
+from repository import leaderboard_cursor, user_cursor
+from leaderboard import rank_rows
 from datetime import datetime, timedelta
 import timestamper  
+import scheduler
+import notifications
+import sessions
+import metrics
+import rate_limit
 import os
 from dotenv import load_dotenv
 import random
 import string
-from email_sender import send_password_reset_email
+import email_sender
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 load_dotenv() # Load environment variables from .env file
 ADMIN_CODE = os.getenv("ADMIN_CODE") # Admin verification code from environment variables
 
 st.set_page_config(page_title="Reedz Betting", layout="wide") # Set Streamlit page configuration
 
+# Background thread that closes bets at their close_at; cache_resource keeps
+# one per server process across reruns and sessions
+@st.cache_resource
+def auto_close_scheduler():
+    return scheduler.start_scheduler()
+
+if scheduler.AUTO_CLOSE_ENABLED:
+    auto_close_scheduler()
+
+# Prometheus /metrics endpoint, enabled by REEDZ_METRICS_PORT
+@st.cache_resource
+def metrics_server():
+    return metrics.start_http_server(metrics.METRICS_PORT)
+
+if metrics.METRICS_PORT:
+    metrics_server()
+
+# Background worker that sends queued emails over a warm SMTP connection
+@st.cache_resource
+def email_outbox():
+    return email_sender.start_outbox()
+
+if email_sender.EMAIL_WORKER_ENABLED:
+    email_outbox()
+
+# Periodic job that turns bet events into one digest email per user
+@st.cache_resource
+def notification_digests():
+    return notifications.start_digest_worker()
+
+if notifications.DIGESTS_ENABLED:
+    notification_digests()
+
 # Initalize session state variables for the user and home page which are used to track login status and the current page
 if "user" not in st.session_state: 
     st.session_state.user = None
 if "page" not in st.session_state:
     st.session_state.page = "home"
 
+# Restore the login after a browser refresh from the signed session token in
+# a cookie. The token never goes in the URL, where it would end up in browser
+# history, proxy logs and shared links; an old ?session= link is stripped
+# without being used. st.context.cookies is a snapshot taken when the browser
+# connected, so session_token tracks the cookie's current value.
+SESSION_COOKIE = "reedz_session"
+LEGACY_SESSION_PARAM = "session"
+if LEGACY_SESSION_PARAM in st.query_params:
+    del st.query_params[LEGACY_SESSION_PARAM]
+if "session_token" not in st.session_state:
+    st.session_state.session_token = st.context.cookies.get(SESSION_COOKIE)
+
+# Cookies can only be written by the browser, so a zero-height component sets
+# (or, with None, clears) it on the next render
+def set_session_cookie(token):
+    st.session_state.session_token = token
+    st.session_state.session_cookie_pending = True
+
+def render_session_cookie(token):
+    max_age = sessions.SESSION_TTL_SECONDS if token else 0
+    components.html(f"""<script>
+const secure = window.parent.location.protocol === "https:" ? "; secure" : "";
+window.parent.document.cookie = "{SESSION_COOKIE}=" + {json.dumps(token or "")} + "; path=/; max-age={max_age}; samesite=strict" + secure;
+</script>""", height=0)
+
+if st.session_state.user is None and st.session_state.session_token:
+    st.session_state.user = sessions.restore_user(st.session_state.session_token)
+    if st.session_state.user is None:
+        set_session_cookie(None)
+    else:
+        st.session_state.page = "main"
+if st.session_state.pop("session_cookie_pending", False):
+    render_session_cookie(st.session_state.session_token)
+
 # Generates a random numeric reset code of length 6
 def generate_reset_code(length=6): 
     return ''.join(random.choices(string.digits, k=length)) 
@@ -31,8 +110,43 @@ def set_reset_code_for_email(email):
     code = generate_reset_code()
     expiry = datetime.now() + timedelta(minutes=5) # Code will expire in 5 minutes
     supabase_db.set_user_reset_code(email, code, expiry) # Store the reset code in the database and its expiration time
-    success, error_msg = send_password_reset_email(email, code) # Send the reset code via email
-    return success, error_msg 
+    return email_sender.queue_password_reset_email(email, code) # Queue the email; the outbox worker sends it
+
+# Key for the per-client rate limits (rate_limit.client_address). The socket
+# peer of the browser's websocket is not public API, so it is read from the
+# runtime's session manager. When it is unavailable (AppTest, bare mode) there
+# is no per-client key, and the per-username and per-email buckets are the only
+# protection; a new session or reconnect must never buy a fresh bucket.
+def client_key():
+    ctx = get_script_run_ctx()
+    peer = None
+    if ctx is not None and runtime.exists():
+        session_mgr = getattr(runtime.get_instance(), "_session_mgr", None)
+        info = session_mgr.get_active_session_info(ctx.session_id) if session_mgr else None
+        request = getattr(info.client, "request", None) if info else None
+        peer = getattr(request, "remote_ip", None)
+    return rate_limit.client_address(peer, st.context.headers.get("X-Forwarded-For"))
+
+# Rows per page for the paginated tables (leaderboard, user list)
+TABLE_PAGE_SIZE = 50
+
+# Renders one keyset-paginated page with Previous/Next buttons. The cursors of
+# the pages visited so far live in session state so going back is free.
+# Returns the rows of the current page and the number of rows before it.
+def paged_table(key, fetch_page, cursor_of):
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    rows = fetch_page(cursors[-1], TABLE_PAGE_SIZE + 1) # One extra row tells us whether a next page exists
+    has_next = len(rows) > TABLE_PAGE_SIZE
+    rows = rows[:TABLE_PAGE_SIZE]
+    offset = (len(cursors) - 1) * TABLE_PAGE_SIZE
+    col1, col2 = st.columns(2)
+    if col1.button("Previous", key=f"{key}_prev", disabled=len(cursors) == 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    if col2.button("Next", key=f"{key}_next", disabled=not has_next, use_container_width=True):
+        cursors.append(cursor_of(rows[-1]))
+        st.rerun()
+    return rows, offset
 
 # Renders the authentication panel for login, registration, and password reset
 # This is the first page the user sees when the load the webpage if they are not already logged in
@@ -48,14 +162,19 @@ def auth_panel():
             password = st.text_input("Password", type='password')
             submitted = st.form_submit_button("Login", use_container_width=True)
             if submitted:
-                user = authenticate(username, password)
-                if user:
-                    st.session_state.user = user
-                    st.success(f"Logged in as {user.username} ({user.role})")
-                    st.session_state.page = "main"
-                    st.rerun()
+                try:
+                    user = authenticate(username, password, client_key())
+                except (rate_limit.RateLimitedError, AuthBusyError) as e:
+                    st.error(str(e))
                 else:
-                    st.error("Login failed")
+                    if user:
+                        st.session_state.user = user
+                        set_session_cookie(sessions.issue_token(user))
+                        st.success(f"Logged in as {user.username} ({user.role})")
+                        st.session_state.page = "main"
+                        st.rerun()
+                    else:
+                        st.error("Login failed")
 
     with tab2:
         st.subheader("Register")
@@ -81,19 +200,20 @@ def auth_panel():
                 elif role not in ["Admin", "Member"]:
                     st.error("Role must be Admin or Member.")
                 else:
-                    hashed = hash_password(password)
-                    u = User(
-                        user_id=None,
-                        username=username.strip(),
-                        password=hashed,
-                        email=email.strip(),
-                        reedz_balance=0,
-                        role=role,
-                        created_at=datetime.now()
-                    )
                     try:
+                        u = User(
+                            user_id=None,
+                            username=username.strip(),
+                            password=hash_password(password),
+                            email=email.strip(),
+                            reedz_balance=0,
+                            role=role,
+                            created_at=datetime.now()
+                        )
                         supabase_db.create_user(u)
                         st.success("Registration successful! Please log in.")
+                    except AuthBusyError as e:
+                        st.error(str(e))
                     except Exception as e:
                         msg = str(e)
                         if "unique" in msg.lower() or "already exists" in msg.lower():
@@ -113,20 +233,40 @@ def auth_panel():
             email = st.text_input("Enter your email address", value=st.session_state.get("reset_email_val", ""))
             send_code_clicked = st.form_submit_button("Send Reset Code")
             if send_code_clicked:
-                found_user = supabase_db.get_user_by_email(email)
-                if not found_user:
-                    st.error("No user found for this email.")
-                    st.session_state["sent_reset_email"] = False
+                try:
+                    rate_limit.check_reset(email, client_key())
+                except rate_limit.RateLimitedError as e:
+                    st.error(str(e))
                 else:
-                    success, error_msg = set_reset_code_for_email(email)
-                    if success:
-                        st.session_state["sent_reset_email"] = True
-                        st.session_state["reset_email_val"] = email
-                        st.session_state["reset_code_sent_to"] = email
-                        st.success("A reset code has been sent to your email.")
-                    else:
+                    found_user = supabase_db.get_user_by_email(email)
+                    if not found_user:
+                        st.error("No user found for this email.")
                         st.session_state["sent_reset_email"] = False
-                        st.error(f"Failed to send reset email: {error_msg}")
+                    else:
+                        try:
+                            outbox_row = set_reset_code_for_email(email)
+                        except Exception as e:
+                            st.session_state["sent_reset_email"] = False
+                            st.error(f"Failed to send reset email: {e}")
+                        else:
+                            st.session_state["sent_reset_email"] = True
+                            st.session_state["reset_email_val"] = email
+                            st.session_state["reset_code_sent_to"] = email
+                            st.session_state["reset_outbox_id"] = outbox_row["outbox_id"]
+                            st.success("Your reset code is on its way. Check your email in a minute.")
+
+        # Delivery status of the queued reset email, until it has gone out
+        outbox_id = st.session_state.get("reset_outbox_id")
+        if st.session_state["sent_reset_email"] and outbox_id is not None:
+            delivery = email_sender.get_delivery_status(outbox_id)
+            if delivery is None or delivery["status"] == "sent":
+                st.session_state["reset_outbox_id"] = None
+            elif delivery["status"] == "failed":
+                st.error(f"We could not deliver the reset email: {delivery['last_error']}")
+            elif delivery["last_error"]:
+                st.caption(f"Email status: {delivery['status']}, retrying after: {delivery['last_error']}")
+            else:
+                st.caption(f"Email status: {delivery['status']}")
 
         if st.session_state["sent_reset_email"]:
             with st.form("change_pw_form", clear_on_submit=False):
@@ -144,16 +284,20 @@ def auth_panel():
                     elif not supabase_db.check_reset_code(st.session_state["reset_email_val"], code):
                         st.error("Invalid or expired reset code.")
                     else:
-                        hashed = hash_password(new_password)
-                        ok = supabase_db.update_user_password_by_email(st.session_state["reset_email_val"], hashed)
-                        supabase_db.clear_reset_code(st.session_state["reset_email_val"])
-                        if ok:
-                            st.success("Password reset successful. You may now log in.")
-                            st.session_state["sent_reset_email"] = False
-                            st.session_state["reset_email_val"] = ""
-                            st.session_state["reset_code_sent_to"] = ""
+                        try:
+                            hashed = hash_password(new_password)
+                        except AuthBusyError as e:
+                            st.error(str(e))
                         else:
-                            st.error("Password reset failed.")
+                            ok = supabase_db.update_user_password_by_email(st.session_state["reset_email_val"], hashed)
+                            supabase_db.clear_reset_code(st.session_state["reset_email_val"])
+                            if ok:
+                                st.success("Password reset successful. You may now log in.")
+                                st.session_state["sent_reset_email"] = False
+                                st.session_state["reset_email_val"] = ""
+                                st.session_state["reset_code_sent_to"] = ""
+                            else:
+                                st.error("Password reset failed.")
                 if cancel:
                     st.session_state["sent_reset_email"] = False
                     st.session_state["reset_email_val"] = ""
@@ -161,40 +305,43 @@ def auth_panel():
 
 def leaderboard_panel():
     st.subheader("Leaderboard")
-    leaderboard = supabase_db.get_leaderboard()
+    leaderboard, offset = paged_table("leaderboard", cached_db.get_leaderboard_page, leaderboard_cursor)
     if leaderboard:
+        # Ties share a rank; on later pages the first row may be tied with the previous page
+        first_rank = 1 if offset == 0 else cached_db.get_rank(leaderboard[0]["user_id"], 0)["rank"]
         st.dataframe([
-            {"Rank": idx + 1, "Username": entry["username"], "Reedz": entry["reedz_balance"]}
-            for idx, entry in enumerate(leaderboard)
+            {"Rank": entry["rank"], "Username": entry["username"], "Reedz": entry["reedz_balance"]}
+            for entry in rank_rows(leaderboard, first_rank=first_rank, first_index=offset)
         ], use_container_width=True)
     else:
         st.info("No users found.")
 
 def bets_panel():
     st.subheader("All Bets Overview")
-    open_bets = get_bet_overview("open")
-    closed_bets = get_bet_overview("closed")
-    resolved_bets = get_bet_overview("resolved")
+    grouped = cached_db.get_bets_grouped()
+    open_bets = grouped["open"]
+    closed_bets = grouped["closed"]
+    resolved_bets = grouped["resolved"]
 
     with st.expander("Open Bets", expanded=True):
         if open_bets:
             for bet in open_bets:
-                st.write(f"**ID {bet['bet_id']}** | {bet['title']} (closes {timestamper.format_et(bet['close_at'])})")
+                st.write(f"**ID {bet.bet_id}** | {bet.title} (closes {timestamper.format_et(bet.close_at)})")
         else:
             st.info("No open bets.")
 
     with st.expander("Closed Bets"):
         if closed_bets:
             for bet in closed_bets:
-                st.write(f"**ID {bet['bet_id']}** | {bet['title']} (closed {timestamper.format_et(bet['close_at'])})")
+                st.write(f"**ID {bet.bet_id}** | {bet.title} (closed {timestamper.format_et(bet.close_at)})")
         else:
             st.info("No closed bets.")
 
     with st.expander("Resolved Bets"):
         if resolved_bets:
             for bet in resolved_bets:
-                ans_str = f" | Answer: {bet.get('correct_answer', 'N/A')}"
-                st.write(f"**ID {bet['bet_id']}** | {bet['title']}{ans_str}")
+                ans_str = f" | Answer: {bet.correct_answer}"
+                st.write(f"**ID {bet.bet_id}** | {bet.title}{ans_str}")
         else:
             st.info("No resolved bets.")
 
@@ -202,42 +349,32 @@ def bets_panel():
 
 def predictions_panel():
     st.subheader("View Predictions for a Bet")
-    all_bets = get_bet_overview("open") + get_bet_overview("closed") + get_bet_overview("resolved")
-    if not all_bets:
-        st.info("No bets available.")
-        return
+    grouped = cached_db.get_bets_grouped()
     
     # Clean dropdown with status
     bet_titles = {}
-    for b in all_bets:
-        status = "Open" if not b.get('is_closed') and not b.get('is_resolved') else \
-                "Closed" if b.get('is_closed') else "Resolved"
-        bet_titles[f"ID {b['bet_id']} - {b['title']} ({status})"] = b['bet_id']
+    for state in BET_STATES:
+        for b in grouped[state]:
+            bet_titles[f"ID {b.bet_id} - {b.title} ({state.capitalize()})"] = b
+    if not bet_titles:
+        st.info("No bets available.")
+        return
     
     opt = st.selectbox("Select a bet", list(bet_titles.keys()))
     if not opt:
         st.info("No bet selected.")
         return
     
-    bet_id = bet_titles[opt]
-    predictions = supabase_db.get_predictions_for_bet(bet_id)
+    bet = bet_titles[opt]
+    predictions = cached_db.get_prediction_batch(bet.bet_id, bet.answer_type)
     
     if predictions:
-        user_cache = {}
-        pred_data = []
-        for p in predictions:
-            # ✅ FIXED: p is Prediction OBJECT, use .user_id attribute
-            user_id = p.user_id  # NOT p["user_id"]
-            
-            if user_id not in user_cache:
-                user = supabase_db.get_user_by_id(user_id)
-                user_cache[user_id] = user.username if user else f"ID {user_id}"
-            
-            pred_data.append({
-                "User": user_cache[user_id],
-                "Prediction": p.prediction,  # NOT p["prediction"]
-                "Created": timestamper.format_et(p.created_at)  # NOT p["created_at"]
-            })
+        # One list per column straight from the batch
+        pred_data = {
+            "User": [name or f"ID {user_id}" for name, user_id in zip(predictions.usernames, predictions.user_ids)],
+            "Prediction": predictions.prediction_labels(),
+            "Created": timestamper.format_et_micros(predictions.created_at),
+        }
         
         st.dataframe(pred_data, use_container_width=True)
     else:
@@ -261,8 +398,8 @@ def create_bet_panel(user):
 
 def place_prediction_panel(user):
     st.subheader("Place Prediction")
-    open_bets = get_bet_overview("open")
-    bet_titles = {f"ID {b['bet_id']}: {b['title']}": b['bet_id'] for b in open_bets}
+    open_bets = cached_db.get_bets_grouped()["open"]
+    bet_titles = {f"ID {b.bet_id}: {b.title}": b.bet_id for b in open_bets}
     if not bet_titles:
         st.info("No open bets for prediction.")
         return
@@ -281,8 +418,8 @@ def place_prediction_panel(user):
 
 def close_bet_panel(user):
     st.subheader("Close Bet")
-    open_bets = get_bet_overview("open")
-    bet_titles = {f"ID {b['bet_id']}: {b['title']}": b['bet_id'] for b in open_bets}
+    open_bets = cached_db.get_bets_grouped()["open"]
+    bet_titles = {f"ID {b.bet_id}: {b.title}": b.bet_id for b in open_bets}
     if not bet_titles:
         st.info("No open bets to close.")
         return
@@ -300,8 +437,8 @@ def close_bet_panel(user):
 
 def resolve_bet_panel(user):
     st.subheader("Resolve Bet")
-    closed_bets = get_bet_overview("closed")
-    bet_titles = {f"ID {b['bet_id']}: {b['title']}": b['bet_id'] for b in closed_bets}
+    closed_bets = cached_db.get_bets_grouped()["closed"]
+    bet_titles = {f"ID {b.bet_id}: {b.title}": b.bet_id for b in closed_bets}
     if not bet_titles:
         st.info("No bets available to resolve.")
         return
@@ -318,12 +455,23 @@ def resolve_bet_panel(user):
         except Exception as e:
             st.error(str(e))
 
+# Admin actions look their target up by username (one indexed read) rather
+# than listing every user into a selectbox
+def pick_user(label, key):
+    username = st.text_input(label, key=key).strip()
+    if not username:
+        return None
+    target = supabase_db.get_user_by_username(username)
+    if target is None:
+        st.error("No user with that username.")
+    return target
+
 def user_management_panel():
     st.subheader("Admin: User Management")
     sub_menu = st.radio("Choose action", ["List users", "Promote/Demote", "Change Reedz", "Delete user"])
     # When listing users, use user.userid consistently
     if sub_menu == "List users":
-        users = supabase_db.list_all_users()
+        users, _ = paged_table("users", cached_db.list_users_page, user_cursor)
         user_data = []
         for u in users:
             user_data.append({
@@ -335,10 +483,10 @@ def user_management_panel():
             })
         st.dataframe(user_data, use_container_width=True)
     elif sub_menu == "Promote/Demote":
-        users = supabase_db.list_all_users()
-        user_map = {f"{u['username']} (ID {u['user_id']}) - {u['role']}": u['user_id'] for u in users}
-        opt = st.selectbox("Pick user to modify", list(user_map.keys()))
-        uid = user_map[opt]
+        target = pick_user("Username of the user to modify", "promote_username")
+        if target is None:
+            return
+        st.caption(f"{target.username} (ID {target.user_id}) - {target.role}")
         new_role = st.selectbox("New Role", ["Admin", "Member"])
         admin_code = ""
         if new_role == "Admin":
@@ -348,38 +496,38 @@ def user_management_panel():
                 return
         if st.button("Promote/Demote"):
             try:
-                supabase_db.change_role(uid, new_role)
+                supabase_db.change_role(target.user_id, new_role)
                 st.success("Role updated.")
             except Exception as e:
                 st.error(str(e))
     elif sub_menu == "Change Reedz":
-        users = supabase_db.list_all_users()
-        user_map = {f"{u['username']} (ID {u['user_id']}) - {u['reedz_balance']} Reedz": u for u in users}
-        opt = st.selectbox("Pick user", list(user_map.keys()))
-        uid = user_map[opt]['user_id']
-        reedz = st.number_input("New Reedz balance", min_value=0, value=user_map[opt]['reedz_balance'])
+        target = pick_user("Username", "reedz_username")
+        if target is None:
+            return
+        st.caption(f"{target.username} (ID {target.user_id}) - {target.reedz_balance} Reedz")
+        reedz = st.number_input("New Reedz balance", min_value=0, value=target.reedz_balance)
         if st.button("Update Reedz"):
-            delta = reedz - user_map[opt]['reedz_balance']
             try:
-                supabase_db.add_reedz(uid, delta)
+                supabase_db.set_reedz_balance(target.user_id, reedz)
                 st.success("Reedz updated.")
             except Exception as e:
                 st.error(str(e))
     elif sub_menu == "Delete user":
-        users = supabase_db.list_all_users()
-        user_map = {f"{u['username']} (ID {u['user_id']})": u['user_id'] for u in users}
-        opt = st.selectbox("Pick user to delete", list(user_map.keys()))
-        uid = user_map[opt]
+        target = pick_user("Username of the user to delete", "delete_username")
+        if target is None:
+            return
+        st.caption(f"{target.username} (ID {target.user_id})")
         if st.button("Confirm Delete"):
             try:
-                supabase_db.delete_user(uid)
+                supabase_db.delete_user(target.user_id)
                 st.success("User deleted.")
             except Exception as e:
                 st.error(str(e))
 
 def profile_panel(user):
     st.subheader("My Profile")
-    user_db = supabase_db.get_user_by_id(user.user_id)
+    profile = cached_db.load_profile(user.user_id)
+    user_db = profile["user"]
     
     if user_db:
         col1, col2 = st.columns(2)
@@ -390,11 +538,72 @@ def profile_panel(user):
             st.write(f"**Reedz Balance:** {user_db.reedz_balance:,}")
             st.write(f"**Role:** {user_db.role}")
             st.write(f"**Member Since:** {timestamper.format_et(user_db.created_at)}")  # ✅ FIXED
+        standing = profile["standing"]
+        if standing:
+            st.write(f"**Leaderboard Rank:** #{standing['rank']}")
+            st.dataframe([
+                {"Rank": row["rank"], "Username": row["username"], "Reedz": row["reedz_balance"]}
+                for row in standing["above"] + [standing] + standing["below"]
+            ], use_container_width=True)
+        history = profile["history"]
+        with st.expander("Reedz History"):
+            if history:
+                st.dataframe([
+                    {
+                        "Change": h["delta"],
+                        "Reason": h["reason"],
+                        "Bet": h["bet_id"] if h["bet_id"] is not None else "",
+                        "When": timestamper.format_et(h["created_at"]),
+                    }
+                    for h in history
+                ], use_container_width=True)
+            else:
+                st.info("No Reedz changes yet.")
     else:
         st.error("Could not retrieve user profile.")
 
 
 
+def diagnostics_panel():
+    st.subheader("Diagnostics")
+    st.caption("Data-layer calls made by this server process since start-up or the last reset.")
+    rows = metrics.snapshot()
+    if rows:
+        st.dataframe([
+            {
+                "Function": r["function"],
+                "Calls": r["calls"],
+                "Errors": r["errors"],
+                "Rows": r["rows"],
+                "Avg ms": round(r["avg_ms"], 2),
+                "p50 ms": r["p50_ms"],
+                "p95 ms": r["p95_ms"],
+            }
+            for r in sorted(rows, key=lambda r: r["calls"], reverse=True)
+        ], use_container_width=True)
+    else:
+        st.info("No data-layer calls recorded yet.")
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.write("**Supabase HTTP client**")
+        st.json(supabase_db.client_stats() or {"backend": supabase_db.REEDZ_BACKEND})
+    with col2:
+        st.write("**User cache**")
+        st.json(supabase_db.user_cache_stats())
+    with col3:
+        st.write("**Password hashing**")
+        st.json(bcrypt_stats())
+    with col4:
+        st.write("**Email outbox**")
+        st.json(email_sender.outbox_stats() or {"worker": "not running"})
+    with col5:
+        st.write("**Rate limits**")
+        st.json(rate_limit.rate_limit_stats())
+    st.download_button("Download Prometheus metrics", metrics.render_prometheus(), file_name="reedz_metrics.prom")
+    if st.button("Reset counters"):
+        metrics.reset()
+        st.rerun()
+
 def main_panel():
     user = st.session_state.user
     st.sidebar.title("Reedz Betting Menu")
@@ -407,7 +616,7 @@ def main_panel():
         "Place Prediction", "View Predictions for a Bet"
     ]
     if is_admin(user):
-        admin_pages = ["Create Bet", "Close Bet", "Resolve Bet", "User Management"]
+        admin_pages = ["Create Bet", "Close Bet", "Resolve Bet", "User Management", "Diagnostics"]
         pages = admin_pages + pages
     page = st.sidebar.radio("Navigation", pages)
     if page == "My Profile":
@@ -420,6 +629,8 @@ def main_panel():
         resolve_bet_panel(user)
     elif is_admin(user) and page == "User Management":
         user_management_panel()
+    elif is_admin(user) and page == "Diagnostics":
+        diagnostics_panel()
     elif page == "Leaderboard":
         leaderboard_panel()
     elif page == "All Bets":
@@ -431,11 +642,18 @@ def main_panel():
     st.sidebar.write("")
     if st.sidebar.button("Logout"):
         st.session_state.user = None
+        set_session_cookie(None)
         st.session_state.page = "home"
         st.success("Logged out. Please log in/register again.")
         st.rerun()
 
 def run_app():
+    if st.session_state.user is not None:
+        # Served from the user cache; picks up role changes and deleted accounts
+        st.session_state.user = supabase_db.get_user_by_id(st.session_state.user.user_id)
+        if st.session_state.user is None:
+            set_session_cookie(None)
+            st.session_state.page = "home"
     if st.session_state.user is None:
         auth_panel()
     else:
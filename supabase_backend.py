@@ -0,0 +1,546 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+import httpx
+from postgrest.exceptions import APIError
+from supabase import create_client, acreate_client, AsyncClient, AsyncClientOptions, Client, ClientOptions
+from models import User, Bet, Prediction, user_from_row, bet_from_row, bet_summary_from_row, prediction_from_row, prediction_batch_from_rows, reedz_txn_from_row
+from leaderboard import rank_entry
+from repository import (
+    Repository, BetClosedError, DuplicatePredictionError, BET_SUMMARY_COLUMNS, DEFAULT_PAGE_SIZE, bet_cursor, group_bets, iter_pages,
+    user_row, bet_row, prediction_row, to_db_value,
+)
+
+BET_COLUMNS = (
+    "bet_id, created_by_user_id, title, description, answer_type, correct_answer, "
+    "is_open, is_resolved, is_closed, created_at, close_at, resolved_at"
+)
+
+# Applies {user_id: delta} in chunks, one RPC round trip per chunk
+ADD_REEDZ_CHUNK_SIZE = 1000
+
+# HTTP tuning. The sync client and the async client (async_db) each have their
+# own keep-alive pool with these limits, so a process that uses both can hold
+# up to 2 * HTTP_MAX_CONNECTIONS connections. Every request has a timeout so a
+# stalled PostgREST response fails instead of hanging the Streamlit session.
+HTTP_TIMEOUT_SECONDS = float(os.getenv("REEDZ_HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REEDZ_HTTP_CONNECT_TIMEOUT_SECONDS", "3"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("REEDZ_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("REEDZ_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("REEDZ_HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+# Idempotent requests are retried on transient failures with full-jitter
+# exponential backoff: sleep uniform(0, min(cap, base * 2**attempt)).
+RETRY_ATTEMPTS = int(os.getenv("REEDZ_HTTP_RETRIES", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("REEDZ_HTTP_RETRY_BASE_SECONDS", "0.2"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("REEDZ_HTTP_RETRY_MAX_SECONDS", "2"))
+TRANSIENT_STATUS_CODES = {408, 429, 502, 503, 504, 520, 522, 524}
+
+
+def http_timeout():
+    return httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+
+def http_limits():
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+def is_transient(error):
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, APIError):
+        try:
+            return int(error.code) in TRANSIENT_STATUS_CODES
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def retry_delay(attempt):
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+class RequestStats:
+    # Process-wide counters for client_stats()
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.retries = 0
+            self.failures = 0
+            self.timeouts = 0
+            self.latency_seconds = 0.0
+            self.max_latency_seconds = 0.0
+
+    def record(self, seconds, retries, failed=False, timed_out=False):
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.failures += failed
+            self.timeouts += timed_out
+            self.latency_seconds += seconds
+            self.max_latency_seconds = max(self.max_latency_seconds, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "avg_latency_ms": self.latency_seconds / self.requests * 1000 if self.requests else 0.0,
+                "max_latency_ms": self.max_latency_seconds * 1000,
+            }
+
+
+request_stats = RequestStats()
+
+def client_stats():
+    return request_stats.snapshot()
+
+def execute(request, idempotent=True):
+    # postgrest's own retry (GET only, fixed delays) is switched off so this
+    # loop is the only one. Latency covers all attempts including backoff.
+    request.retry(False)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            res = request.execute()
+        except Exception as e:
+            if idempotent and attempt < RETRY_ATTEMPTS and is_transient(e):
+                time.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+            request_stats.record(time.perf_counter() - start, attempt, failed=True,
+                                 timed_out=isinstance(e, httpx.TimeoutException))
+            raise
+        request_stats.record(time.perf_counter() - start, attempt)
+        return res
+
+async def execute_async(request, idempotent=True):
+    request.retry(False)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            res = await request.execute()
+        except Exception as e:
+            if idempotent and attempt < RETRY_ATTEMPTS and is_transient(e):
+                await asyncio.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+            request_stats.record(time.perf_counter() - start, attempt, failed=True,
+                                 timed_out=isinstance(e, httpx.TimeoutException))
+            raise
+        request_stats.record(time.perf_counter() - start, attempt)
+        return res
+
+# Query builders shared by the sync and async repositories. postgrest builds
+# the same request for both clients; only how they are executed differs.
+def users_page_query(client, after, limit):
+    query = client.table("users").select("user_id, username, email, role, reedz_balance")
+    if after is not None:
+        query = query.gt("user_id", after)
+    return query.order("user_id").limit(limit)
+
+def user_by_query(client, column, value):
+    return client.table("users").select("*").eq(column, value).limit(1)
+
+def reedz_history_query(client, user_id, limit):
+    return client.table("reedz_transactions").select(
+        "txn_id, delta, reason, bet_id, created_at"
+    ).eq("user_id", user_id).order("created_at", desc=True).limit(limit)
+
+def leaderboard_page_query(client, after, limit):
+    query = client.table("users").select("user_id, username, reedz_balance")
+    if after is not None:
+        balance, user_id = after
+        query = query.or_(f"reedz_balance.lt.{balance},and(reedz_balance.eq.{balance},user_id.gt.{user_id})")
+    return query.order("reedz_balance", desc=True).order("user_id").limit(limit)
+
+def leaderboard_rank_call(client, user_id, neighbours):
+    # Window-function RPC, see sql/003_leaderboard_rank.sql
+    return client.rpc("get_leaderboard_rank", {"p_user_id": user_id, "p_neighbours": neighbours})
+
+def bets_page_query(client, state, after, limit):
+    bets = client.table("bets").select(BET_COLUMNS)
+    if state == "open":
+        bets = bets.eq("is_closed", False).eq("is_resolved", False)
+    elif state == "closed":
+        bets = bets.eq("is_closed", True).eq("is_resolved", False)
+    elif state == "resolved":
+        bets = bets.eq("is_resolved", True)
+    if after is not None:
+        bets = bets.gt("bet_id", after)
+    return bets.order("bet_id").limit(limit)
+
+def bet_summary_page_query(client, after, limit):
+    query = client.table("bets").select(", ".join(BET_SUMMARY_COLUMNS))
+    if after is not None:
+        query = query.gt("bet_id", after)
+    return query.order("bet_id").limit(limit)
+
+def prediction_batch_page_query(client, bet_id, with_usernames, after, limit):
+    # users(username) is an embedded resource: PostgREST joins users through
+    # the predictions.user_id foreign key in the same request
+    columns = "prediction_id, user_id, prediction, created_at"
+    query = client.table("predictions").select(columns + (", users(username)" if with_usernames else "")).eq("bet_id", bet_id)
+    if after is not None:
+        created_at, prediction_id = after
+        query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",prediction_id.gt.{prediction_id})')
+    return query.order("created_at").order("prediction_id").limit(limit)
+
+def prediction_batch_cursor(row):
+    return (row["created_at"], row["prediction_id"])
+
+def flatten_usernames(rows):
+    for p in rows:
+        user = p.pop("users", None) or {}
+        p["username"] = user.get("username")
+    return rows
+
+
+class SupabaseRepository(Repository):
+    def __init__(self, client: Client):
+        self.supabase = client
+
+    @classmethod
+    def from_env(cls, url=None, key=None):
+        url = url or os.getenv("SUPABASE_URL")
+        key = key or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise Exception("SUPABASE_URL and SUPABASE_KEY must be set in your .env file.")
+        http_client = httpx.Client(timeout=http_timeout(), limits=http_limits())
+        return cls(create_client(url, key, options=ClientOptions(
+            postgrest_client_timeout=http_timeout(), httpx_client=http_client,
+        )))
+
+    def client_stats(self):
+        return client_stats()
+
+    # USER FUNCTIONS
+    def create_user(self, user: User):
+        res = execute(self.supabase.table("users").insert(user_row(user)), idempotent=False)
+        return res.data
+
+    def list_users_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        return execute(users_page_query(self.supabase, after, limit)).data
+
+    def _get_user_by(self, column, value):
+        res = execute(user_by_query(self.supabase, column, value))
+        if not res.data:
+            return None
+        return user_from_row(res.data[0])
+
+    def get_user_by_username(self, username):
+        return self._get_user_by("username", username)
+
+    def get_user_by_email(self, email):
+        return self._get_user_by("email", email)
+
+    def get_user_by_id(self, user_id):
+        return self._get_user_by("user_id", user_id)
+
+    def update_user_password(self, user_id, hashed_password):
+        res = execute(self.supabase.table("users").update({"password": hashed_password}).eq("user_id", user_id))
+        return res.data
+
+    def update_user_password_by_email(self, email, hashed_password):
+        res = execute(self.supabase.table("users").update({"password": hashed_password}).eq("email", email))
+        return res.data
+
+    def update_user_email(self, user_id, new_email):
+        res = execute(self.supabase.table("users").update({"email": new_email}).eq("user_id", user_id))
+        return res.data
+
+    def set_user_reset_code(self, email, code, expiry):
+        res = execute(self.supabase.table("users").update({
+            "reset_code": code,
+            "reset_code_expiry": to_db_value(expiry),
+        }).eq("email", email))
+        return res.data
+
+    def get_reset_code(self, email):
+        res = execute(self.supabase.table("users").select("reset_code, reset_code_expiry").eq("email", email))
+        return res.data[0] if res.data else None
+
+    def clear_reset_code(self, email):
+        res = execute(self.supabase.table("users").update({"reset_code": None, "reset_code_expiry": None}).eq("email", email))
+        return res.data
+
+    # Every balance change is written to the reedz_transactions ledger and applied
+    # as an atomic increment on the server (see sql/002_reedz_transactions.sql)
+    def add_reedz(self, user_id, delta, reason="adjustment", bet_id=None):
+        res = execute(self.supabase.rpc("record_reedz", {
+            "p_user_id": user_id,
+            "p_delta": delta,
+            "p_reason": reason,
+            "p_bet_id": bet_id,
+        }), idempotent=False)
+        return res.data
+
+    def set_reedz_balance(self, user_id, new_balance, reason="admin_adjustment"):
+        res = execute(self.supabase.rpc("set_reedz", {
+            "p_user_id": user_id,
+            "p_balance": new_balance,
+            "p_reason": reason,
+        }))
+        return res.data
+
+    def add_reedz_many(self, deltas, reason="bet_payout", bet_id=None, idempotency_key=None):
+        # With an idempotency key every chunk carries its own derived key
+        # (sql/006_idempotent_reedz.sql), so the chunks can be retried, or the
+        # whole call repeated, without paying anyone twice
+        items = [{"user_id": uid, "delta": delta} for uid, delta in sorted(deltas.items()) if delta]
+        results = []
+        for start in range(0, len(items), ADD_REEDZ_CHUNK_SIZE):
+            chunk = items[start:start + ADD_REEDZ_CHUNK_SIZE]
+            res = execute(self.supabase.rpc("add_reedz_many", {
+                "deltas": chunk,
+                "p_reason": reason,
+                "p_bet_id": bet_id,
+                "p_idempotency_key": f"{idempotency_key}:{start}" if idempotency_key else None,
+            }), idempotent=idempotency_key is not None)
+            results.extend(res.data or [])
+        return results
+
+    def get_reedz_history(self, user_id, limit=50):
+        return [reedz_txn_from_row(row) for row in execute(reedz_history_query(self.supabase, user_id, limit)).data]
+
+    def delete_user(self, user_id):
+        res = execute(self.supabase.table("users").delete().eq("user_id", user_id))
+        return res.data
+
+    def change_role(self, user_id, new_role):
+        res = execute(self.supabase.table("users").update({"role": new_role}).eq("user_id", user_id))
+        return res.data
+
+    def get_leaderboard_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        return execute(leaderboard_page_query(self.supabase, after, limit)).data
+
+    def get_rank(self, user_id, neighbours=2):
+        res = execute(leaderboard_rank_call(self.supabase, user_id, neighbours))
+        return rank_entry(user_id, res.data or [])
+
+    # BET FUNCTIONS
+    def create_bet(self, bet: Bet):
+        res = execute(self.supabase.table("bets").insert(bet_row(bet)), idempotent=False)
+        return res.data
+
+    def create_bets_many(self, bets):
+        if not bets:
+            return []
+        res = execute(self.supabase.table("bets").insert([bet_row(b) for b in bets]), idempotent=False)
+        return res.data
+
+    def get_bet(self, bet_id):
+        res = execute(self.supabase.table("bets").select("*").eq("bet_id", bet_id))
+        if res.data:
+            return bet_from_row(res.data[0])
+        return None
+
+    def get_bets_by_ids(self, bet_ids):
+        bet_ids = list(set(bet_ids))
+        if not bet_ids:
+            return []
+        res = execute(self.supabase.table("bets").select("*").in_("bet_id", bet_ids))
+        return [bet_from_row(b) for b in res.data]
+
+    def get_bets_page(self, state, after=None, limit=DEFAULT_PAGE_SIZE):
+        return [bet_from_row(b) for b in execute(bets_page_query(self.supabase, state, after, limit)).data]
+
+    def get_bets_grouped(self):
+        def fetch_page(after, limit):
+            return [bet_summary_from_row(b) for b in execute(bet_summary_page_query(self.supabase, after, limit)).data]
+        return group_bets(iter_pages(fetch_page, bet_cursor))
+
+    def close_bet(self, bet_id):
+        res = execute(self.supabase.table("bets").update({"is_open": False, "is_closed": True}).eq("bet_id", bet_id))
+        return res.data
+
+    def close_bets_many(self, bet_ids):
+        if not bet_ids:
+            return []
+        res = execute(self.supabase.table("bets").update({"is_open": False, "is_closed": True}).in_(
+            "bet_id", list(bet_ids)
+        ).eq("is_closed", False).eq("is_resolved", False))
+        return res.data
+
+    def get_pending_close_times(self):
+        # Served by the partial index in sql/005_bets_close_at_index.sql
+        def fetch_page(after, limit):
+            query = self.supabase.table("bets").select("bet_id, close_at").eq(
+                "is_closed", False
+            ).eq("is_resolved", False).not_.is_("close_at", "null")
+            if after is not None:
+                query = query.gt("bet_id", after)
+            return execute(query.order("bet_id").limit(limit)).data
+        return list(iter_pages(fetch_page, lambda row: row["bet_id"]))
+
+    def resolve_bet(self, bet_id, correct_answer):
+        res = execute(self.supabase.table("bets").update({
+            "is_resolved": True,
+            "correct_answer": correct_answer
+        }).eq("bet_id", bet_id))
+        return res.data
+
+    # PREDICTION FUNCTIONS
+    def create_prediction(self, prediction: Prediction):
+        res = execute(self.supabase.table("predictions").insert(prediction_row(prediction)), idempotent=False)
+        return res.data
+
+    def create_predictions_many(self, predictions):
+        if not predictions:
+            return []
+        res = execute(self.supabase.table("predictions").insert([prediction_row(p) for p in predictions]), idempotent=False)
+        return res.data
+
+    def place_prediction(self, prediction: Prediction):
+        # See sql/004_place_prediction.sql
+        try:
+            res = execute(self.supabase.rpc("place_prediction", {
+                "p_user_id": prediction.user_id,
+                "p_bet_id": prediction.bet_id,
+                "p_prediction": prediction.prediction,
+            }), idempotent=False)
+        except APIError as e:
+            if e.code == "23505":
+                raise DuplicatePredictionError() from e
+            if e.code == "RZ001":
+                raise BetClosedError() from e
+            raise
+        return res.data
+
+    def get_predictions_for_bet(self, bet_id):
+        res = execute(self.supabase.table("predictions").select("*").eq("bet_id", bet_id))
+        return [prediction_from_row(p) for p in res.data]
+
+    def get_prediction_batch(self, bet_id, answer_type, with_usernames=False):
+        # Paged, so bets with more predictions than PostgREST's max-rows load in full
+        def fetch_page(after, limit):
+            rows = execute(prediction_batch_page_query(self.supabase, bet_id, with_usernames, after, limit)).data
+            return flatten_usernames(rows) if with_usernames else rows
+        pages = iter_pages(fetch_page, prediction_batch_cursor)
+        return prediction_batch_from_rows(bet_id, answer_type, pages, with_usernames)
+
+    def get_user_predictions(self, user_id):
+        res = execute(self.supabase.table("predictions").select("*").eq("user_id", user_id))
+        return [prediction_from_row(p) for p in res.data]
+
+    def has_prediction(self, user_id, bet_id):
+        res = execute(self.supabase.table("predictions").select("prediction_id").eq("user_id", user_id).eq("bet_id", bet_id).limit(1))
+        return bool(res.data)
+
+    # EMAIL OUTBOX (sql/007_email_outbox.sql)
+    def enqueue_email(self, to_addr, subject, body):
+        return self.enqueue_emails_many([(to_addr, subject, body)])[0]
+
+    def enqueue_emails_many(self, messages):
+        if not messages:
+            return []
+        res = execute(self.supabase.table("email_outbox").insert([
+            {"to_addr": to_addr, "subject": subject, "body": body}
+            for to_addr, subject, body in messages
+        ]), idempotent=False)
+        return res.data
+
+    def claim_emails(self, limit, lease_seconds):
+        res = execute(self.supabase.rpc("claim_email_outbox", {
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+        }), idempotent=False)
+        return res.data or []
+
+    def update_email_status(self, outbox_id, status, last_error=None, next_attempt_at=None):
+        fields = {
+            "status": status,
+            "last_error": last_error,
+            "sent_at": to_db_value(datetime.now(timezone.utc)) if status == "sent" else None,
+        }
+        if next_attempt_at is not None:
+            fields["next_attempt_at"] = to_db_value(next_attempt_at)
+        res = execute(self.supabase.table("email_outbox").update(fields).eq("outbox_id", outbox_id))
+        return res.data[0] if res.data else None
+
+    def get_email(self, outbox_id):
+        res = execute(self.supabase.table("email_outbox").select("*").eq("outbox_id", outbox_id))
+        return res.data[0] if res.data else None
+
+    # NOTIFICATION EVENTS (sql/008_notification_events.sql)
+    def record_notification_events(self, events):
+        if not events:
+            return []
+        res = execute(self.supabase.table("notification_events").insert([
+            {"kind": kind, "bet_id": bet_id} for kind, bet_id in events
+        ]), idempotent=False)
+        return res.data
+
+    def claim_notification_events(self, limit):
+        res = execute(self.supabase.rpc("claim_notification_events", {"p_limit": limit}), idempotent=False)
+        return res.data or []
+
+    def release_notification_events(self, event_ids):
+        if not event_ids:
+            return []
+        res = execute(self.supabase.table("notification_events").update({"digested_at": None}).in_(
+            "event_id", list(event_ids)
+        ))
+        return res.data
+
+
+class AsyncSupabaseRepository:
+    # Read side of SupabaseRepository on the asyncio client, used by async_db
+    # to run independent queries concurrently. Writes stay on the sync client.
+
+    def __init__(self, client: AsyncClient):
+        self.supabase = client
+
+    @classmethod
+    async def from_env(cls, url=None, key=None):
+        url = url or os.getenv("SUPABASE_URL")
+        key = key or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise Exception("SUPABASE_URL and SUPABASE_KEY must be set in your .env file.")
+        http_client = httpx.AsyncClient(timeout=http_timeout(), limits=http_limits())
+        return cls(await acreate_client(url, key, options=AsyncClientOptions(
+            postgrest_client_timeout=http_timeout(), httpx_client=http_client,
+        )))
+
+    async def list_users_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        return (await execute_async(users_page_query(self.supabase, after, limit))).data
+
+    async def get_user_by_id(self, user_id):
+        res = await execute_async(user_by_query(self.supabase, "user_id", user_id))
+        return user_from_row(res.data[0]) if res.data else None
+
+    async def get_reedz_history(self, user_id, limit=50):
+        res = await execute_async(reedz_history_query(self.supabase, user_id, limit))
+        return [reedz_txn_from_row(row) for row in res.data]
+
+    async def get_leaderboard_page(self, after=None, limit=DEFAULT_PAGE_SIZE):
+        return (await execute_async(leaderboard_page_query(self.supabase, after, limit))).data
+
+    async def get_rank(self, user_id, neighbours=2):
+        res = await execute_async(leaderboard_rank_call(self.supabase, user_id, neighbours))
+        return rank_entry(user_id, res.data or [])
+
+    async def get_bets_page(self, state, after=None, limit=DEFAULT_PAGE_SIZE):
+        res = await execute_async(bets_page_query(self.supabase, state, after, limit))
+        return [bet_from_row(b) for b in res.data]
+
+    async def get_bets_grouped(self):
+        rows, after = [], None
+        while True:
+            page = (await execute_async(bet_summary_page_query(self.supabase, after, DEFAULT_PAGE_SIZE))).data
+            rows.extend(map(bet_summary_from_row, page))
+            if len(page) < DEFAULT_PAGE_SIZE:
+                return group_bets(rows)
+            after = bet_cursor(rows[-1])
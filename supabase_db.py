@@ -1,244 +1,330 @@
+import functools
 import os
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
-from supabase import create_client, Client
+import metrics
 from models import User, Bet, Prediction
+from leaderboard import rank_rows
+from repository import (
+    Repository, DEFAULT_PAGE_SIZE, create_repository, iter_pages,
+    user_cursor, leaderboard_cursor, bet_cursor,
+)
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Storage backend: "supabase" (default), "sqlite" or "memory". The repository is
+# created on first use so importing this module never needs credentials.
+REEDZ_BACKEND = os.getenv("REEDZ_BACKEND", "supabase")
+REEDZ_SQLITE_PATH = os.getenv("REEDZ_SQLITE_PATH", "reedz.db")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("SUPABASE_URL and SUPABASE_KEY must be set in your .env file.")
+_repository = None
+_repository_lock = threading.Lock()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def get_repository() -> Repository:
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                options = {"path": REEDZ_SQLITE_PATH} if REEDZ_BACKEND == "sqlite" else {}
+                _repository = create_repository(REEDZ_BACKEND, **options)
+    return _repository
+
+def set_repository(repository: Repository):
+    global _repository
+    with _repository_lock:
+        _repository = repository
+    _user_cache.clear()
+    bump_data_version()
+    return repository
+
+# Incremented by every mutation below; read caches key on it so they refresh
+# as soon as anything they might show has changed
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+def data_version():
+    return _data_version
+
+def bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+    return _data_version
+
+def _mutation(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            bump_data_version()
+    return wrapper
+
+# User records by id, for the lookups every Streamlit rerun makes. Writes to a
+# user through this module evict that user; the TTL bounds staleness for
+# changes made by other processes.
+USER_CACHE_SIZE = int(os.getenv("REEDZ_USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("REEDZ_USER_CACHE_TTL_SECONDS", "60"))
+
+
+class _UserCache:
+    def __init__(self, max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, User)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_user_cache = _UserCache()
+
+def client_stats():
+    return get_repository().client_stats()
+
+def user_cache_stats():
+    return {"size": len(_user_cache), "hits": _user_cache.hits, "misses": _user_cache.misses}
+
+def _invalidates_user(func):
+    # For functions whose first argument is the affected user_id
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        try:
+            return func(user_id, *args, **kwargs)
+        finally:
+            _user_cache.invalidate(user_id)
+    return wrapper
 
 # USER FUNCTIONS
+@_mutation
 def create_user(user: User):
-    res = supabase.table("users").insert({
-        "username": user.username,
-        "password": user.password,
-        "email": user.email,
-        "reedz_balance": user.reedz_balance,
-        "role": user.role,
-        "created_at": user.created_at.isoformat() if isinstance(user.created_at, datetime) else user.created_at,
-    }).execute()
-    return res
+    return get_repository().create_user(user)
 
 def list_all_users():
-    res = supabase.table("users").select("user_id, username, email, role, reedz_balance").execute()
-    return res.data
+    return get_repository().list_all_users()
+
+def list_users_page(after=None, limit=DEFAULT_PAGE_SIZE):
+    return get_repository().list_users_page(after=after, limit=limit)
+
+def iter_users(page_size=DEFAULT_PAGE_SIZE):
+    return iter_pages(list_users_page, user_cursor, page_size)
 
 def get_user_by_username(username):
-    res = supabase.table("users").select("*").eq("username", username).limit(1).execute()
-    data = res.data
-    if not data:
-        return None
-    user = data[0]
-    return User(
-        user_id=user["user_id"],
-        username=user["username"],
-        password=user["password"],
-        email=user["email"],
-        reedz_balance=user["reedz_balance"],
-        role=user["role"],
-        created_at=user["created_at"]
-    )
+    return get_repository().get_user_by_username(username)
 
 def get_user_by_email(email):
-    res = supabase.table("users").select("*").eq("email", email).limit(1).execute()
-    data = res.data
-    if not data:
-        return None
-    user = data[0]
-    return User(
-        user_id=user["user_id"],
-        username=user["username"],
-        password=user["password"],
-        email=user["email"],
-        reedz_balance=user["reedz_balance"],
-        role=user["role"],
-        created_at=user["created_at"]
-    )
+    return get_repository().get_user_by_email(email)
 
 def get_user_by_id(user_id):
-    res = supabase.table("users").select("*").eq("user_id", user_id).execute()
-    data = res.data
-    if not data:
-        return None
-    user_data = data[0]
-    return User(
-        user_id=user_data["user_id"],
-        username=user_data["username"],
-        password=user_data["password"],
-        email=user_data["email"],
-        reedz_balance=user_data["reedz_balance"],
-        role=user_data["role"],
-        created_at=user_data["created_at"],
-    )
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = get_repository().get_user_by_id(user_id)
+        if user is not None:
+            _user_cache.put(user_id, user)
+    return user
 
+@_invalidates_user
 def update_user_password(user_id, hashed_password):
-    res = supabase.table("users").update({"password": hashed_password}).eq("user_id", user_id).execute()
-    return res
+    return get_repository().update_user_password(user_id, hashed_password)
 
 def update_user_password_by_email(email, hashed_password):
-    res = supabase.table("users").update({"password": hashed_password}).eq("email", email).execute()
-    return res
+    rows = get_repository().update_user_password_by_email(email, hashed_password)
+    _user_cache.invalidate(*(row["user_id"] for row in rows or []))
+    return rows
 
+@_mutation
+@_invalidates_user
 def update_user_email(user_id, new_email):
-    res = supabase.table("users").update({"email": new_email}).eq("user_id", user_id).execute()
-    return res
+    return get_repository().update_user_email(user_id, new_email)
 
 def set_user_reset_code(email, code, expiry):
-    res = supabase.table("users").update({
-        "reset_code": code,
-        "reset_code_expiry": expiry.isoformat() if isinstance(expiry, datetime) else expiry
-    }).eq("email", email).execute()
-    return res
+    return get_repository().set_user_reset_code(email, code, expiry)
 
 def check_reset_code(email, code):
-    res = supabase.table("users").select("reset_code, reset_code_expiry").eq("email", email).execute()
-    if not res.data:
-        return False
-    user = res.data[0]
-    stored_code = user.get("reset_code")
-    expiry = user.get("reset_code_expiry")
-    if not stored_code or not expiry or stored_code != code:
-        return False
-    try:
-        expiry_dt = datetime.fromisoformat(expiry)
-        if expiry_dt.tzinfo is None:
-            expiry_dt = expiry_dt.replace(tzinfo=timezone.utc)
-    except Exception:
-        supabase.table("users").update({"reset_code": None, "reset_code_expiry": None}).eq("email", email).execute()
-        return False
-
-    now_utc = datetime.now(timezone.utc)
-    if expiry_dt < now_utc - timedelta(minutes=5):
-        supabase.table("users").update({"reset_code": None, "reset_code_expiry": None}).eq("email", email).execute()
-        return False
-    return True
+    return get_repository().check_reset_code(email, code)
 
 def clear_reset_code(email):
-    res = supabase.table("users").update({"reset_code": None, "reset_code_expiry": None}).eq("email", email).execute()
-    return res
+    return get_repository().clear_reset_code(email)
+
+# Every balance change is written to the reedz_transactions ledger and applied
+# as an atomic increment on the server (see sql/002_reedz_transactions.sql)
+@_mutation
+@_invalidates_user
+def add_reedz(user_id, delta, reason="adjustment", bet_id=None):
+    return get_repository().add_reedz(user_id, delta, reason=reason, bet_id=bet_id)
+
+@_mutation
+@_invalidates_user
+def set_reedz_balance(user_id, new_balance, reason="admin_adjustment"):
+    return get_repository().set_reedz_balance(user_id, new_balance, reason=reason)
+
+@_mutation
+def add_reedz_many(deltas, reason="bet_payout", bet_id=None, idempotency_key=None):
+    try:
+        return get_repository().add_reedz_many(deltas, reason=reason, bet_id=bet_id, idempotency_key=idempotency_key)
+    finally:
+        _user_cache.invalidate(*deltas)
 
-def add_reedz(user_id, delta):
-    user = get_user_by_id(user_id)
-    if not user:
-        return None
-    new_balance = user.reedz_balance + delta
-    res = supabase.table("users").update({"reedz_balance": new_balance}).eq("user_id", user_id).execute()
-    return res
+def get_reedz_history(user_id, limit=50):
+    return get_repository().get_reedz_history(user_id, limit=limit)
 
+@_mutation
+@_invalidates_user
 def delete_user(user_id):
-    res = supabase.table("users").delete().eq("user_id", user_id).execute()
-    return res
+    return get_repository().delete_user(user_id)
 
+@_mutation
+@_invalidates_user
 def change_role(user_id, new_role):
-    res = supabase.table("users").update({"role": new_role}).eq("user_id", user_id).execute()
-    return res
+    return get_repository().change_role(user_id, new_role)
 
 def get_leaderboard():
-    res = supabase.table("users").select("username, reedz_balance").order("reedz_balance", desc=True).execute()
-    return res.data
+    return get_repository().get_leaderboard()
+
+def get_leaderboard_page(after=None, limit=DEFAULT_PAGE_SIZE):
+    return get_repository().get_leaderboard_page(after=after, limit=limit)
+
+def iter_leaderboard(page_size=DEFAULT_PAGE_SIZE):
+    return iter_pages(get_leaderboard_page, leaderboard_cursor, page_size)
+
+def get_top_n(n, method="competition"):
+    return rank_rows(get_leaderboard_page(limit=n), method=method)
+
+def get_rank(user_id, neighbours=2):
+    return get_repository().get_rank(user_id, neighbours=neighbours)
 
 # BET FUNCTIONS
+@_mutation
 def create_bet(bet: Bet):
-    res = supabase.table("bets").insert({
-        "created_by_user_id": bet.created_by_user_id,
-        "title": bet.title,
-        "description": bet.description,
-        "answer_type": bet.answer_type,
-        "is_open": bet.is_open,
-        "is_resolved": bet.is_resolved,
-        "is_closed": bet.is_closed,
-        "created_at": bet.created_at.isoformat() if isinstance(bet.created_at, datetime) else bet.created_at,
-        "close_at": bet.close_at.isoformat() if isinstance(bet.close_at, datetime) else bet.close_at,
-        "resolved_at": bet.resolved_at.isoformat() if bet.resolved_at is not None and isinstance(bet.resolved_at, datetime) else bet.resolved_at,
-        "correct_answer": bet.correct_answer,
-    }).execute()
-    return res
+    return get_repository().create_bet(bet)
+
+@_mutation
+def create_bets_many(bets):
+    return get_repository().create_bets_many(bets)
 
 def get_bet(bet_id):
-    res = supabase.table("bets").select("*").eq("bet_id", bet_id).execute()
-    data = res.data
-    if data:
-        b = data[0]
-        return Bet(
-            bet_id=b["bet_id"],
-            created_by_user_id=b["created_by_user_id"],
-            title=b["title"],
-            description=b["description"],
-            answer_type=b["answer_type"],
-            is_open=b["is_open"],
-            is_resolved=b["is_resolved"],
-            is_closed=b.get("is_closed", False),
-            created_at=b["created_at"],
-            close_at=b["close_at"],
-            resolved_at=b["resolved_at"],
-            correct_answer=b["correct_answer"],
-        )
-    return None
+    return get_repository().get_bet(bet_id)
+
+def get_bets_by_ids(bet_ids):
+    return get_repository().get_bets_by_ids(bet_ids)
 
 def get_bets_by_state(state):
-    bets = supabase.table("bets").select(
-        "bet_id, created_by_user_id, title, description, answer_type, correct_answer, "
-        "is_open, is_resolved, is_closed, created_at, close_at, resolved_at"
-    )
-    if state == "open":
-        res = bets.eq("is_closed", False).eq("is_resolved", False).execute()
-    elif state == "closed":
-        res = bets.eq("is_closed", True).eq("is_resolved", False).execute()
-    elif state == "resolved":
-        res = bets.eq("is_resolved", True).execute()
-    else:
-        res = bets.execute()
-    return res.data
+    return get_repository().get_bets_by_state(state)
+
+def get_bets_page(state, after=None, limit=DEFAULT_PAGE_SIZE):
+    return get_repository().get_bets_page(state, after=after, limit=limit)
+
+def iter_bets(state, page_size=DEFAULT_PAGE_SIZE):
+    return iter_pages(lambda after, limit: get_bets_page(state, after, limit), bet_cursor, page_size)
 
 def get_bet_overview(state):
     return get_bets_by_state(state)
 
+def get_bets_grouped():
+    return get_repository().get_bets_grouped()
+
+@_mutation
 def close_bet(bet_id):
-    res = supabase.table("bets").update({"is_open": False, "is_closed": True}).eq("bet_id", bet_id).execute()
-    return res
+    return get_repository().close_bet(bet_id)
+
+@_mutation
+def close_bets_many(bet_ids):
+    return get_repository().close_bets_many(bet_ids)
+
+def get_pending_close_times():
+    return get_repository().get_pending_close_times()
 
+@_mutation
 def resolve_bet(bet_id, correct_answer):
-    res = supabase.table("bets").update({
-        "is_resolved": True,
-        "correct_answer": correct_answer
-    }).eq("bet_id", bet_id).execute()
-    return res
+    return get_repository().resolve_bet(bet_id, correct_answer)
 
 # PREDICTION FUNCTIONS
+@_mutation
 def create_prediction(prediction: Prediction):
-    res = supabase.table("predictions").insert({
-        "user_id": prediction.user_id,
-        "bet_id": prediction.bet_id,
-        "prediction": prediction.prediction,
-        "created_at": prediction.created_at.isoformat() if isinstance(prediction.created_at, datetime) else prediction.created_at,
-    }).execute()
-    return res
+    return get_repository().create_prediction(prediction)
+
+@_mutation
+def create_predictions_many(predictions):
+    return get_repository().create_predictions_many(predictions)
+
+@_mutation
+def place_prediction(prediction: Prediction):
+    return get_repository().place_prediction(prediction)
 
 def get_predictions_for_bet(bet_id):
-    res = supabase.table("predictions").select("*").eq("bet_id", bet_id).execute()
-    data = res.data
-    preds = []
-    for p in data:
-        preds.append(Prediction(
-            prediction_id=p["prediction_id"],
-            user_id=p["user_id"],
-            bet_id=p["bet_id"],
-            prediction=p["prediction"],
-            created_at=p["created_at"]
-        ))
-    return preds
+    return get_repository().get_predictions_for_bet(bet_id)
+
+def get_prediction_batch(bet_id, answer_type, with_usernames=False):
+    return get_repository().get_prediction_batch(bet_id, answer_type, with_usernames=with_usernames)
 
 def get_user_predictions(user_id):
-    res = supabase.table("predictions").select("*").eq("user_id", user_id).execute()
-    return res.data
+    return get_repository().get_user_predictions(user_id)
 
 def has_prediction(user_id, bet_id):
-    res = supabase.table("predictions").select("prediction_id").eq("user_id", user_id).eq("bet_id", bet_id).limit(1).execute()
-    return bool(res.data)
+    return get_repository().has_prediction(user_id, bet_id)
+
+# EMAIL OUTBOX FUNCTIONS
+def enqueue_email(to_addr, subject, body):
+    return get_repository().enqueue_email(to_addr, subject, body)
+
+def claim_emails(limit, lease_seconds):
+    return get_repository().claim_emails(limit, lease_seconds)
+
+def update_email_status(outbox_id, status, last_error=None, next_attempt_at=None):
+    return get_repository().update_email_status(outbox_id, status, last_error=last_error, next_attempt_at=next_attempt_at)
+
+def enqueue_emails_many(messages):
+    return get_repository().enqueue_emails_many(messages)
+
+def get_email(outbox_id):
+    return get_repository().get_email(outbox_id)
+
+# NOTIFICATION EVENT FUNCTIONS
+def record_notification_events(events):
+    return get_repository().record_notification_events(events)
+
+def claim_notification_events(limit):
+    return get_repository().claim_notification_events(limit)
+
+def release_notification_events(event_ids):
+    return get_repository().release_notification_events(event_ids)
+
+# Call/error/row/latency metrics for every data-layer function above (see
+# metrics.py). The iter_* generators are left out; the page reads they make
+# are counted instead.
+metrics.instrument_module(globals(), exclude=(
+    "get_repository", "set_repository", "data_version", "bump_data_version",
+    "client_stats", "user_cache_stats", "iter_users", "iter_leaderboard", "iter_bets",
+))
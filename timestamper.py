@@ -1,7 +1,15 @@
-from datetime import datetime, timezone
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
+from models import EPOCH, MISSING_MICROS, epoch_micros, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
 ET_ZONE = ZoneInfo("America/New_York")
+ET_FORMAT = "%Y-%m-%d %I:%M %p ET"
+MICROS_PER_MINUTE = 60_000_000
 
 def utc_to_eastern(utc_dt: datetime | None) -> datetime | None:
     if utc_dt is None:
@@ -10,17 +18,30 @@ def utc_to_eastern(utc_dt: datetime | None) -> datetime | None:
         utc_dt = utc_dt.replace(tzinfo=timezone.utc)
     return utc_dt.astimezone(ET_ZONE)
 
+# New York changes offset on the hour (07:00/06:00 UTC), so one lookup covers
+# a whole UTC hour
+@lru_cache(maxsize=4096)
+def _et_offset(utc_hour):
+    return (EPOCH + timedelta(hours=utc_hour)).astimezone(ET_ZONE).utcoffset()
+
+# The format has minute resolution, so each UTC minute is formatted once
+@lru_cache(maxsize=16384)
+def _format_minute(utc_minute):
+    utc = EPOCH + timedelta(minutes=utc_minute)
+    return (utc + _et_offset(utc_minute // 60)).strftime(ET_FORMAT)
+
+def format_et_micros(values):
+    # Formats a column of microseconds since the Unix epoch, such as
+    # PredictionBatch.created_at, without building datetimes; missing ones are blank
+    return [_format_minute(us // MICROS_PER_MINUTE) if us != MISSING_MICROS else "" for us in values]
+
 def format_et(dt_val):
     if dt_val is None:
         return ""
-    if isinstance(dt_val, str):
-        try:
-            dt = datetime.fromisoformat(dt_val)
-        except:
-            return str(dt_val)
-    else:
-        dt = dt_val
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    edt = dt.astimezone(ET_ZONE)
-    return edt.strftime("%Y-%m-%d %I:%M %p ET")
+    # Rows are parsed when loaded, so strings only come from callers that skipped that
+    try:
+        dt = parse_timestamp(dt_val)
+    except ValueError:
+        logger.warning("Not an ISO timestamp: %r", dt_val)
+        return str(dt_val)
+    return _format_minute(epoch_micros(dt) // MICROS_PER_MINUTE)